@@ -18,151 +18,255 @@
 
 import util
 import npa_io
+import npa_profile
 import moment_matrix
+import operator_words
 
+import re
 import math
 
+import numpy as np
+
 from sympy.physics.quantum import Dagger, HermitianOperator, IdentityOperator
 from sympy.core.numbers import Infinity, Integer, NegativeOne
 from sympy.matrices import zeros
+from sympy import Symbol, sympify
+
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
 
 class BellViolation(object):
+    """A Bell expression compiled against the moment matrix of a level of the
+    NPA hierarchy.
     
-    def __init__(self):
-        pass
+    Attributes:
+        M: the moment matrix.
+        index: the MomentIndex of the moment matrix, which holds the 
+               positions of every equivalence class (monomial) of entries.
+        bell_exp: the Bell expression.
+        bell_coeffs: the compiled Bell expression, a sparse map from the class
+                     IDs of the index to the coefficients of the expression.
+        meas_ops: the (sympy) measurement operators of Alice and Bob, which
+                  span the correlator basis.
+        correlator_ids: class IDs of the correlator basis, once computed by
+                        generate_correlator_ids.
+    """
+    def __init__(self, M=None, bell_exp=None, orthogonal=False, \
+                 meas_ops=None):
+        
+        self.M = None
+        self.index = None
+        self.bell_exp = None
+        self.bell_coeffs = None
+        self.meas_ops = meas_ops
+        self.correlator_ids = None
+        
+        if M is not None:
+            self.set_moment_matrix(M, orthogonal)
+        if bell_exp is not None:
+            self.parse_bell_exp(bell_exp)
 
 
-    def parse_bell_exp(self):
+    def set_moment_matrix(self, M, orthogonal=False):
+        '''
+        Sets the moment matrix (a MomentMatrix, or the matrix itself) that 
+        Bell expressions are compiled against, and computes its index.
+        '''
+        if isinstance(M, moment_matrix.MomentMatrix):
+            self.M = M.npa_matrix
+            self.index = M.generate_moment_index()
+            self.meas_ops = M.meas_ops
+        else:
+            self.M = M
+            self.index = moment_matrix.MomentIndex(M, orthogonal)
+        
+        if isinstance(self.meas_ops, operator_words.OperatorAlphabet):
+            self.meas_ops = self.meas_ops.sympy_operators()
+        elif isinstance(self.M, operator_words.WordMatrix):
+            self.meas_ops = self.M.alphabet.sympy_operators()
+        self.correlator_ids = None
+        
+        if self.bell_exp is not None:
+            self.parse_bell_exp(self.bell_exp)
+        
+        
+    @npa_profile.profiled("bell_expression")
+    def parse_bell_exp(self, bell_exp):
         '''
-        Function that parses through a bell expression string and converts it to
-        a sympy object. 
+        Function that parses through a Bell expression (a sympy expression in
+        the measurement operators, or a string, see parse_bell_exp_str) and 
+        compiles it to a sparse map from the class IDs of the moment matrix to
+        coefficients. Each term is looked up once by its canonical key, so no
+        scan of the moment matrix is needed.
         '''
-        pass    
-    def bell_operator_matrix(self, bell_exp, M):
+        if isinstance(bell_exp, basestring):
+            if self.meas_ops is None:
+                raise ValueError("The measurement operators are needed to "
+                                 "parse a Bell expression string.")
+            bell_exp = parse_bell_exp_str(bell_exp, self.meas_ops)
+        self.bell_exp = bell_exp
+        self.bell_coeffs = self.index.compile_bell_expression(bell_exp)
+        return self.bell_coeffs
+    
+    
+    def bell_operator_matrix(self, bell_exp=None, M=None):
         '''
         Given a Bell expression (bell_expr) and a moment matrix, (M) 
         this function returns a matrix where the entries corresponding to the Bell
-        expression are weighted in the positions in the moment matrix.
+        expression are weighted in the positions in the moment matrix. If they 
+        are not given, the compiled expression and matrix are used.
+
+        The matrix is a dense n x n numpy array (earlier versions returned a
+        sympy Matrix).
         '''
-        
-        n = int(math.sqrt(len(M)))
-    
-        bell_terms = []
-        bell_coeffs = []
-        bell_args = list(bell_exp.args)
-        for i in range(len(bell_args)):
+        if M is not None and M is not self.M:
+            self.set_moment_matrix(M)
+        if bell_exp is not None and bell_exp is not self.bell_exp:
+            self.parse_bell_exp(bell_exp)
             
-            # Split Bell expression up into factors
-            factors = bell_args[i].as_ordered_factors()
+        return self.index.weight_matrix(self.bell_coeffs)
+    
+    
+    @npa_profile.profiled("bell_objective")
+    def bell_objective_matrix(self, bell_exps):
+        '''
+        Compiles a batch of Bell expressions against the moment matrix in one
+        pass and returns them stacked as a (num_exps x num_classes) 
+        scipy.sparse matrix, whose row k holds the coefficients of the k-th 
+        expression over the equivalence classes of the moment matrix. The 
+        column of index.identity_id holds the constant terms.
         
-            negate = False
-            terms = []
-            coeffs = []
+        The batch is either a list of Bell expressions, or a dense array of 
+        coefficients over the correlator basis (see 
+        generate_correlator_ids) of shape (num_exps, 1 + n_A, 1 + n_B), or 
+        (1 + n_A, 1 + n_B) for a single expression.
+        '''
+        if scipy is None:
+            raise ImportError("scipy is required for sparse matrices.")
+        
+        if isinstance(bell_exps, np.ndarray):
+            num_exps, rows, cols, vals = \
+                self._compile_correlator_coeffs(bell_exps)
+        else:
+            num_exps, rows, cols, vals = self._compile_bell_exps(bell_exps)
         
-            for j in range(len(factors)):
-                # Factors will have a NegativeOne instance if term is negative
-                if isinstance(factors[j], NegativeOne):
-                    negate = True        
-                # Any scalars are represented as Integers
-                elif isinstance(factors[j], Integer):
-                    if negate == True:
-                        coeffs.append(-factors[j])
-                    else:
-                        coeffs.append(factors[j])
-                # The remaining terms are Hermitian Operators (meas. ops.)
-                elif isinstance(factors[j], HermitianOperator):
-                    terms.append(factors[j])    
+        # Duplicate (row, col) pairs are summed.
+        return scipy.sparse.csr_matrix((vals, (rows, cols)), \
+                                       shape=(num_exps, self.index.num_classes))
+    
+    
+    def generate_correlator_ids(self):
+        '''
+        Class IDs of the correlator basis, i.e. the (1 + n_A) x (1 + n_B) 
+        array whose entry (i,j) is the class of the product of the i-th 
+        operator of Alice and the j-th operator of Bob, where operator 0 of 
+        each party is the identity. Row 0 thus holds Bob's marginals, column 0
+        Alice's marginals and entry (0,0) the constant term.
+        '''
+        if self.correlator_ids is None:
+            if self.meas_ops is None:
+                raise ValueError("The measurement operators are needed for "
+                                 "the correlator basis.")
             
-            # If a term doesn't have a scalar, we put a "1" to denote its scalar is
-            # just a factor of 1.
-            if len(coeffs) == 0:
-                coeffs.append(1)
-                if negate == True:
-                    coeffs[0] = -1
-                
-            terms = reduce(lambda x,y : x*y, terms)     
-            bell_terms.append(terms)
-            bell_coeffs.append(coeffs)
+            n_A = len(self.meas_ops) // 2
+            alice_ops = [Integer(1)] + list(self.meas_ops[:n_A])
+            bob_ops = [Integer(1)] + list(self.meas_ops[n_A:])
+            
+            self.correlator_ids = np.asarray([[self.index.term_id(a*b) \
+                for b in bob_ops] for a in alice_ops], dtype=np.int32)
+        return self.correlator_ids
+    
+    
+    def _compile_bell_exps(self, bell_exps):
+        '''
+        Coordinates and values of a list of compiled Bell expressions. Terms 
+        shared by several expressions are only looked up once.
+        '''
+        term_ids = {}
+        rows, cols, vals = [], [], []
+        for k, bell_exp in enumerate(bell_exps):
+            for coeff, term in moment_matrix.split_bell_expression(bell_exp):
+                if term not in term_ids:
+                    term_ids[term] = self.index.term_id(term)
+                class_id = term_ids[term]
+                if class_id is not None and \
+                   class_id not in self.index.zero_ids:
+                    rows.append(k)
+                    cols.append(class_id)
+                    vals.append(coeff)
+        return len(bell_exps), rows, cols, vals
+    
+    
+    def _compile_correlator_coeffs(self, coeffs):
+        '''
+        Coordinates and values of a dense array of coefficients over the 
+        correlator basis.
+        '''
+        ids = self.generate_correlator_ids().ravel()
         
-        # Go through matrix and properly weight entries with the coefficients
-        # derived from the Bell expression.
-        bell_mat = zeros(n,n)
+        coeffs = np.asarray(coeffs, dtype=np.float64)
+        if coeffs.ndim == 2 and coeffs.size == ids.size:
+            coeffs = coeffs.reshape(1, ids.size)
+        if coeffs.ndim < 2 or coeffs[0].size != ids.size:
+            raise ValueError("The coefficients must have shape (num_exps, "
+                             "%d, %d)." % self.correlator_ids.shape)
+        coeffs = coeffs.reshape(len(coeffs), ids.size)
         
-        # find all entries in matrix that correspond to term
-        for i in range(len(bell_terms)):
-            equiv_entries = moment_matrix.find_all_equiv_moment_matrix_entries(bell_terms[i], M)
-            # weight the term appropriately in new bell matrix
-            for j in range(len(equiv_entries)):
-                # XXX NOTE: Not sure why this line is here. Needs to be here to work
-                # but why is it required to block out the diagonal entries??
-                #if not check_equal(equiv_entries[j]):
-                bell_mat[ equiv_entries[j] ] = bell_coeffs[i]
+        rows = np.repeat(np.arange(len(coeffs)), ids.size)
+        cols = np.tile(ids, len(coeffs))
+        return len(coeffs), rows, cols, coeffs.ravel()
+    
+
+def parse_bell_exp_str(bell_str, meas_ops):
+    '''
+    Converts a Bell expression string, such as "A^0_0*B^0_0 - 2*A^1_0", to a
+    sympy expression in the measurement operators (meas_ops), which are 
+    written by their labels.
+    '''
+    ops = {}
+    for op in meas_ops:
+        label = op
+        while isinstance(label, HermitianOperator):
+            label = label.args[0]
+        ops[label.name] = op
     
-        return bell_mat
+    # Labels hold "^", which sympy would read as a power, so they are 
+    # replaced by plain names first.
+    names = {}
+    def replace_label(match):
+        label = match.group(0)
+        if label not in ops:
+            raise ValueError("%s is not a measurement operator." % label)
+        if label not in names:
+            names[label] = "op_%d" % len(names)
+        return names[label]
+    exp_str = re.sub(r"[AB]\^[0-9]+_[0-9]+", replace_label, bell_str)
     
+    return sympify(exp_str, locals=dict((name, ops[label]) \
+                                        for label, name in names.items()))
+
 
 def bell_operator_matrix(bell_exp, M):
     '''
     Given a Bell expression (bell_expr) and a moment matrix, (M) 
     this function returns a matrix where the entries corresponding to the Bell
-    expression are weighted in the positions in the moment matrix.
+    expression are weighted in the positions in the moment matrix. The 
+    matrix is a dense n x n numpy array (earlier versions returned a sympy 
+    Matrix).
     '''
-    
-    n = int(math.sqrt(len(M)))
+    return BellViolation(M, bell_exp).bell_operator_matrix()
 
-    bell_terms = []
-    bell_coeffs = []
-    bell_args = list(bell_exp.args)
-    for i in range(len(bell_args)):
-        
-        # Split Bell expression up into factors
-        factors = bell_args[i].as_ordered_factors()
-    
-        negate = False
-        terms = []
-        coeffs = []
-    
-        for j in range(len(factors)):
-            # Factors will have a NegativeOne instance if term is negative
-            if isinstance(factors[j], NegativeOne):
-                negate = True        
-            # Any scalars are represented as Integers
-            elif isinstance(factors[j], Integer):
-                if negate == True:
-                    coeffs.append(-factors[j])
-                else:
-                    coeffs.append(factors[j])
-            # The remaining terms are Hermitian Operators (meas. ops.)
-            elif isinstance(factors[j], HermitianOperator):
-                terms.append(factors[j])    
-        
-        # If a term doesn't have a scalar, we put a "1" to denote its scalar is
-        # just a factor of 1.
-        if len(coeffs) == 0:
-            coeffs.append(1)
-            if negate == True:
-                coeffs[0] = -1
-            
-        terms = reduce(lambda x,y : x*y, terms)     
-        bell_terms.append(terms)
-        bell_coeffs.append(coeffs)
-    
-    # Go through matrix and properly weight entries with the coefficients
-    # derived from the Bell expression.
-    bell_mat = zeros(n,n)
-    
-    # find all entries in matrix that correspond to term
-    for i in range(len(bell_terms)):
-        equiv_entries = moment_matrix.find_all_equiv_moment_matrix_entries(bell_terms[i], M)
-        # weight the term appropriately in new bell matrix
-        for j in range(len(equiv_entries)):
-            # XXX NOTE: Not sure why this line is here. Needs to be here to work
-            # but why is it required to block out the diagonal entries??
-            #if not check_equal(equiv_entries[j]):
-            bell_mat[ equiv_entries[j] ] = bell_coeffs[i]
-
-    return bell_mat
 
+def bell_objective_matrix(bell_exps, M, meas_ops=None):
+    '''
+    Given a batch of Bell expressions (bell_exps) and a moment matrix (M), 
+    this function returns the expressions stacked as a sparse matrix over the
+    equivalence classes of the moment matrix. See 
+    BellViolation.bell_objective_matrix.
+    '''
+    return BellViolation(M, meas_ops=meas_ops).bell_objective_matrix(bell_exps)
 
 
 
@@ -3,71 +3,333 @@
 #------------------------------------------------------------------------------
 # Name:        benchmarking.py
 # Purpose:     File for benchmarking the time of various functions in the
-#              npa_nonlocal project. 
+#              npa_nonlocal project. Every scenario (of Table-1 and Table-2 in
+#              [1]) is timed phase by phase in a fresh process, the results
+#              are written as JSON and compared against a stored baseline:
+#
+#                   python benchmarking.py --output bench.json
+#                   python benchmarking.py --baseline bench.json
+#
+#              The per-entry costs of an engine (moment_matrix.BUILD_COSTS)
+#              are fitted to the results of that engine, e.g.
+#
+#                   python benchmarking.py --engine compact --costs
 #
 # Author:      Vincent Russo (vrusso@cs.uwaterloo.ca)
 #
+# References: [1] Navascues, M. and Pironio, S. and A. Acin. A convergent
+#                 hierarchy of semidefinite programs characterizing the set of
+#                 quantum correlations. New Journal of Physics, 2008, 073013.
+#
 # Created:     1/19/2015
 # Copyright:   (c) Vincent Russo 2015
 # Licence:     GNU
 #------------------------------------------------------------------------------
 '''
 
-import util
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import multiprocessing
+
+import numpy as np
+
+import npa_io
 import moment_matrix
+import bell_violation
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Phases of a benchmark, in the order in which they are timed.
+PHASES = ["operators", "sequence", "matrix", "equivalence", "bell", "export"]
+
+# Engines that can be benchmarked: the engines of MomentMatrix, and the word
+# engine building compact moment matrices ("compact") or the tensor powers 
+# of parallel repetitions ("tensor", see generate_tensor_scenarios).
+ENGINES = ["word", "sympy", "compact", "tensor"]
+
+# Smallest dimension of the scenarios the costs of an engine are fitted to,
+# as the fixed costs of a process dominate smaller moment matrices.
+COST_MIN_DIM = 100
+
+
+def generate_scenarios():
+    '''
+    The benchmark scenarios: the I_22dd scenarios of Table-1 in [1] (2 inputs,
+    d = 2, ..., 8 outputs) at levels 1 and 1+AB, the 3 input / 2 output
+    scenario of Table-2 at levels 1, 1+AB and 1+A+AB, and level 2 of the
+    smaller scenarios. The operator of the last output is left out, as in
+    the tables.
+    '''
+    scenarios = []
+    for level in ["1", "1+AB"]:
+        for num_outputs in range(2, 9):
+            scenarios.append( (2, num_outputs, level) )
+    for level in ["1", "1+AB", "1+A+AB", "2"]:
+        scenarios.append( (3, 2, level) )
+    for num_outputs in range(2, 5):
+        scenarios.append( (2, num_outputs, "2") )
+    return [{"name": "input_%d_output_%d_level_%s" % \
+                     (num_inputs, num_outputs, level.replace("+", "_")),
+             "inputs": num_inputs,
+             "outputs": num_outputs,
+             "level": level} for num_inputs, num_outputs, level in scenarios]
+
+
+def generate_tensor_scenarios():
+    '''
+    The benchmark scenarios of the "tensor" engine: 2 and 3 parallel 
+    repetitions of the smaller scenarios, whose moment matrices are the 
+    tensor powers of the moment matrices of a single round.
+    '''
+    scenarios = [(2, 2, "1", 2), (2, 2, "1+AB", 2), (2, 2, "2", 2), \
+                 (2, 3, "1+AB", 2), (3, 2, "1+AB", 2), (2, 2, "1", 3), \
+                 (2, 2, "1+AB", 3)]
+    return [{"name": "input_%d_output_%d_level_%s_reps_%d" % \
+                     (num_inputs, num_outputs, level.replace("+", "_"), reps),
+             "inputs": num_inputs,
+             "outputs": num_outputs,
+             "level": level,
+             "reps": reps} for num_inputs, num_outputs, level, reps \
+                           in scenarios]
+
+
+def generate_bell_expression(meas_ops):
+    '''
+    A Bell expression over every correlator of a scenario, i.e. the sum of
+    all products of one of Alice's and one of Bob's operators, minus the
+    marginals, so that the Bell mapping touches every correlator entry.
+    '''
+    n_A = len(meas_ops) // 2
+    alice_ops, bob_ops = meas_ops[:n_A], meas_ops[n_A:]
+    return sum([a*b for a in alice_ops for b in bob_ops]) - \
+           sum(alice_ops) - sum(bob_ops)
+
+
+def run_scenario(scenario, engine="word"):
+    '''
+    Times the phases of one scenario: measurement operators, sequence,
+    moment matrix, equivalence classes, Bell mapping and export (to SDPA
+    and MATLAB, written to os.devnull). Returns a dictionary holding the
+    time of every phase, the matrix size and the peak memory of the process
+    (and the peak of the Python allocations, where tracemalloc exists). The
+    engine is one of ENGINES.
+    '''
+    if tracemalloc is not None:
+        tracemalloc.start()
+    phases = {}
+    start_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_time = time.time()
+    meas_ops = moment_matrix.generate_measurement_operators( \
+        scenario["inputs"], scenario["outputs"], True, \
+        scenario.get("reps", 1), "sympy" if engine == "sympy" else "word", \
+        engine == "tensor")
+    phases["operators"] = time.time() - start_time
 
-from timeit import timeit, Timer
+    start_time = time.time()
+    seq = moment_matrix.generate_sequence(meas_ops, scenario["level"])
+    phases["sequence"] = time.time() - start_time
 
-num_inputs = 2
-num_outputs = 2
-npa_level = 1
-parallel_reps = 1
-M = moment_matrix.MomentMatrix(num_inputs, num_outputs, npa_level, parallel_reps)
+    start_time = time.time()
+    mat = moment_matrix.generate_moment_matrix(seq, \
+                                               compact=(engine == "compact"))
+    phases["matrix"] = time.time() - start_time
 
+    start_time = time.time()
+    index = moment_matrix.MomentIndex(mat)
+    phases["equivalence"] = time.time() - start_time
 
-''' Time trials for: moment_matrix.'''
-# 0.0375638008118
-meas_ops_input_2_output_2_level_1_reps_1 = Timer(\
-    "M = moment_matrix.MomentMatrix(2,2,1,1)",\
-    setup="import moment_matrix")
+    if engine != "sympy":
+        meas_ops = meas_ops.sympy_operators()
+    bell_exp = generate_bell_expression(meas_ops)
+    start_time = time.time()
+    bell = bell_violation.BellViolation(mat)
+    bell.index = index
+    bell.parse_bell_exp(bell_exp)
+    phases["bell"] = time.time() - start_time
 
-# 0.334450960159
-meas_ops_input_2_output_2_level_1_reps_2 = Timer(\
-    "M = moment_matrix.MomentMatrix(2,2,1,2)",\
-    setup="import moment_matrix")
+    start_time = time.time()
+    affine_mat = moment_matrix.generate_affine_moment_matrix(mat, bell_exp, \
+                                                             index=index)
+    with open(os.devnull, "w") as out_file:
+        npa_io.write_sdpa(out_file, affine_mat)
+        npa_io.write_matlab_script(out_file, mat)
+    phases["export"] = time.time() - start_time
+
+    result = dict(scenario)
+    result["engine"] = engine
+    result["dim"] = len(seq)
+    result["num_classes"] = index.num_classes
+    result["phases"] = phases
+    result["total"] = sum(phases.values())
+    result["peak_rss_kb"] = resource.getrusage( \
+                                resource.RUSAGE_SELF).ru_maxrss
+    result["start_rss_kb"] = start_rss_kb
+    if tracemalloc is not None:
+        result["peak_alloc_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return result
+
+
+def _run_scenario_args(args):
+    '''Unpacks the arguments of run_scenario for Pool.map.'''
+    return run_scenario(*args)
+
+
+def run_benchmarks(scenarios, engine="word", repeat=1):
+    '''
+    Runs every scenario (repeat) times, each run in a fresh process so that
+    its peak memory is its own. The fastest time of every phase over the
+    runs is kept.
+    '''
+    results = []
+    for scenario in scenarios:
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            runs = pool.map(_run_scenario_args, [(scenario, engine)] * repeat, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        result = runs[0]
+        for phase in PHASES:
+            result["phases"][phase] = min([run["phases"][phase] \
+                                           for run in runs])
+        result["total"] = sum(result["phases"].values())
+        result["peak_rss_kb"] = max([run["peak_rss_kb"] for run in runs])
+        results.append(result)
+    return results
+
+
+def fit_build_costs(results, min_dim=COST_MIN_DIM):
+    '''
+    Fits the costs of moment_matrix.BUILD_COSTS to the results of an engine:
+    the medians over the scenarios of dimension at least min_dim of the 
+    seconds per entry of the upper triangle to build the moment matrix 
+    ("build"), the seconds per entry to index its equivalence classes 
+    ("index") and the peak bytes per entry above the memory of the process
+    before the scenario ("memory"). Returns None if no scenario is that 
+    large.
+    '''
+    results = [result for result in results if result["dim"] >= min_dim]
+    if len(results) == 0:
+        return None
     
-# 65.810256958    
-meas_ops_input_2_output_2_level_1_A_reps_2 = Timer(\
-    "M = moment_matrix.MomentMatrix(2,2,'1+A',2)",\
-    setup="import moment_matrix")
-
-# 98.2671711445
-meas_ops_input_2_output_2_level_1_AB_reps_2 = Timer(\
-    "M = moment_matrix.MomentMatrix(2,2,'1+AB',2)",\
-    setup="import moment_matrix")
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
     
-# 83.6279420853    
-meas_ops_input_2_output_2_level_1_A_reps_2_noclass = Timer(\
-    "M = moment_matrix.generate_moment_matrix(seq)",\
-    setup="import moment_matrix;\
-    ops = moment_matrix.generate_measurement_operators(2,2,False,2);\
-    seq = moment_matrix.generate_sequence(ops, '1+A')")
-
-# 92.7540969849
-meas_ops_input_2_output_2_level_1_AB_reps_2_noclass = Timer(\
-    "M = moment_matrix.generate_moment_matrix(seq)",\
-    setup="import moment_matrix;\
-    ops = moment_matrix.generate_measurement_operators(2,2,False,2);\
-    seq = moment_matrix.generate_sequence(ops, '1+AB')")    
-
-'''Display time trial results'''
-#print meas_ops_input_2_output_2_level_1_reps_1.timeit(1)
-
-#print meas_ops_input_2_output_2_level_1_reps_2.timeit(1)
-
-print meas_ops_input_2_output_2_level_1_A_reps_2.timeit(1)
-#print meas_ops_input_2_output_2_level_1_AB_reps_2.timeit(1)
-
-###
-print meas_ops_input_2_output_2_level_1_A_reps_2_noclass.timeit(1)
-#print meas_ops_input_2_output_2_level_1_AB_reps_2_noclass.timeit(1)
\ No newline at end of file
+    num_upper = [r["dim"] * (r["dim"] + 1) // 2 for r in results]
+    num_entries = [r["dim"]**2 for r in results]
+    return {"build": median([r["phases"]["matrix"] / n \
+                             for r, n in zip(results, num_upper)]),
+            "index": median([r["phases"]["equivalence"] / n \
+                             for r, n in zip(results, num_entries)]),
+            "memory": median([1024.0 * (r["peak_rss_kb"] - \
+                              r.get("start_rss_kb", 0)) / n \
+                              for r, n in zip(results, num_entries)])}
+
+
+def compare_results(results, baseline, tolerance=0.25, min_seconds=0.05):
+    '''
+    Compares benchmark results against baseline results of the same
+    scenarios. A phase (or total) is a regression if it is slower than the
+    baseline by more than the relative tolerance and by more than min_seconds
+    (to ignore the noise of fast phases). Returns the list of regressions as
+    (scenario name, phase, baseline time, time) tuples.
+    '''
+    baseline_results = dict((result["name"], result) \
+                            for result in baseline["results"])
+    regressions = []
+    for result in results:
+        if result["name"] not in baseline_results:
+            continue
+        base = baseline_results[result["name"]]
+        times = [(phase, base["phases"].get(phase), result["phases"][phase]) \
+                 for phase in PHASES]
+        times.append( ("total", base["total"], result["total"]) )
+        for phase, base_time, new_time in times:
+            if base_time is None:
+                continue
+            if new_time > base_time * (1 + tolerance) and \
+               new_time - base_time > min_seconds:
+                regressions.append( (result["name"], phase, base_time, \
+                                     new_time) )
+    return regressions
+
+
+def main(argv=None):
+    '''
+    Console entry point: runs the benchmarks, writes the results as JSON and
+    compares them against a baseline. Returns the number of regressions.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmarks the moment "
+                                     "matrix scenarios of Table-1 and Table-2.")
+    parser.add_argument("--output", default="benchmark_results.json", \
+                        help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=None, \
+                        help="JSON results the results are compared against")
+    parser.add_argument("--engine", default="word", choices=ENGINES, \
+                        help='"word", "sympy" (slow at large sizes), '
+                             '"compact" or "tensor" (parallel repetitions)')
+    parser.add_argument("--repeat", type=int, default=1, \
+                        help="number of runs per scenario")
+    parser.add_argument("--tolerance", type=float, default=0.25, \
+                        help="relative slowdown counted as a regression")
+    parser.add_argument("--filter", default=None, \
+                        help="only run scenarios whose name contains this")
+    parser.add_argument("--costs", action="store_true", \
+                        help="print the BUILD_COSTS fitted to the results")
+    args = parser.parse_args(argv)
+
+    scenarios = generate_scenarios()
+    if args.engine == "tensor":
+        scenarios = generate_tensor_scenarios()
+    if args.filter is not None:
+        scenarios = [sc for sc in scenarios if args.filter in sc["name"]]
+
+    results = run_benchmarks(scenarios, args.engine, args.repeat)
+    for result in results:
+        print ("%-32s dim %4d  total %8.3f s  peak %7d kB  (%s)" % \
+            (result["name"], result["dim"], result["total"], \
+             result["peak_rss_kb"], ", ".join(["%s %.3f" % \
+             (phase, result["phases"][phase]) for phase in PHASES])))
+    
+    if args.costs == True:
+        costs = fit_build_costs(results)
+        if costs is None:
+            print ("No scenario of dimension %d or more to fit the costs "
+                   "to." % COST_MIN_DIM)
+        else:
+            print ('BUILD_COSTS["%s"] = {"build": %.2g, "index": %.2g, '
+                   '"memory": %d}' % (args.engine, costs["build"], \
+                   costs["index"], costs["memory"]))
+
+    with open(args.output, "w") as out_file:
+        json.dump({"meta": {"python": platform.python_version(),
+                            "platform": platform.platform(),
+                            "numpy": np.__version__,
+                            "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+                   "results": results}, out_file, indent=2, sort_keys=True)
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as base_file:
+            regressions = compare_results(results, json.load(base_file), \
+                                          args.tolerance)
+        for name, phase, base_time, new_time in regressions:
+            print ("REGRESSION %s %s: %.3f s -> %.3f s" % (name, phase, \
+                   base_time, new_time))
+    return len(regressions)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -18,6 +18,9 @@
 '''
 
 import math 
+import warnings
+
+import numpy as np
 
 from sympy import *
 from sympy.physics.quantum import Dagger, HermitianOperator, IdentityOperator
@@ -25,6 +28,41 @@ from sympy.core.numbers import Infinity, Integer, NegativeOne
 from sympy.matrices import zeros
 
 import util
+import npa_cache
+import npa_profile
+import operator_words
+
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
+# Cost of building moment matrices by engine: seconds per entry of the upper
+# triangle (build), seconds per entry of the matrix (equivalence classes) and
+# peak bytes per entry of the matrix. The "word", "compact" (compact word 
+# engine) and "tensor" (word engine with tensor_reps) rows were fitted with 
+# "benchmarking.py --engine <engine> --costs", on the Table-1 and Table-2
+# scenarios and on benchmarking.generate_tensor_scenarios respectively. The
+# "sympy" row was not fitted that way, as the Table-2 scenarios take hours 
+# with that engine.
+BUILD_COSTS = {"sympy": {"build": 9e-4, "index": 2.2e-5, "memory": 600},
+               "word": {"build": 1.9e-6, "index": 8.7e-6, "memory": 570},
+               "compact": {"build": 7.1e-6, "index": 8.6e-7, "memory": 490},
+               "tensor": {"build": 8.1e-7, "index": 2.8e-7, "memory": 180}}
+
+# Estimated resources above which building a moment matrix warns (or is 
+# refused, see MomentMatrix): the dimension, memory in bytes and time in 
+# seconds. A limit of None is not checked.
+RESOURCE_LIMITS = {"dim": None,
+                   "memory": 8 * 2**30,
+                   "time": 3600.0}
+
+# Simplified entries of the moment matrices of the process, keyed by the 
+# words of the entries (see simplify_moment_matrix_entry). Its hits and 
+# misses are given by simplify_cache.stats(), and simplify_cache.resize(0) 
+# disables it.
+SIMPLIFY_CACHE_SIZE = 200000
+simplify_cache = util.LRUCache(SIMPLIFY_CACHE_SIZE)
 
 class MomentMatrix(object):
     """A moment matrix 
@@ -35,12 +73,56 @@ class MomentMatrix(object):
         num_outputs: number of outputs for Alice and Bob.
         npa_level: the level of the npa hierarchy
         parallel_reps: number of parallel repetitions
+        engine: "sympy" to build the matrix from sympy operators, or "word" to
+                build it with the integer-word engine of operator_words.py.
         
-        short_meas:            
+        short_meas: leave out the operator of the last output of every 
+                    measurement (see generate_measurement_operators).
+        orthogonal_meas: use that the projectors of a measurement are 
+                         orthogonal, which drops the zero words from the 
+                         sequence and sets the matching entries to 0.
+        workers: number of processes used to build the moment matrix.
+        cache: a npa_cache.MomentMatrixCache (or True for the default cache)
+               the moment matrix is loaded from, or stored in after it is 
+               built. Only the "word" engine can be cached.
+        compact_matrix: store the moment matrix of the "word" engine as an 
+                        int32 array of moment IDs and a table of canonical
+                        words (see operator_words.MomentIdMatrix) instead of
+                        the lists of words of every entry.
+        mmap_path: directory the compact moment matrix is memory-mapped 
+                   from (read-only) if it was saved there, or built into and
+                   saved in otherwise. See npa_cache.save_moment_ids.
+        profiler: a npa_profile.Profiler that is active while the moment 
+                  matrix is built, extended and indexed, or None.
+        limits: the resource limits (see RESOURCE_LIMITS) checked against
+                estimate_resources before the moment matrix is built. None 
+                uses RESOURCE_LIMITS and an empty dictionary checks nothing.
+        refuse_limits: raise a ValueError instead of warning when a limit is
+                       exceeded.
+        lazy: build nothing in the constructor. The sequence (seq, dim), 
+              the moment matrix (npa_matrix) and its equivalence classes 
+              (moment_index, equiv_dict) are then built on first access and
+              kept; single entries and rows are available from entry and row
+              without building the matrix.
+        tensor_reps: keep the product structure of the parallel repetitions
+                     (see operator_words.TensorAlphabet). Every operator of 
+                     the repeated scenario is then a product of operators of
+                     the single rounds, the sequence is the tensor power of 
+                     the sequence of a single round and the moment matrix is
+                     computed from the moment matrix of a single round. This
+                     relaxes the strategies that measure every round 
+                     separately, which are a subset of the strategies of the
+                     repeated scenario, so the bounds hold for those only. 
+                     Needs the "word" engine, and such matrices are not 
+                     cached.
     """
     def __init__(self, num_inputs, num_outputs, npa_level, parallel_reps=1, \
                  bool_short_meas=False, bool_npa_matrix_simple=True, \
-                 bool_minimal_equiv_dict=False):
+                 bool_minimal_equiv_dict=False, engine="sympy", \
+                 bool_orthogonal_meas=False, workers=1, cache=None, \
+                 bool_compact_matrix=False, mmap_path=None, profiler=None, \
+                 bool_lazy=False, limits=None, bool_refuse_limits=False, \
+                 bool_tensor_reps=False):
 
         
         self.num_inputs = num_inputs
@@ -51,145 +133,304 @@ class MomentMatrix(object):
         self.bool_short_meas = bool_short_meas
         self.bool_npa_matrix_simple = bool_npa_matrix_simple
         self.bool_minimal_equiv_dict = bool_minimal_equiv_dict        
+        self.bool_orthogonal_meas = bool_orthogonal_meas
+        self.bool_compact_matrix = bool_compact_matrix
+        self.bool_tensor_reps = bool_tensor_reps
+        self.engine = engine
+        self.workers = workers
+
+        if bool_tensor_reps == True and engine != "word":
+            raise ValueError("Only the word engine keeps the product structure"
+                             " of parallel repetitions.")
+        if bool_tensor_reps == True and bool_npa_matrix_simple != True:
+            raise ValueError("Moment matrices of parallel repetitions with a "
+                             "product structure are always simplified.")
+
+        if bool_compact_matrix == True and engine != "word":
+            raise ValueError("Only moment matrices of the word engine can be "
+                             "compact.")
+        if mmap_path is not None and bool_compact_matrix != True:
+            raise ValueError("Only compact moment matrices can be "
+                             "memory-mapped.")
+        self.mmap_path = mmap_path
+
+        if cache == True:
+            cache = npa_cache.MomentMatrixCache()
+        if cache is not None and engine != "word":
+            raise ValueError("Only moment matrices of the word engine can be "
+                             "cached.")
+        if (cache is not None or mmap_path is not None) and \
+           bool_tensor_reps == True:
+            raise ValueError("Moment matrices of parallel repetitions with a "
+                             "product structure cannot be cached.")
+        self.cache = cache
+        self.profiler = profiler
+        self.bool_lazy = bool_lazy
+        self.limits = RESOURCE_LIMITS if limits is None else limits
+        self.bool_refuse_limits = bool_refuse_limits
+
+        self._seq = None
+        self._npa_matrix = None
+        self._moment_index = None
+        self._equiv_dict = None
+
+        with npa_profile.activate(self.profiler):
+            self.meas_ops = self.generate_measurement_operators()
+
+        if bool_lazy != True:
+            self.build()
+
+
+    @property
+    def seq(self):
+        '''The sequence of the level, generated on first access.'''
+        if self._seq is None:
+            with npa_profile.activate(self.profiler):
+                self.generate_sequence()
+        return self._seq
+
+
+    @seq.setter
+    def seq(self, seq):
+        self._seq = seq
+
+
+    @property
+    def dim(self):
+        '''Dimension of the moment matrix, i.e. the length of the sequence.'''
+        return len(self.seq)
+
+
+    @property
+    def npa_matrix(self):
+        '''The moment matrix, built (or loaded) on first access.'''
+        if self._npa_matrix is None:
+            self.build()
+        return self._npa_matrix
+
+
+    @npa_matrix.setter
+    def npa_matrix(self, mat):
+        self._npa_matrix = mat
+        self._moment_index = None
+        self._equiv_dict = None
+
 
-        self.meas_ops = self.generate_measurement_operators()
-        self.seq = self.generate_sequence()
+    @property
+    def moment_index(self):
+        '''The MomentIndex of the moment matrix, computed on first access.'''
+        return self.generate_moment_index()
 
-        self.dim = len(self.seq)        
+
+    @property
+    def equiv_dict(self):
+        '''
+        The equivalence dictionary of the moment matrix (see 
+        generate_moment_matrix_equivalence_dict), computed on first access.
+        '''
+        return self.generate_moment_matrix_equivalence_dict()
+
+
+    def is_built(self):
+        '''Checks whether the moment matrix was built (or loaded).'''
+        return self._npa_matrix is not None
+
+
+    def build(self):
+        '''
+        Loads the moment matrix from mmap_path or the cache, or builds it 
+        (and stores it there). Does nothing if it was already built.
+        '''
+        if self._npa_matrix is not None:
+            return self
         
-        self.npa_matrix = self.generate_moment_matrix()
+        with npa_profile.activate(self.profiler):
+            if not self.load_moment_ids() and not self.load_from_cache():
+                self.check_resources()
+                self.generate_moment_matrix()
+
+                if self.cache is not None:
+                    self.cache.store(self.cache_key(), self.seq, \
+                                     self.npa_matrix)
                 
-        
-    def generate_measurement_operators(self):
+            if self.mmap_path is not None:
+                self.save_moment_ids()
+        return self
+
+
+    def estimate_resources(self):
         '''
-        Measurement operators for Alice and Bob.
-    
-            short_meas: One can reduce the number of entries in the measurement
-            operators by noting that they sum to the identity. For larger
-            computations, this form is ideal, however for other cases, one may
-            wish to generate the most general list of measurements.
-    
-            parallel_reps: Number of repetitions carried out by party.         
-        '''    
-        self.meas_ops = []    
-            
-        # Assuming that measurement labels are {0,1}-valued.
-        basis_in = util.list_2_str(range(self.num_inputs)).replace(" ", "")
-        basis_out = util.list_2_str(range(self.num_outputs)).replace(" ", "")
-        
-        meas_labels_in = \
-            util.generate_bit_strings(self.parallel_reps, basis_in)    
-        meas_labels_out = \
-            util.generate_bit_strings(self.parallel_reps, basis_out)
-        
-        num_meas_in = len(meas_labels_in)
-        num_meas_out = len(meas_labels_out)    
-        
-        # Longer form of measurements are generated.
-        if self.bool_short_meas == False:
-            for i in range(num_meas_in):
-                for j in range(num_meas_out):
-                    alice_label = "A^" + meas_labels_in[i] + "_" + \
-                                         meas_labels_out[j]
-                    bob_label = "B^" + meas_labels_in[i] + "_" + \
-                                       meas_labels_out[j]
-    
-                    alice_meas_op = HermitianOperator(alice_label)
-                    alice_meas_op.is_commutative = False
-    
-                    bob_meas_op = HermitianOperator(bob_label)
-                    bob_meas_op.is_commutative = False                
-                    
-                    self.meas_ops.append(HermitianOperator(alice_meas_op))
-                    self.meas_ops.append(HermitianOperator(bob_meas_op))
-    
-        # Shorter form of measurements are generated FIX TODO
-        if self.bool_short_meas == True:
-            for i in range(self.num_inputs-1 + self.num_outputs-1):
-    
-                alice_label = "A^" + str(i) + "_" + "0"
-                bob_label = "B^" + str(i) + "_" + "0"
-    
-                alice_meas_op = HermitianOperator(alice_label)
-                alice_meas_op.is_commutative = False
-                    
-                bob_meas_op = HermitianOperator(bob_label)
-                bob_meas_op.is_commutative = False            
-                                
-                self.meas_ops.append(HermitianOperator(alice_meas_op))
-                self.meas_ops.append(HermitianOperator(bob_meas_op))
-          
-        return sorted(self.meas_ops, key=default_sort_key)
+        Estimated size, number of moments, time and memory of the moment 
+        matrix, computed without building it. See the module function
+        estimate_resources.
+        '''
+        return estimate_resources(self.num_inputs, self.num_outputs, \
+            self.npa_level, self.parallel_reps, self.bool_short_meas, \
+            self.bool_orthogonal_meas, self.engine, self.bool_compact_matrix,\
+            self.bool_npa_matrix_simple, self.bool_tensor_reps)
+
+
+    def check_resources(self):
+        '''
+        Checks the estimated resources of the moment matrix against the 
+        limits. A limit that is exceeded raises a ValueError if 
+        refuse_limits is True, and warns otherwise.
+        '''
+        if not self.limits:
+            return
         
+        estimate = self.estimate_resources()
+        exceeded = []
+        for name, unit in [("dim", ""), ("memory", " bytes"), \
+                           ("time", " s")]:
+            limit = self.limits.get(name)
+            if limit is not None and estimate[name] > limit:
+                exceeded.append("%s %.4g%s (limit %.4g%s)" % (name, \
+                                estimate[name], unit, limit, unit))
+        if len(exceeded) == 0:
+            return
         
-    def generate_sequence(self):
+        msg = "The moment matrix of level %s exceeds the resource limits: " \
+              "estimated %s." % (self.npa_level, ", ".join(exceeded))
+        if self.bool_refuse_limits == True:
+            raise ValueError(msg)
+        warnings.warn(msg, RuntimeWarning)
+
+
+    def entry(self, i, j):
         '''
-        A sequence is generated from the list of meas_ops from function 
-        generate_measurement_operators. The level can be either an integer, or 
-        an intermediate level. Appropriate intermediate levels are "l+X" where 
-        "l" is the level of the sequence, and "X" is the intermediate steps. 
-        For instance:
-            "l+A", "l+B", "l+AB", "l+A+B", "l+AB+A", etc.
-        are all appropriate intermediate levels. 
-        '''    
-        self.seq = self.meas_ops[:]
-        inter_med_seq = False
-        
-        # If the level is not an integer, but instead an intermediate level 
-        # value, the format is expected to be "l+AB", "l+A", or "l+B" where "l" 
-        # is an integer value corresponding to the level, and "AB", "A", or "B"
-        # are the intermediate levels between l and l+1.
-        if isinstance(self.npa_level, str):
-            l_str = self.npa_level.split('+')
-            self.npa_level = int(l_str[0]) 
-            inter_med = l_str[1:]
-    
-            inter_med = map(lambda x: x.strip(), inter_med)
-            inter_med_seq = True    
+        Entry (i,j) of the moment matrix. If the matrix was not built, only 
+        the entry is computed, see the module function 
+        generate_moment_matrix_entry.
+        '''
+        if self._npa_matrix is not None:
+            return self._npa_matrix[i,j]
+        return generate_moment_matrix_entry(self.seq, i, j, \
+            self.bool_npa_matrix_simple, self.bool_orthogonal_meas)
+
+
+    def row(self, i):
+        '''
+        Row i of the moment matrix as a list of entries. If the matrix was 
+        not built, only the row is computed.
+        '''
+        if self._npa_matrix is not None:
+            return [self._npa_matrix[i,j] for j in range(self.dim)]
+        return generate_moment_matrix_row(self.seq, i, \
+            self.bool_npa_matrix_simple, self.bool_orthogonal_meas)
+
+
+    def extend(self, npa_level):
+        '''
+        Extends the moment matrix to another level of the hierarchy, e.g. 
+        from level 1 to "1+AB", copying the entries of the words already in 
+        the sequence and only computing the entries of the new words. See the
+        module function extend_moment_matrix.
+        '''
+        # A lazy moment matrix that was not built yet is built at the new
+        # level instead. The directory mmap_path holds the matrix of the 
+        # level it was built at, so such a matrix is built first.
+        if self._npa_matrix is None and self.mmap_path is None:
+            self.npa_level = npa_level
+            self._seq = None
+            return self
+        
+        old_seq = self.seq
+        old_mat = self.npa_matrix
+        self.npa_level = npa_level
+        
+        with npa_profile.activate(self.profiler):
+            # The directory mmap_path holds the matrix being extended, which
+            # is replaced by the extension.
+            if not self.load_from_cache():
+                self.check_resources()
+                self.generate_sequence()
+                self.npa_matrix = extend_moment_matrix(old_mat, \
+                    old_seq, self.seq, self.bool_npa_matrix_simple, \
+                    self.bool_orthogonal_meas, self.workers)
+        
+                if self.cache is not None:
+                    self.cache.store(self.cache_key(), self.seq, \
+                                     self.npa_matrix)
                 
-        for i in range(1,self.npa_level):        
-            n = len(self.seq)
+            if self.mmap_path is not None:
+                self.save_moment_ids()
+        return self
                 
-            # Process all A_a^x
-            for j in range(n/2):
-                for k in range(n/2):        
-                    if j != k:
-                        self.seq.append( self.seq[j] * self.seq[k] )
-                        
-            # Process all B_b^y
-            for j in range(n/2, n):
-                for k in range(n/2, n):
-                    if j != k:
-                        self.seq.append( self.seq[j] * self.seq[k] )
+                
+    def cache_key(self):
+        '''
+        Key of the moment matrix in the on-disk cache.
+        '''
+        return npa_cache.cache_key(self.num_inputs, self.num_outputs, \
+            self.npa_level, self.parallel_reps, self.bool_short_meas, \
+            self.bool_npa_matrix_simple, self.bool_orthogonal_meas)
             
-            # Process all A_a^x B_b^y
-            for j in range(n/2):
-                for k in range(n/2):
-                    self.seq.append( self.seq[j] * self.seq[k+(n/2)] )
-    
-        # If the sequence is intermediate, process the last bit 
-        if inter_med_seq == True:
-            n = len(self.seq)
             
-            if "A" in inter_med:
-                for j in range(n/2):
-                    for k in range(n/2):        
-                        if j != k:
-                            self.seq.append( self.seq[j] * self.seq[k] )
-            if "B" in inter_med:
-                for j in range(n/2, n):
-                    for k in range(n/2, n):
-                        if j != k:
-                            self.seq.append( self.seq[j] * self.seq[k] )
-            if "AB" in inter_med:
-                for j in range(n/2):
-                    for k in range(n/2):
-                        self.seq.append( self.seq[j] * self.seq[k+(n/2)] )
-    
-        # Add in Identity operator to the front of the sequence
-        I = IdentityOperator()
-        self.seq[0:0] = [I]
+    def load_from_cache(self):
+        '''
+        Loads the sequence and moment matrix from the cache. Returns False if
+        there is no cache or the moment matrix is not in it.
+        '''
+        if self.cache is None:
+            return False
+        
+        cached = self.cache.load(self.cache_key(), self.meas_ops, \
+                                 self.bool_compact_matrix)
+        if cached is None:
+            return False
+        
+        self.seq = cached["seq"]
+        self.npa_matrix = cached["npa_matrix"]
+        return True
+        
+        
+    def load_moment_ids(self):
+        '''
+        Memory-maps the sequence and compact moment matrix saved in mmap_path.
+        Returns False if there is no mmap_path or nothing was saved in it.
+        '''
+        if self.mmap_path is None:
+            return False
+        
+        saved = npa_cache.load_moment_ids(self.mmap_path, self.cache_key(), \
+                                          self.meas_ops)
+        if saved is None:
+            return False
+        
+        self.seq = saved["seq"]
+        self.npa_matrix = saved["npa_matrix"]
+        return True
+        
+        
+    def save_moment_ids(self):
+        '''
+        Saves the sequence and compact moment matrix in mmap_path, unless 
+        they were memory-mapped from it.
+        '''
+        if not npa_cache.is_saved_moment_ids(self.mmap_path, self.npa_matrix):
+            npa_cache.save_moment_ids(self.mmap_path, self.cache_key(), \
+                                      self.seq, self.npa_matrix)
+                
+        
+    def generate_measurement_operators(self):
+        '''
+        Measurement operators for Alice and Bob. See the module function
+        generate_measurement_operators.
+        '''    
+        self.meas_ops = generate_measurement_operators(self.num_inputs, \
+            self.num_outputs, self.bool_short_meas, self.parallel_reps, \
+            self.engine, self.bool_tensor_reps)
+        return self.meas_ops
+        
         
+    def generate_sequence(self):
+        '''
+        A sequence is generated from the list of meas_ops for the level of the
+        hierarchy. See the module function generate_sequence.
+        '''    
+        self.seq = generate_sequence(self.meas_ops, self.npa_level, \
+                                     self.bool_orthogonal_meas)
         return self.seq
       
       
@@ -198,22 +439,15 @@ class MomentMatrix(object):
         Given a sequence of level l (denoted S^l), the n x n moment matrix 
         corresponding to S^l may be written in the form:
                     M^l(u,v) = <psi| U^* V |psi>
-        for any entry. User can set the "simplified" variable to False if the 
-        moment matrix is not intended to be fully simplified by the rules of 
-        commutation, projection, etc.
+        for any entry. See the module function generate_moment_matrix.
         '''    
-        n = self.dim
-        self.npa_matrix = zeros(n,n)
-        for i in range(n):
-            for j in range(n):      
-                entry = Dagger(self.seq[i]) * self.seq[j]
-                
-                if self.bool_npa_matrix_simple == True:
-                    simp_entry = self.simplify_moment_matrix_entry( entry )                 
-                    self.npa_matrix[i,j] = simp_entry
-                    
-                else:
-                    self.npa_matrix[i,j] = entry                
+        out = None
+        if self.mmap_path is not None:
+            out = npa_cache.open_moment_ids(self.mmap_path, len(self.seq))
+            
+        self.npa_matrix = generate_moment_matrix(self.seq, \
+            self.bool_npa_matrix_simple, self.bool_orthogonal_meas, \
+            self.workers, self.bool_compact_matrix, out)
         return self.npa_matrix
         
         
@@ -224,76 +458,16 @@ class MomentMatrix(object):
         P^2 = P, we can possibly reduce the number of terms in certain entries
         in the moment matrix.
         '''
-               
-        if isinstance(entry, IdentityOperator):
-            pass
-        else:
-            # Measurement operators satisfy [A_a^x, B_b^y] = 0 for all 
-            # operators A_a^x and B_b^y
-            args = list(entry.args)
-            for k in range(len(args)-1):
-                # Comparing A vs. B lexographically to determine commutation 
-                # swap
-                if str(args[k])[0] > str(args[k+1])[0]:
-                    tmp = args[k]
-                    args[k] = args[k+1]
-                    args[k+1] = tmp
-            args = Mul(tuple(args))
-                       
-            entry = reduce(lambda x,y : x*y, args)   
-                            
-            # Measurement operators are projective, so enforce that P^2 = P for 
-            # any collection of measurement operators in sequence.
-            args = list(entry.args)
-            new_args = []
-            for k in range(len(args)):               
-                if isinstance(args[k], Integer):
-                    pass
-                # Remove identities since they are simply absorbed by the term.
-                elif isinstance(args[k], IdentityOperator):
-                    pass 
-                elif isinstance(args[k], Pow):
-                    new_args.append(args[k].base)
-                else:
-                 new_args.append(args[k])                    
-            new_args = Mul(tuple(new_args))
-                      
-            entry = reduce(lambda x,y : x*y, new_args)   
-                                                
-        return entry
+        return simplify_moment_matrix_entry(entry, self.bool_orthogonal_meas)
         
         
     def check_moment_matrix_entry_equiv(self, entry_1, entry_2):
         '''
         Given two entries in the moment matrix, this function checks whether or 
-        not they are within the same equivalence class by performing various 
-        checks based on the properties of the projective measurement operators. 
+        not they are within the same equivalence class.
         '''
-        
-        # First ensure the length of the entry is the same.
-        if len(str(entry_1)) == len(str(entry_2)):
-            
-            flip_entry_1 = entry_1.args[::-1]
-            flip_entry_2 = entry_2.args[::-1]
-            
-            # If the flipped term is just one entry, don't multiply through 
-            # the tuple.
-            if len(flip_entry_1) > 1:
-                flip_entry_1 = reduce(lambda x,y : x*y, flip_entry_1)
-            if len(flip_entry_2) > 1:
-                flip_entry_2 = reduce(lambda x,y : x*y, flip_entry_2)
-            
-            # If entries are identical strings:
-            if str(entry_1) == str(entry_2):
-                return True
-            # If entries are mirrored strings:
-            elif ( str(entry_1) == str(flip_entry_2) ) or \
-                 ( str(entry_2) == str(flip_entry_1) ):
-                return True
-                
-        # Otherwise, the entries are not equal 
-        else:
-            return False
+        return check_moment_matrix_entry_equiv(entry_1, entry_2, \
+                                               self.npa_matrix)
             
             
     def find_all_equiv_moment_matrix_entries(self, entry):
@@ -301,19 +475,8 @@ class MomentMatrix(object):
         Given an entry in the moment matrix, this function finds all other entries
         that are equal to the entry in question. The indices are returned as a
         list of tuples.
-        
-        Note: This function is very computationally intensive for even small matrix
-        sizes.
-            TODO: Optimize function
         '''
-        n = self.dim
-        
-        equiv_indices = []
-        for i in range(n):
-            for j in range(n):
-                if check_moment_matrix_entry_equiv(entry, self.npa_matrix[i,j]):
-                    equiv_indices.append( (i,j) )
-        return equiv_indices
+        return find_all_equiv_moment_matrix_entries(entry, self.npa_matrix)
         
         
     def generate_moment_matrix_equivalence_dict(self):
@@ -321,72 +484,197 @@ class MomentMatrix(object):
         Given a moment matrix, this function returns a dictionary of all 
         respective equivalent entries in the matrix. If the "minimal" value is 
         True, the function only stores entries in the dictionary that have not 
-        been seen previously.
-        '''
-        n = self.dim
-        equiv_dict = {}
-    
-        # Go through each entry in the moment matrix and compare against every
-        # other entry. Store the result in a dictionary.     
-        if self.bool_minimal_equiv_dict == False:
-            for i in range(n):
-                for j in range(n):
-                    equiv_dict[(i,j)] = \
-                        find_all_equiv_moment_matrix_entries(\
-                            self.npa_matrix[i,j], self.npa_matrix)   
-                        
-        # Otherwise generate a minimal list of entries that have no repeats in 
-        # the number of equivalent entries.
-        else:
-            seen = [] 
-            for i in range(n): 
-                for j in range(n):
-                    equiv_ent = find_all_equiv_moment_matrix_entries(\
-                        self.npa_matrix[i,j], npa_matrix)                      
-    
-                    print i,j
-                    
-                    seen_all = True
-                    for k in range(len(equiv_ent)):
-                        if equiv_ent[k] not in seen:
-                            seen_all = False
-                            break
-                        
-                    if seen_all == False:
-                        equiv_dict[(i,j)] = equiv_ent
-                    else:
-                        equiv_dict[(i,j)] = []
-                    seen += equiv_ent
-        
-        return equiv_dict
+        been seen previously. It is computed once and kept.
+        '''
+        if self._equiv_dict is None:
+            mat = self.npa_matrix
+            with npa_profile.activate(self.profiler):
+                self._equiv_dict = generate_moment_matrix_equivalence_dict( \
+                    mat, self.bool_minimal_equiv_dict)
+        return self._equiv_dict
+        
+        
+    def generate_affine_moment_matrix(self, bell_exp=None):
+        '''
+        Writes the moment matrix in the sparse affine form
+                    M(x) = F_0 + sum_k x_k F_k
+        used by SDP solvers, with one variable per equivalence class of 
+        entries. See the module function generate_affine_moment_matrix.
+        '''
+        index = self.generate_moment_index()
+        with npa_profile.activate(self.profiler):
+            return generate_affine_moment_matrix(self.npa_matrix, bell_exp, \
+                self.bool_orthogonal_meas, index)
+        
+        
+    def generate_moment_index(self):
+        '''
+        The index of the equivalence classes of the moment matrix and their 
+        positions (see MomentIndex). It is computed once and kept.
+        '''
+        if self._moment_index is None:
+            mat = self.npa_matrix
+            with npa_profile.activate(self.profiler):
+                self._moment_index = MomentIndex(mat, \
+                                                 self.bool_orthogonal_meas)
+        return self._moment_index
 
 ###############################################################################
-def generate_moment_matrix(seq, simplified=True):
+@npa_profile.profiled("moment_matrix")
+def generate_moment_matrix(seq, simplified=True, orthogonal=False, workers=1,\
+                           compact=False, out=None):
     '''
     Given a sequence of level l (denoted S^l), the n x n moment matrix 
     corresponding to S^l may be written in the form:
                 M^l(u,v) = <psi| U^* V |psi>
     for any entry. User can set the "simplified" variable to False if the 
     moment matrix is not intended to be fully simplified by the rules of 
-    commutation, projection, etc.
+    commutation, projection, etc. If "orthogonal" is True, the simplification
+    also sets products of orthogonal projectors to 0.
+
+    If workers > 1, the rows of the matrix are split into blocks that are 
+    computed in a pool of (workers) processes.
+
+    Only the upper triangle is computed, since M(j,i) is the adjoint of 
+    M(i,j). The sympy engine still returns a dense sympy Matrix, whose lower
+    triangle is filled with the adjoints of the upper one; only the moment 
+    matrices of the word engine are stored as their upper triangle.
+
+    If the sequence was generated by the integer-word engine, the moment
+    matrix is returned as an operator_words.WordMatrix, or as the more 
+    compact operator_words.MomentIdMatrix if "compact" is True. Its moment 
+    IDs are then written to (out) if it is given, e.g. a memmap. The moment 
+    matrix of a TensorSequence is a TensorMomentIdMatrix, see 
+    operator_words.generate_tensor_moment_matrix.
     '''    
+    if isinstance(seq, operator_words.TensorSequence):
+        return operator_words.generate_tensor_moment_matrix(seq, orthogonal, \
+                                                            workers)
+    _count_upper_entries(seq, simplified)
+    if isinstance(seq, operator_words.WordSequence):
+        if compact == True:
+            return operator_words.generate_moment_id_matrix(seq, simplified, \
+                                            orthogonal, workers, out=out)
+        return operator_words.generate_moment_matrix(seq, simplified, \
+                                                     orthogonal, workers)
+    return _generate_moment_matrix(seq, simplified, orthogonal, workers)
+
+
+@npa_profile.profiled("extend_moment_matrix")
+def extend_moment_matrix(mat, old_seq, seq, simplified=True, \
+                         orthogonal=False, workers=1):
+    '''
+    Given the moment matrix (mat) of the sequence (old_seq), computes the 
+    moment matrix of the sequence (seq) of a higher level of the hierarchy. 
+    Entry (i,j) only depends on the words seq[i] and seq[j], so the entries 
+    of two words that are both in old_seq are copied from (mat), and only the
+    entries involving new words are computed. The simplification settings 
+    must be the ones (mat) was generated with. The moment matrix of a 
+    TensorSequence is built again from the moment matrix of a single round.
+    '''
+    if isinstance(seq, operator_words.TensorSequence):
+        return operator_words.generate_tensor_moment_matrix(seq, orthogonal, \
+                                                            workers)
+    _count_upper_entries(seq, simplified, old_seq)
+    if isinstance(seq, operator_words.WordSequence):
+        return operator_words.extend_moment_matrix(mat, old_seq, seq, workers)
+    return _generate_moment_matrix(seq, simplified, orthogonal, workers, \
+                                   (old_seq, mat))
+
+
+def _count_upper_entries(seq, simplified, old_seq=None):
+    '''
+    Counts the entries of the upper triangle of the moment matrix of (seq)
+    that are computed, and the ones copied from the moment matrix of 
+    (old_seq), for the active profiler.
+    '''
+    if npa_profile.active() is None:
+        return
     n = len(seq)
+    num_old = 0
+    if old_seq is not None:
+        old_words = set(old_seq)
+        num_old = len([word for word in seq if word in old_words])
+    
+    num_reused = num_old * (num_old + 1) // 2
+    npa_profile.count("entries.computed", n * (n + 1) // 2 - num_reused)
+    npa_profile.count("entries.reused", num_reused)
+
+
+def _generate_moment_matrix(seq, simplified, orthogonal, workers, reuse=None):
+    '''
+    Sympy moment matrix of a sequence, reusing the entries of an earlier 
+    moment matrix if (reuse) is (old_seq, mat). The matrix is a dense sympy 
+    Matrix holding both triangles, so this halves the simplifications but 
+    not the memory.
+    '''
+    # Since M(j,i) is the adjoint of M(i,j), only the upper triangle is 
+    # computed and the lower triangle is derived from it.
+    n = len(seq)
+    upper = list(util.imap_upper_rows(seq, _upper_entries, \
+                                      (simplified, orthogonal), workers, reuse))
+        
     M = zeros(n,n)
     for i in range(n):
-        for j in range(n):      
-            entry = Dagger(seq[i]) * seq[j]
-            
+        for j in range(i, n):      
+            entry = upper[i][j-i]
+            M[i,j] = entry
             if simplified == True:
-                simp_entry = simplify_moment_matrix_entry( entry )                 
-                M[i,j] = simp_entry
-                
+                M[j,i] = adjoint_moment_matrix_entry(entry)
             else:
-                M[i,j] = entry                
+                M[j,i] = Dagger(entry)
     return M
 
 
+def generate_moment_matrix_entry(seq, i, j, simplified=True, \
+                                 orthogonal=False):
+    '''
+    Entry (i,j) of the moment matrix of a sequence, computed without the rest
+    of the matrix. It is the entry M[i,j] of generate_moment_matrix with the 
+    same settings.
+    '''
+    if isinstance(seq, operator_words.WordSequence):
+        return operator_words.generate_moment_matrix_entry(seq, i, j, \
+                                                  simplified, orthogonal)
+    
+    # Entries below the diagonal are the adjoints of the upper triangle.
+    if j < i:
+        entry = generate_moment_matrix_entry(seq, j, i, simplified, orthogonal)
+        if simplified == True:
+            return adjoint_moment_matrix_entry(entry)
+        return Dagger(entry)
+    
+    entry = Dagger(seq[i]) * seq[j]
+    if simplified == True:
+        entry = simplify_moment_matrix_entry(entry, orthogonal)
+    return entry
+
+
+def generate_moment_matrix_row(seq, i, simplified=True, orthogonal=False):
+    '''
+    Row i of the moment matrix of a sequence as a list of entries, computed 
+    without the rest of the matrix.
+    '''
+    return [generate_moment_matrix_entry(seq, i, j, simplified, orthogonal) \
+            for j in range(len(seq))]
+
+
+def _upper_entries(u, vs, simplified, orthogonal):
+    '''
+    Entries Dagger(u) * v of the upper triangle of the moment matrix, for 
+    each v of vs.
+    '''
+    u_dag = Dagger(u)
+    if simplified == True:
+        return [simplify_moment_matrix_entry(u_dag * v, orthogonal) \
+                for v in vs]
+    return [u_dag * v for v in vs]
+
+
+@npa_profile.profiled("measurement_operators")
 def generate_measurement_operators(num_inputs, num_outputs, \
-                                   short_meas=False, parallel_reps=1):
+                                   short_meas=False, parallel_reps=1, \
+                                   engine="sympy", tensor=False):
     '''
     Measurement operators for Alice and Bob.
 
@@ -396,262 +684,810 @@ def generate_measurement_operators(num_inputs, num_outputs, \
         wish to generate the most general list of measurements.
 
         parallel_reps: Number of repetitions carried out by party.         
-    '''    
-    meas_ops = []    
-
-    # Assuming that measurement labels are {0,1}-valued.
-    basis_in = util.list_2_str(range(num_inputs)).replace(" ", "")
-    basis_out = util.list_2_str(range(num_outputs)).replace(" ", "")
-    
-    meas_labels_in = util.generate_bit_strings(parallel_reps, basis_in)    
-    meas_labels_out = util.generate_bit_strings(parallel_reps, basis_out)
-    
-    num_meas_in = len(meas_labels_in)
-    num_meas_out = len(meas_labels_out)    
-    
-    # Longer form of measurements are generated.
-    if short_meas == False:
-        for i in range(num_meas_in):
-            for j in range(num_meas_out):
-                alice_label = "A^" + meas_labels_in[i] + "_" + meas_labels_out[j]
-                bob_label = "B^" + meas_labels_in[i] + "_" + meas_labels_out[j]
 
-                alice_meas_op = HermitianOperator(alice_label)
-                alice_meas_op.is_commutative = False
+        engine: "sympy" returns a list of sympy HermitianOperators, "word" 
+        returns an operator_words.OperatorAlphabet of integer-coded operators.
 
-                bob_meas_op = HermitianOperator(bob_label)
-                bob_meas_op.is_commutative = False                
-                
-                meas_ops.append(HermitianOperator(alice_meas_op))
-                meas_ops.append(HermitianOperator(bob_meas_op))
-
-    # Shorter form of measurements are generated FIX TODO
-    if short_meas == True:
-        for i in range(num_inputs-1 + num_outputs-1):
-
-            alice_label = "A^" + str(i) + "_" + "0"
-            bob_label = "B^" + str(i) + "_" + "0"
+        tensor: with the "word" engine, returns an 
+        operator_words.TensorAlphabet whose operators are products of the 
+        operators of the single rounds.
+    '''    
+    if engine == "word" and tensor == True:
+        return operator_words.TensorAlphabet(num_inputs, num_outputs, \
+                                             short_meas, parallel_reps)
+    if engine == "word":
+        return operator_words.OperatorAlphabet(num_inputs, num_outputs, \
+                                               short_meas, parallel_reps)
 
-            alice_meas_op = HermitianOperator(alice_label)
-            alice_meas_op.is_commutative = False
-            #alice_meas_op.is_real = True
+    meas_ops = []    
 
-            bob_meas_op = HermitianOperator(bob_label)
-            bob_meas_op.is_commutative = False            
-            #bob_meas_op.is_real = True
-            
-            meas_ops.append(HermitianOperator(alice_meas_op))
-            meas_ops.append(HermitianOperator(bob_meas_op))
+    # The shorter form of measurements leaves out the operator of the last 
+    # output of every measurement, as the operators sum to the identity.
+    meas_labels = operator_words.generate_measurement_labels(num_inputs, \
+                                num_outputs, short_meas, parallel_reps)
+    
+    for label in meas_labels:
+        meas_op = HermitianOperator(label)
+        meas_op.is_commutative = False
+        
+        meas_ops.append(HermitianOperator(meas_op))
       
     return sorted(meas_ops, key=default_sort_key)
 
 
-def generate_sequence(meas_ops, level):
+@npa_profile.profiled("sequence")
+def generate_sequence(meas_ops, level, orthogonal=False):
     '''
     A sequence is generated from the list of meas_ops from function 
     generate_measurement_operators. The level can be either an integer, or an
     intermediate level. Appropriate intermediate levels are "l+X" where "l" is
     the level of the sequence, and "X" is the intermediate steps. For instance:
         "l+A", "l+B", "l+AB", "l+A+B", "l+AB+A", etc.
-    are all appropriate intermediate levels. 
+    are all appropriate intermediate levels. Custom steps add the monomials
+    of a given form, e.g. "1+AAB" adds the products of two of Alice's and one
+    of Bob's operators.
+
+    A product that simplifies to an entry earlier in the sequence is left 
+    out, and if "orthogonal" is True, so are the products that are zero 
+    since they contain a product of orthogonal projectors.
     '''    
-    seq = meas_ops[:]
-    inter_med_seq = False
-    
-    # If the level is not an integer, but instead an intermediate level value, 
-    # the format is expected to be "l+AB", "l+A", or "l+B" where "l" is an 
-    # integer value corresponding to the level, and "AB", "A", or "B" are the
-    # intermediate levels between l and l+1.
-    if isinstance(level, str):
-        l_str = level.split('+')
-        level = int(l_str[0]) 
-        inter_med = l_str[1:]
-
-        inter_med = map(lambda x: x.strip(), inter_med)
-        inter_med_seq = True    
-    
-    for i in range(1,level):        
-        
-        n = len(seq)                  
-
-        # Process all A_a^x
-        for j in range(n/2):
-            for k in range(n/2):        
-                if j != k:
-                    seq.append( seq[j] * seq[k] )
-                    
-        # Process all B_b^y
-        for j in range(n/2, n):
-            for k in range(n/2, n):
-                if j != k:
-                    seq.append( seq[j] * seq[k] )
-        
-        # Process all A_a^x B_b^y
-        for j in range(n/2):
-            for k in range(n/2):
-                seq.append( seq[j] * seq[k+(n/2)] )
-
-    # If the sequence is intermediate, process the last bit 
-    if inter_med_seq == True:
-        n = len(seq)
-        
-        if "A" in inter_med:
-            for j in range(n/2):
-                for k in range(n/2):        
-                    if j != k:
-                        seq.append( seq[j] * seq[k] )
-        if "B" in inter_med:
-            for j in range(n/2, n):
-                for k in range(n/2, n):
-                    if j != k:
-                        seq.append( seq[j] * seq[k] )
-        if "AB" in inter_med:
-            for j in range(n/2):
-                for k in range(n/2):
-                    seq.append( seq[j] * seq[k+(n/2)] )
+    if isinstance(meas_ops, operator_words.OperatorAlphabet):
+        return operator_words.generate_sequence(meas_ops, level, orthogonal)
+
+    def normal(op):
+        op = simplify_moment_matrix_entry(op, orthogonal)
+        return operator_words.ZERO if op == 0 else op
+    
+    # The entries are kept in their simplified form, and the products that
+    # are zero or already in the sequence are left out.
+    seq = operator_words.generate_sequence_words(meas_ops, level, \
+        len(meas_ops) // 2, lambda x, y: x * y, normal)
 
     # Add in Identity operator to the front of the sequence
     I = IdentityOperator()
-    #I = HermitianOperator("I")
     seq[0:0] = [I]
-    
     return seq
+
+
+def count_sequence(num_ops, level):
+    '''
+    Counts the entries of the sequence that generate_sequence builds from 
+    (num_ops) measurement operators for a level, without building it. 
+    Returns the length of the sequence (with the identity) and upper bounds 
+    on the number of Alice's and of Bob's operators in its entries. The 
+    length counts every product, so it is an upper bound whenever products 
+    may be zero or repeat an earlier entry (see is_sequence_count_exact).
+    '''
+    npa_level, inter_med = operator_words.parse_level(level)
+    steps = [["A", "B", "AB"]] * (npa_level - 1)
+    named = [step for step in inter_med if step in operator_words.LEVEL_STEPS]
+    if len(named) > 0:
+        steps.append(named)
+    
+    # Numbers of Alice's and Bob's operators in the entries of the first and
+    # second half of the sequence, which the products of a step are taken 
+    # from. Only the operators themselves are split exactly into halves.
+    n = num_ops
+    first, second = (1, 0), (0, 1)
+    lengths = (1, 1)
+    for step in steps:
+        h = n // 2
+        products = []
+        if "A" in step:
+            products.append( (h * (h - 1), 2 * first[0], 2 * first[1]) )
+        if "B" in step:
+            products.append( ((n - h) * (n - h - 1), 2 * second[0], \
+                              2 * second[1]) )
+        if "AB" in step:
+            products.append( (h * h, first[0] + second[0], \
+                              first[1] + second[1]) )
+        
+        n += sum([count for count, _, _ in products])
+        lengths = (max([lengths[0]] + [a for _, a, _ in products]), \
+                   max([lengths[1]] + [b for _, _, b in products]))
+        first = second = lengths
+    
+    # Custom steps are products of the measurement operators themselves.
+    h = num_ops // 2
+    for step in inter_med:
+        if step not in operator_words.LEVEL_STEPS:
+            n += h**step.count("A") * (num_ops - h)**step.count("B")
+            lengths = (max(lengths[0], step.count("A")), \
+                       max(lengths[1], step.count("B")))
+    return n + 1, lengths[0], lengths[1]
+
+
+def is_sequence_count_exact(level, orthogonal=False):
+    '''
+    Whether count_sequence gives the exact length of the sequence of a level.
+    Without orthogonal measurements, the products of a single round of the 
+    steps "A", "B" and "AB" over the measurement operators are distinct and
+    nonzero, so the count is exact for levels 1, 2 and "1+..." of these steps.
+    '''
+    npa_level, inter_med = operator_words.parse_level(level)
+    if orthogonal == True or npa_level > 2:
+        return False
+    if npa_level == 2 and len(inter_med) > 0:
+        return False
+    return all([step in operator_words.LEVEL_STEPS for step in inter_med])
+
+
+def count_moments(num_party_ops, meas_size, alice_len, bob_len, \
+                  orthogonal=False):
+    '''
+    Upper bound on the number of distinct moments (equivalence classes of 
+    simplified entries) of a moment matrix whose entries have at most 
+    (alice_len) operators of Alice and (bob_len) of Bob, where each party has
+    (num_party_ops) operators in measurements of (meas_size) operators.
+    
+    A simplified entry is a word of Alice's operators followed by a word of
+    Bob's, with no operator repeated next to itself (nor, for orthogonal 
+    measurements, two operators of a measurement next to each other). An 
+    entry and its adjoint (the reversed words) are one moment, so the words 
+    are counted up to reversal.
+    '''
+    # Operators that may follow an operator of a word.
+    a = num_party_ops
+    b = num_party_ops - (meas_size if orthogonal == True else 1)
+    
+    def count_words(max_len):
+        # Words and palindromes of length at most max_len. A palindrome of 
+        # even length has a repeated operator in its middle.
+        words = 1 + sum([a * b**(k-1) for k in range(1, max_len + 1)])
+        palindromes = 1 + sum([a * b**(k // 2) \
+                               for k in range(1, max_len + 1, 2)])
+        return words, palindromes
+    
+    alice_words, alice_pals = count_words(alice_len)
+    bob_words, bob_pals = count_words(bob_len)
+    num_moments = (alice_words * bob_words + alice_pals * bob_pals) // 2
+    
+    # The entries that vanish are one more class.
+    if orthogonal == True:
+        num_moments += 1
+    return num_moments
+
+
+def estimate_resources(num_inputs, num_outputs, npa_level, parallel_reps=1, \
+                       short_meas=False, orthogonal=False, engine="sympy", \
+                       compact=False, simplified=True, tensor=False):
+    '''
+    Estimates the moment matrix of a scenario and level without building 
+    anything. Returns a dictionary of:
+        num_ops: number of measurement operators.
+        dim: dimension of the moment matrix (an upper bound unless 
+             dim_exact is True, see is_sequence_count_exact).
+        num_entries: number of entries of its upper triangle.
+        num_moments: upper bound on its number of distinct moments, i.e. 
+                     equivalence classes of simplified words.
+        time: estimated seconds to build it and its equivalence classes.
+        memory: estimated peak bytes of building it.
+    The time and memory follow BUILD_COSTS of the engine. If "tensor" is 
+    True, the moment matrix is the tensor power of the moment matrix of a 
+    single round (see MomentMatrix), whose estimate is part of the time.
+    '''
+    if tensor == True:
+        return _estimate_tensor_resources(num_inputs, num_outputs, npa_level,\
+                                          parallel_reps, short_meas, orthogonal)
+    
+    outputs = num_outputs**parallel_reps
+    meas_size = outputs - 1 if short_meas == True else outputs
+    num_party_ops = num_inputs**parallel_reps * meas_size
+    
+    dim, alice_len, bob_len = count_sequence(2 * num_party_ops, npa_level)
+    num_entries = dim * (dim + 1) // 2
+    num_moments = num_entries
+    if simplified == True:
+        num_moments = min(num_entries, count_moments(num_party_ops, \
+            meas_size, 2 * alice_len, 2 * bob_len, orthogonal))
+    
+    costs = BUILD_COSTS["compact" if compact == True else engine]
+    return {"num_ops": 2 * num_party_ops,
+            "dim": dim,
+            "dim_exact": is_sequence_count_exact(npa_level, orthogonal),
+            "num_entries": num_entries,
+            "num_moments": num_moments,
+            "time": costs["build"] * num_entries + costs["index"] * dim**2,
+            "memory": costs["memory"] * dim**2}
+
+
+def _estimate_tensor_resources(num_inputs, num_outputs, npa_level, \
+                               parallel_reps, short_meas, orthogonal):
+    '''
+    Estimates the moment matrix of parallel repetitions with a product 
+    structure from the estimate of the compact moment matrix of a single 
+    round, see estimate_resources.
+    '''
+    rnd = estimate_resources(num_inputs, num_outputs, npa_level, 1, \
+                             short_meas, orthogonal, "word", True)
+    dim = rnd["dim"]**parallel_reps
+    num_entries = dim * (dim + 1) // 2
     
+    # The moments are the tuples of an entry of a single round (a moment or 
+    # its adjoint) per round, up to the adjoint.
+    num_moments = min(num_entries, (2 * rnd["num_moments"])**parallel_reps)
+    
+    costs = BUILD_COSTS["tensor"]
+    return {"num_ops": 2 * (rnd["num_ops"] // 2)**parallel_reps,
+            "dim": dim,
+            "dim_exact": rnd["dim_exact"],
+            "num_entries": num_entries,
+            "num_moments": num_moments,
+            "time": rnd["time"] + costs["build"] * num_entries + \
+                    costs["index"] * dim**2,
+            "memory": max(rnd["memory"], costs["memory"] * dim**2)}
+
 
+@npa_profile.profiled("equivalence_search")
 def find_all_equiv_moment_matrix_entries(entry, mat):
     '''
     Given an entry in the moment matrix, this function finds all other entries
     that are equal to the entry in question. The indices are returned as a
     list of tuples.
     
-    Note: This function is very computationally intensive for even small matrix
-    sizes.
-        TODO: Optimize function
+    Note: When looking up many entries of the same matrix, use 
+    generate_moment_matrix_equivalence_classes instead, which groups all the
+    entries in a single pass.
     '''
     n = int(math.sqrt(len(mat))) 
+    entry_key = get_moment_matrix_entry_key_function(mat)
+    key = entry_key(entry)
     
     equiv_indices = []
     for i in range(n):
         for j in range(n):
-            if check_moment_matrix_entry_equiv(entry, mat[i,j]):
+            if entry_key(mat[i,j]) == key:
                 equiv_indices.append( (i,j) )
     return equiv_indices
     
    
-def check_moment_matrix_entry_equiv(entry_1, entry_2):
+def check_moment_matrix_entry_equiv(entry_1, entry_2, mat=None):
     '''
     Given two entries in the moment matrix, this function checks whether or not
-    they are within the same equivalence class by performing various checks 
-    based on the properties of the projective measurement operators. 
+    they are within the same equivalence class, i.e. whether their canonical 
+    keys (see moment_matrix_entry_key) are equal. Words of the integer-word 
+    engine are brought to the normal form of their moment matrix (mat), which
+    must then be given, and compared by its keys. A zero entry (ZERO) is only
+    equivalent to ZERO.
     '''
+    if entry_1 is operator_words.ZERO or entry_2 is operator_words.ZERO:
+        return entry_1 is entry_2
     
-    # First ensure the length of the entry is the same.
-    if len(str(entry_1)) == len(str(entry_2)):
-        
-        flip_entry_1 = entry_1.args[::-1]
-        flip_entry_2 = entry_2.args[::-1]
-        
-        # If the flipped term is just one entry, don't multiply through tuple.
-        if len(flip_entry_1) > 1:
-            flip_entry_1 = reduce(lambda x,y : x*y, flip_entry_1)
-        if len(flip_entry_2) > 1:
-            flip_entry_2 = reduce(lambda x,y : x*y, flip_entry_2)
-        
-        # If entries are identical strings:
-        if str(entry_1) == str(entry_2):
-            return True
-        # If entries are mirrored strings:
-        elif ( str(entry_1) == str(flip_entry_2) ) or \
-             ( str(entry_2) == str(flip_entry_1) ):
-            return True
-            
-    # Otherwise, the entries are not equal 
-    else:
+    if isinstance(entry_1, tuple) or isinstance(entry_2, tuple):
+        if not isinstance(mat, operator_words.WordMatrix):
+            raise ValueError("Words of the integer-word engine are only "
+                             "compared with their moment matrix (mat).")
+        return mat.entry_key(mat.normal_word(entry_1)) == \
+               mat.entry_key(mat.normal_word(entry_2))
+    
+    if mat is not None:
+        entry_key = get_moment_matrix_entry_key_function(mat)
+        return entry_key(entry_1) == entry_key(entry_2)
+    return moment_matrix_entry_key(entry_1) == moment_matrix_entry_key(entry_2)
+
+
+def is_zero_moment_matrix_entry(entry):
+    '''
+    Checks whether an entry of the moment matrix was simplified to zero by the
+    orthogonality of the measurement operators.
+    '''
+    if isinstance(entry, tuple):
         return False
+    return entry is operator_words.ZERO or entry == 0
+
+
+def moment_matrix_entry_key(entry):
+    '''
+    Reduces a (sympy) entry of the moment matrix to a canonical key: the 
+    smaller of the string of the entry and the string of its adjoint. Two 
+    entries are equivalent in the sense of check_moment_matrix_entry_equiv
+    exactly when their keys are equal.
+    
+    The adjoint of a simplified entry (in normal form, Alice's operators in
+    front of Bob's) reverses the operators of each party, so that it is again
+    in normal form, see adjoint_moment_matrix_entry. The adjoint of any other
+    entry is its mirrored entry, like the words of operator_words.
+    '''
+    # If the entry is just one term, it is its own mirror.
+    if not isinstance(entry, Mul):
+        return _factor_str(entry)
+    
+    factors = [_factor_str(arg) for arg in entry.args]
+    parties = [factor[0] for factor in factors]
+    if parties == sorted(parties):
+        num_alice = parties.count("A")
+        adjoint = factors[:num_alice][::-1] + factors[num_alice:][::-1]
+    else:
+        adjoint = factors[::-1]
+    return min("*".join(factors), "*".join(adjoint))
+
+
+def _factor_str(factor):
+    '''
+    String of a single factor of an entry. Measurement operators are unwrapped
+    down to the symbol holding their label, which avoids going through the 
+    sympy printer for every entry.
+    '''
+    while isinstance(factor, HermitianOperator):
+        factor = factor.args[0]
+    if isinstance(factor, Symbol):
+        return factor.name
+    return str(factor)
+
+
+def get_moment_matrix_entry_key_function(mat):
+    '''
+    Returns the function reducing entries of the moment matrix (mat) to their
+    canonical keys.
+    '''
+    if isinstance(mat, operator_words.WordMatrix):
+        return mat.entry_key
+
+    # Sympy entries repeat many times in a moment matrix, so their (string
+    # based) keys are only computed once per distinct entry.
+    key_cache = {}
+    def entry_key(entry):
+        if entry not in key_cache:
+            key_cache[entry] = moment_matrix_entry_key(entry)
+        return key_cache[entry]
+    return entry_key
+
+
+@npa_profile.profiled("equivalence")
+def generate_moment_matrix_equivalence_classes(mat):
+    '''
+    Groups the entries of a moment matrix into equivalence classes in a single
+    pass by hashing the canonical key of every entry. Returns a dictionary 
+    mapping each key to the list of indices of the entries in its class, in 
+    row-major order.
+    '''
+    n = int(math.sqrt(len(mat)))
+    entry_key = get_moment_matrix_entry_key_function(mat)
+    
+    equiv_classes = {}
+    for i in range(n):
+        for j in range(n):
+            key = entry_key(mat[i,j])
+            if key in equiv_classes:
+                equiv_classes[key].append( (i,j) )
+            else:
+                equiv_classes[key] = [ (i,j) ]
+    return equiv_classes
 
 
+@npa_profile.profiled("equivalence_dict")
 def generate_moment_matrix_equivalence_dict(mat, minimal=False):
     '''
     Given a moment matrix, this function returns a dictionary of all respective
     equivalent entries in the matrix. If the "minimal" value is True, the 
     function only stores entries in the dictionary that have not been seen
     previously.
+
+    Note: Entries of the same class share the same list of indices, so the 
+    lists should not be modified in place.
     '''
-    n = int(math.sqrt(len(mat)))  
     equiv_dict = {}
+    
+    for equiv_ent in generate_moment_matrix_equivalence_classes(mat).values():
+        # In the minimal form, only the first entry of each class (in
+        # row-major order) stores the equivalent entries.
+        if minimal == True:
+            equiv_dict[equiv_ent[0]] = equiv_ent
+            for k in range(1, len(equiv_ent)):
+                equiv_dict[equiv_ent[k]] = []
+        else:
+            for k in range(len(equiv_ent)):
+                equiv_dict[equiv_ent[k]] = equiv_ent
+    
+    return equiv_dict
 
-    # Go through each entry in the moment matrix and compare against every
-    # other entry. Store the result in a dictionary.     
-    if minimal == False:
-        for i in range(n):
-            for j in range(n):
-                equiv_dict[(i,j)] = \
-                    find_all_equiv_moment_matrix_entries(mat[i,j], mat)   
-                    
-    # Otherwise generate a minimal list of entries that have no repeats in the
-    # number of equivalent entries.
-    else:
-        seen = [] 
-        for i in range(n): 
-            for j in range(n):
-                equiv_ent = find_all_equiv_moment_matrix_entries(mat[i,j], mat)                      
 
-                print i,j
-                
-                seen_all = True
-                for k in range(len(equiv_ent)):
-                    if equiv_ent[k] not in seen:
-                        seen_all = False
-                        break
-                    
-                if seen_all == False:
-                    equiv_dict[(i,j)] = equiv_ent
-                else:
-                    equiv_dict[(i,j)] = []
-                seen += equiv_ent
+class MomentIndex(object):
+    """The equivalence classes of the entries of a moment matrix, i.e. its 
+    distinct monomials, numbered in the (row-major) order in which they first
+    appear. The positions of every class are precomputed, so that weights 
+    given per monomial are placed in the matrix without scanning it.
     
-    return equiv_dict
+    Attributes:
+        dim: dimension of the moment matrix.
+        num_classes: number of equivalence classes.
+        keys: canonical key of each class.
+        key_index: dictionary mapping canonical keys to class IDs.
+        rows, cols: coordinates of the entries, grouped by class, where the
+                    entries of class k are in the slice ptr[k]:ptr[k+1].
+        ptr: offsets of the classes in rows and cols.
+        identity_id: ID of the class of M(1,1) = <psi| I |psi>.
+        zero_ids: IDs of the classes of entries that vanish by the 
+                  orthogonality of the measurement operators.
+    """
+    @npa_profile.profiled("moment_index")
+    def __init__(self, mat, orthogonal=False):
+        
+        self.mat = mat
+        self.orthogonal = orthogonal
+        self.dim = int(math.sqrt(len(mat)))
+        
+        if isinstance(mat, operator_words.MomentIdMatrix):
+            self._index_moment_ids(mat)
+        else:
+            self._index_entries(mat)
+        
+        self.num_classes = len(self.keys)
+        self.key_index = dict((key, k) for k, key in enumerate(self.keys))
+        
+        self.identity_id = 0
+        self.zero_ids = set([k for k in range(self.num_classes) \
+            if is_zero_moment_matrix_entry( \
+                mat[self.rows[self.ptr[k]], self.cols[self.ptr[k]]])])
+        
+        
+    def _index_entries(self, mat):
+        '''Sets the classes and positions by the keys of the entries.'''
+        equiv_classes = generate_moment_matrix_equivalence_classes(mat).items()
+        equiv_classes.sort(key=lambda item: item[1][0])
+        
+        self.keys = [key for key, _ in equiv_classes]
+        
+        positions = [ent for _, equiv_ent in equiv_classes \
+                     for ent in equiv_ent]
+        self.rows = np.asarray([ent[0] for ent in positions], dtype=np.int32)
+        self.cols = np.asarray([ent[1] for ent in positions], dtype=np.int32)
+        self.ptr = np.cumsum([0] + [len(equiv_ent) \
+                             for _, equiv_ent in equiv_classes])
+        
+        
+    def _index_moment_ids(self, mat):
+        '''
+        Sets the classes and positions of a MomentIdMatrix from its moment
+        IDs with vectorized numpy operations.
+        '''
+        moment_ids = mat.moment_ids().ravel()
+        
+        # Renumber the moments in the order of their first entries.
+        moments, first = np.unique(moment_ids, return_index=True)
+        moments = moments[np.argsort(first)]
+        class_ids = np.empty(len(mat.words), dtype=np.int32)
+        class_ids[moments] = np.arange(len(moments), dtype=np.int32)
+        class_ids = class_ids[moment_ids]
+        
+        self.keys = [mat.words[m] for m in moments]
+        
+        # A stable sort keeps the entries of each class in row-major order.
+        order = np.argsort(class_ids, kind="mergesort")
+        self.rows = (order // self.dim).astype(np.int32)
+        self.cols = (order % self.dim).astype(np.int32)
+        self.ptr = np.concatenate(([0], np.cumsum(np.bincount(class_ids))))
+        
+        
+    def positions(self, k):
+        '''Returns the (rows, cols) coordinates of the entries of class k.'''
+        return self.rows[self.ptr[k]:self.ptr[k+1]], \
+               self.cols[self.ptr[k]:self.ptr[k+1]]
+        
+        
+    def class_ids(self):
+        '''Returns the class ID of every entry as an n x n numpy array.'''
+        ids = np.empty((self.dim, self.dim), dtype=np.int32)
+        ids[self.rows, self.cols] = np.repeat( \
+            np.arange(self.num_classes, dtype=np.int32), np.diff(self.ptr))
+        return ids
+        
+        
+    def term_id(self, term):
+        '''
+        Returns the class ID of the entries equal to a product of measurement
+        operators (term), or None if the term vanishes by orthogonality. A 
+        ValueError is raised if the term is not an entry of the matrix.
+        '''
+        key = moment_matrix_term_key(term, self.mat, self.orthogonal)
+        if key in self.key_index:
+            return self.key_index[key]
+        if key is operator_words.ZERO or key == "0":
+            return None
+        raise ValueError("The term %s of the Bell expression is not an entry "
+                         "of the moment matrix." % term)
+        
+        
+    def compile_bell_expression(self, bell_exp):
+        '''
+        Compiles a Bell expression to a sparse map from class IDs to 
+        coefficients. The constant term is the coefficient of the identity 
+        class and terms vanishing by orthogonality are dropped.
+        '''
+        coeffs = {}
+        for coeff, term in split_bell_expression(bell_exp):
+            k = self.term_id(term)
+            if k is not None and k not in self.zero_ids:
+                coeffs[k] = coeffs.get(k, 0.0) + coeff
+        return coeffs
+        
+        
+    def weight_matrix(self, coeffs):
+        '''
+        Returns the dense n x n numpy matrix holding the coefficient of every
+        class (given as a map from class IDs to coefficients) in the 
+        positions of the class.
+        '''
+        mat = np.zeros((self.dim, self.dim))
+        for k, coeff in coeffs.items():
+            rows, cols = self.positions(k)
+            mat[rows, cols] = coeff
+        return mat
+
+
+class AffineMomentMatrix(object):
+    """The moment matrix written as the affine matrix function 
+                M(x) = F_0 + sum_k x_k F_k
+    where every equivalence class of entries is one variable x_k. The entry 
+    M(1,1) = <psi| I |psi> = 1 is held in F_0 and the entries that vanish by 
+    the orthogonality of the measurement operators are left out. The basis 
+    matrices are stored in coordinate (COO) form.
+    
+    Attributes:
+        dim: dimension of the moment matrix.
+        num_vars: number of variables x_k.
+        var_keys: canonical key of the equivalence class of each variable.
+        var_index: dictionary mapping canonical keys to variable indices.
+        rows, cols, var_ids: coordinates of the entries holding a variable 
+                             and the index of that variable.
+        const_rows, const_cols, const_vals: coordinates and values of F_0.
+        obj_ids, obj_vals: the Bell objective as a sparse vector c, i.e. the
+                           indices and values of its nonzero coefficients.
+        obj_offset: constant term of the Bell objective, c_0.
+    """
+    def __init__(self, dim, var_keys, rows, cols, var_ids, const_rows, \
+                 const_cols, const_vals):
+        
+        self.dim = dim
+        self.num_vars = len(var_keys)
+        self.var_keys = var_keys
+        self.var_index = dict((key, k) for k, key in enumerate(var_keys))
+        
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        self.var_ids = np.asarray(var_ids, dtype=np.int32)
+        
+        self.const_rows = np.asarray(const_rows, dtype=np.int32)
+        self.const_cols = np.asarray(const_cols, dtype=np.int32)
+        self.const_vals = np.asarray(const_vals, dtype=np.float64)
+        
+        self.obj_ids = np.zeros(0, dtype=np.int32)
+        self.obj_vals = np.zeros(0, dtype=np.float64)
+        self.obj_offset = 0.0
+        
+        
+    def basis_indices(self):
+        '''
+        Returns a list holding, for every variable x_k, the (rows, cols) 
+        coordinate arrays of the entries of F_k equal to 1.
+        '''
+        order = np.argsort(self.var_ids, kind="mergesort")
+        splits = np.searchsorted(self.var_ids[order], \
+                                 np.arange(1, self.num_vars))
+        return [(self.rows[ind], self.cols[ind]) \
+                for ind in np.split(order, splits)]
+        
+        
+    def constant_matrix(self):
+        '''Returns F_0 as a scipy.sparse matrix.'''
+        return _coo_matrix(self.const_vals, self.const_rows, \
+                           self.const_cols, self.dim)
+        
+        
+    def basis_matrices(self):
+        '''Returns the list of the basis matrices F_k as scipy.sparse.'''
+        return [_coo_matrix(np.ones(len(rows)), rows, cols, self.dim) \
+                for rows, cols in self.basis_indices()]
+        
+        
+    def objective_vector(self):
+        '''Returns the Bell objective c as a 1 x num_vars scipy.sparse.'''
+        if scipy is None:
+            raise ImportError("scipy is required for sparse matrices.")
+        return scipy.sparse.csr_matrix((self.obj_vals, \
+            (np.zeros(len(self.obj_ids), dtype=np.int32), self.obj_ids)), \
+            shape=(1, self.num_vars))
+        
+        
+    def evaluate(self, x):
+        '''Returns the dense numpy matrix M(x) for the variables x.'''
+        mat = np.zeros((self.dim, self.dim))
+        mat[self.const_rows, self.const_cols] = self.const_vals
+        mat[self.rows, self.cols] = np.asarray(x, dtype=np.float64)[self.var_ids]
+        return mat
+        
+        
+    def evaluate_objective(self, x):
+        '''Returns the value c_0 + c^T x of the Bell objective.'''
+        x = np.asarray(x, dtype=np.float64)
+        return self.obj_offset + np.dot(self.obj_vals, x[self.obj_ids])
+
+
+def _coo_matrix(vals, rows, cols, dim):
+    '''Builds a dim x dim scipy.sparse COO matrix.'''
+    if scipy is None:
+        raise ImportError("scipy is required for sparse matrices.")
+    return scipy.sparse.coo_matrix((vals, (rows, cols)), shape=(dim, dim))
+
+
+@npa_profile.profiled("affine_moment_matrix")
+def generate_affine_moment_matrix(mat, bell_exp=None, orthogonal=False, \
+                                  index=None):
+    '''
+    Given a moment matrix, this function assigns a variable to each of its
+    equivalence classes of entries and returns the AffineMomentMatrix 
+                M(x) = F_0 + sum_k x_k F_k.
+    The variables are numbered in the (row-major) order in which their 
+    classes first appear. If a Bell expression is given, it is mapped to the
+    sparse objective vector over the variables. A MomentIndex of the matrix 
+    can be passed as (index) if it was already computed.
+    '''
+    if index is None:
+        index = MomentIndex(mat, orthogonal)
+    
+    var_keys = []
+    var_classes = []
+    class_vars = {}
+    for k in range(index.num_classes):
+        if k != index.identity_id and k not in index.zero_ids:
+            class_vars[k] = len(var_classes)
+            var_classes.append(k)
+            var_keys.append(index.keys[k])
+    
+    rows, cols = _class_positions(index, var_classes)
+    var_ids = np.repeat(np.arange(len(var_classes)), \
+                        np.diff(index.ptr)[var_classes].astype(int))
+    const_rows, const_cols = _class_positions(index, [index.identity_id])
+    affine_mat = AffineMomentMatrix(index.dim, var_keys, rows, cols, var_ids,\
+        const_rows, const_cols, np.ones(len(const_rows)))
+    
+    if bell_exp is not None:
+        obj = index.compile_bell_expression(bell_exp)
+        affine_mat.obj_offset = obj.pop(index.identity_id, 0.0)
+        obj_ids = sorted(obj.keys())
+        affine_mat.obj_ids = np.asarray([class_vars[k] for k in obj_ids], \
+                                        dtype=np.int32)
+        affine_mat.obj_vals = np.asarray([obj[k] for k in obj_ids], \
+                                         dtype=np.float64)
+        
+    return affine_mat
+
+
+def _class_positions(index, class_ids):
+    '''Concatenated (rows, cols) coordinates of the classes of an index.'''
+    if len(class_ids) == 0:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    positions = [index.positions(k) for k in class_ids]
+    return np.concatenate([rows for rows, _ in positions]), \
+           np.concatenate([cols for _, cols in positions])
+
+
+def split_bell_expression(bell_exp):
+    '''
+    Splits a Bell expression into a list of (coefficient, term) pairs, where 
+    the coefficient is a float and the term a product of measurement 
+    operators (the constant term has the term 1).
+    '''
+    terms = []
+    for arg in Add.make_args(sympify(bell_exp).expand()):
+        coeff, term = arg.as_coeff_Mul()
+        terms.append( (float(coeff), term) )
+    return terms
+
+
+def moment_matrix_term_key(term, mat, orthogonal=False):
+    '''
+    Returns the canonical key of the entries of the moment matrix (mat) that 
+    are equal to a product of measurement operators (term), such as a term of
+    a Bell expression.
+    '''
+    if isinstance(mat, operator_words.WordMatrix):
+        return mat.term_key(term)
+    if term.is_number:
+        return moment_matrix_entry_key(IdentityOperator())
+    return moment_matrix_entry_key(simplify_moment_matrix_entry(term, \
+                                                                orthogonal))
 
 
-def simplify_moment_matrix_entry(entry):
+def simplify_moment_matrix_entry(entry, orthogonal=False):
     '''
     Since the measurement operators pair-wise commute, i.e. [A_a^x, B_b^y] = 0, 
     and since they are also projection operators, i.e. P^2 = P, we can possibly
     reduce the number of terms in certain entries in the moment matrix.
+
+    If "orthogonal" is True, the projectors of a measurement are also taken to
+    be orthogonal, i.e. A_a^x A_a'^x = 0 for a != a', and entries containing 
+    such a product are simplified to 0.
+    
+    The same products recur many times in a moment matrix (and across the 
+    moment matrices of a process), so the simplified entries are memoized in
+    simplify_cache by the word of the entry. The calls and the hits and 
+    misses of the cache are counted for the active profiler.
+    '''
+    profiling = npa_profile.active() is not None
+    if profiling:
+        npa_profile.count("simplify.calls")
+    key = (_entry_word(entry), orthogonal)
+    simp_entry = simplify_cache.get(key)
+    if simp_entry is None:
+        simp_entry = _simplify_moment_matrix_entry(entry, orthogonal)
+        simplify_cache.put(key, simp_entry)
+        if profiling:
+            npa_profile.count("simplify_cache.misses")
+    elif profiling:
+        npa_profile.count("simplify_cache.hits")
+    return simp_entry
+
+
+def _entry_word(entry):
+    '''
+    Hashable word of a (sympy) entry of the moment matrix, i.e. the tuple of
+    the strings of its factors.
+    '''
+    if isinstance(entry, Mul):
+        return tuple([_factor_str(arg) for arg in entry.args])
+    return (_factor_str(entry),)
+
+
+def _simplify_moment_matrix_entry(entry, orthogonal):
+    '''
+    Simplifies an entry to its normal form, see operator_words.normal_form.
     '''
-           
     if isinstance(entry, IdentityOperator):
-        pass
-    else:
-        # Measurement operators satisfy [A_a^x, B_b^y] = 0 for all operators 
-        # A_a^x and B_b^y
-        args = list(entry.args)
-        for k in range(len(args)-1):
-            # Comparing A vs. B lexographically to determine commutation swap
-            if str(args[k])[0] > str(args[k+1])[0]:
-                tmp = args[k]
-                args[k] = args[k+1]
-                args[k+1] = tmp
-        args = Mul(tuple(args))
-                   
-        entry = reduce(lambda x,y : x*y, args)   
-                        
-        # Measurement operators are projective, so enforce that P^2 = P for 
-        # any collection of measurement operators in sequence.
-        args = list(entry.args)
-        new_args = []
-        for k in range(len(args)):               
-            if isinstance(args[k], Integer):
-                pass
-            # Remove identities since they are simply absorbed by the term.
-            elif isinstance(args[k], IdentityOperator):
-                pass 
-            elif isinstance(args[k], Pow):
-                new_args.append(args[k].base)
-            else:
-             new_args.append(args[k])                    
-        new_args = Mul(tuple(new_args))
-                  
-        entry = reduce(lambda x,y : x*y, new_args)   
-                                            
-    return entry
\ No newline at end of file
+        return entry
+    
+    # Scalars and identities are absorbed by the term, and the powers of a 
+    # projector are the projector.
+    factors = []
+    for arg in (entry.args if isinstance(entry, Mul) else (entry,)):
+        if isinstance(arg, (Integer, IdentityOperator)):
+            continue
+        factors.append(arg.base if isinstance(arg, Pow) else arg)
+        
+    labels = [_factor_str(factor) for factor in factors]
+    parties = [0 if label[0] == "A" else 1 for label in labels]
+    groups = None
+    if orthogonal == True:
+        groups = [label.split("_")[0] for label in labels]
+    
+    positions = operator_words.normal_form(labels, parties, groups)
+    if positions is operator_words.ZERO:
+        return Integer(0)
+    return Mul(*[factors[pos] for pos in positions])
+
+
+def adjoint_moment_matrix_entry(entry):
+    '''
+    Returns the adjoint of a simplified entry of the moment matrix. The 
+    operators of each party are reversed, while Alice's operators are kept in
+    front of Bob's operators, so the adjoint is again a simplified entry.
+    '''
+    if not isinstance(entry, Mul):
+        return entry
+    
+    alice_args = []
+    bob_args = []
+    for arg in entry.args:
+        if _factor_str(arg)[0] == "A":
+            alice_args.append(arg)
+        else:
+            bob_args.append(arg)
+            
+    return reduce(lambda x,y : x*y, alice_args[::-1] + bob_args[::-1])
+
+
+def is_orthogonal_product(entry):
+    '''
+    Checks whether an entry contains a product of two distinct measurement
+    operators of the same measurement (the same party and input) next to each
+    other, which vanishes since the operators are orthogonal projectors.
+    '''
+    if not isinstance(entry, Mul):
+        return False
+    
+    factors = [_factor_str(arg) for arg in entry.args]
+    for k in range(len(factors)-1):
+        if factors[k] != factors[k+1] and \
+           factors[k].split("_")[0] == factors[k+1].split("_")[0]:
+            return True
+    return False
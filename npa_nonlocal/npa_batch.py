@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+'''
+#------------------------------------------------------------------------------
+# Name:        npa_batch.py
+# Purpose:     This file contains a non-interactive command line interface
+#              that runs a batch of NPA hierarchy jobs listed in a JSON (or
+#              TOML) job file, e.g. for parameter sweeps on a cluster:
+#
+#                   python npa_batch.py jobs.json --workers 8
+#
+#              A job file looks like:
+#
+#              {"output_dir": "results",
+#               "workers": 4,
+#               "cache": true,
+#               "defaults": {"engine": "word", "short_meas": true},
+#               "jobs": [{"name": "chsh", "inputs": 2, "outputs": 2,
+#                         "level": "1+AB",
+#                         "bell_exp": "A^0_0*B^0_0 + A^0_0*B^1_0 + ...",
+#                         "produce": ["bound", "matlab", "sdpa", "latex"]}]}
+#
+# Author:      npa_nonlocal contributors
+#
+# Created:     10/17/2026
+# Copyright:   (c) npa_nonlocal contributors 2026
+# Licence:     GNU
+#------------------------------------------------------------------------------
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+
+# Installed as a script (see setup.py), this file is not next to its sibling
+# modules, which are then found in the installed npa_nonlocal package.
+try:
+    import npa_io
+except ImportError:
+    import npa_nonlocal
+    sys.path.insert(0, os.path.dirname(os.path.abspath(npa_nonlocal.__file__)))
+    import npa_io
+import npa_sdp
+import npa_cache
+import npa_symmetry
+import moment_matrix
+import bell_violation
+
+try:
+    import toml
+except ImportError:
+    toml = None
+
+# Settings of a job that are not given in the job file or its defaults.
+JOB_DEFAULTS = {"level": "1",
+                "reps": 1,
+                "short_meas": False,
+                "orthogonal_meas": False,
+                "engine": "word",
+                "compact": False,
+                "bell_exp": None,
+                "produce": ["bound"],
+                "solver": None,
+                "tol": 1e-6,
+                "symmetry": False,
+                "tensor_reps": False}
+
+# Files written for each job by the outputs it produces.
+OUTPUT_FILES = {"latex": ".tex",
+                "matlab": ".m",
+                "sdpa": ".dat-s"}
+
+
+def load_job_file(file_name):
+    '''
+    Reads a job file. Files ending in ".toml" are read with the toml package,
+    all other files are read as JSON.
+    '''
+    with open(file_name) as job_file:
+        if file_name.endswith(".toml"):
+            if toml is None:
+                raise ImportError("toml is required to read TOML job files.")
+            return toml.load(job_file)
+        return json.load(job_file)
+
+
+def expand_jobs(job_spec):
+    '''
+    Returns the list of jobs of a job file, where each job is completed by
+    the defaults of the job file and JOB_DEFAULTS. Jobs without a name are
+    named after their scenario.
+    '''
+    jobs = []
+    for k, job_def in enumerate(job_spec.get("jobs", [])):
+        job = dict(JOB_DEFAULTS)
+        job.update(job_spec.get("defaults", {}))
+        job.update(job_def)
+
+        for param in ["inputs", "outputs"]:
+            if param not in job:
+                raise ValueError("Job %d does not give the number of %s." % \
+                                 (k, param))
+        if "name" not in job:
+            job["name"] = "npa_%d_%d_%s_%d" % (job["inputs"], \
+                job["outputs"], str(job["level"]).replace("+", "_"), k)
+
+        for output in job["produce"]:
+            if output not in OUTPUT_FILES and output != "bound":
+                raise ValueError("Unknown output %s of job %s." % \
+                                 (output, job["name"]))
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job, output_dir=".", cache_dir=None):
+    '''
+    Builds the moment matrix of a job and produces its outputs. Returns a
+    dictionary of the results (and time spent) of the job. Errors are
+    recorded in the results, so that one failing job does not stop a batch.
+    '''
+    start_time = time.time()
+    result = {"name": job["name"], "files": []}
+
+    try:
+        cache = None
+        if cache_dir is not None and job["engine"] == "word" and \
+           job["tensor_reps"] != True:
+            cache = npa_cache.MomentMatrixCache(cache_dir)
+
+        M = moment_matrix.MomentMatrix(job["inputs"], job["outputs"], \
+            job["level"], job["reps"], bool_short_meas=job["short_meas"], \
+            engine=job["engine"], bool_orthogonal_meas=job["orthogonal_meas"],\
+            cache=cache, bool_compact_matrix=job["compact"], \
+            bool_tensor_reps=job["tensor_reps"])
+        result["dim"] = M.dim
+        result["time_build"] = time.time() - start_time
+
+        bell_exp = None
+        if job["bell_exp"] is not None:
+            bell_exp = bell_violation.BellViolation(M, job["bell_exp"]).bell_exp
+        
+        # The SDP reduced by the symmetries of the Bell expression (all of 
+        # them for true, or the listed permutations) replaces the SDP of M 
+        # in the bound and the SDPA file.
+        sdp = M
+        if job["symmetry"] != False and bell_exp is not None:
+            group = None if job["symmetry"] == True else job["symmetry"]
+            sdp = npa_symmetry.generate_symmetric_sdp(M, bell_exp, group)
+            result["block_sizes"] = sdp.block_sizes()
+
+        for output in job["produce"]:
+            if output == "bound":
+                if bell_exp is None:
+                    raise ValueError("A Bell expression is needed for the "
+                                     "bound.")
+                solution = npa_sdp.solve_bell_violation(sdp, bell_exp, \
+                    job["solver"], job["tol"])
+                for key in ["bound", "objective", "status", "solver", \
+                            "num_vars", "time_solve"]:
+                    result[key] = solution[key]
+                continue
+
+            file_name = os.path.join(output_dir, job["name"] + \
+                                     OUTPUT_FILES[output])
+            with open(file_name, "w") as out_file:
+                if output == "latex":
+                    out_file.write(npa_io.generate_latex_matrix(M.npa_matrix))
+                elif output == "matlab":
+                    npa_io.write_matlab_script(out_file, M, bell_exp)
+                elif output == "sdpa":
+                    npa_io.write_sdpa(out_file, sdp, bell_exp)
+            result["files"].append(file_name)
+
+    except Exception as error:
+        result["error"] = "%s: %s" % (type(error).__name__, error)
+        result["traceback"] = traceback.format_exc()
+
+    result["time_total"] = time.time() - start_time
+    return result
+
+
+def _run_job_args(args):
+    '''Unpacks the arguments of run_job for Pool.imap.'''
+    return run_job(*args)
+
+
+def run_jobs(jobs, output_dir=".", workers=1, cache_dir=None):
+    '''
+    Runs a list of jobs (see expand_jobs) in a pool of (workers) processes,
+    which share the on-disk cache in cache_dir. Returns the list of results
+    in the order of the jobs.
+    '''
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    args = [(job, output_dir, cache_dir) for job in jobs]
+    if workers <= 1:
+        return [_run_job_args(arg) for arg in args]
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(_run_job_args, args, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    '''
+    Console entry point: runs the jobs of a job file and writes their results
+    to results.json in the output directory. Returns the number of jobs that
+    failed.
+    '''
+    parser = argparse.ArgumentParser(description="Runs a batch of NPA "
+                                     "hierarchy jobs listed in a job file.")
+    parser.add_argument("job_file", help="JSON or TOML job file")
+    parser.add_argument("--workers", type=int, default=None, \
+                        help="number of processes running the jobs")
+    parser.add_argument("--output-dir", default=None, \
+                        help="directory the outputs are written to")
+    parser.add_argument("--cache-dir", default=None, \
+                        help="directory of the shared moment matrix cache")
+    args = parser.parse_args(argv)
+
+    job_spec = load_job_file(args.job_file)
+    jobs = expand_jobs(job_spec)
+
+    output_dir = args.output_dir or job_spec.get("output_dir", ".")
+    workers = args.workers or job_spec.get("workers", 1)
+
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        cache = job_spec.get("cache", False)
+        if cache == True:
+            cache_dir = npa_cache.DEFAULT_CACHE_DIR
+        elif cache:
+            cache_dir = cache
+
+    results = run_jobs(jobs, output_dir, workers, cache_dir)
+
+    with open(os.path.join(output_dir, "results.json"), "w") as out_file:
+        json.dump(results, out_file, indent=2, sort_keys=True)
+
+    num_failed = 0
+    for result in results:
+        if "error" in result:
+            num_failed += 1
+            print ("%s: FAILED (%s)" % (result["name"], result["error"]))
+        elif "bound" in result and result["bound"] is None:
+            print ("%s: no bound, the solver stopped with status %s (dim %d, "
+                   "%.2f s)" % (result["name"], result["status"], \
+                   result["dim"], result["time_total"]))
+        elif "bound" in result:
+            print ("%s: bound %.8f (%s, dim %d, %.2f s)" % (result["name"], \
+                result["bound"], result["status"], result["dim"], \
+                result["time_total"]))
+        else:
+            print ("%s: done (dim %d, %.2f s)" % (result["name"], \
+                result["dim"], result["time_total"]))
+    return num_failed
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+'''
+#------------------------------------------------------------------------------
+# Name:        npa_cache.py
+# Purpose:     This file contains a persistent on-disk cache of moment
+#              matrices built by the integer-word engine, so that scripts do
+#              not rebuild the same matrices from scratch, as well as the
+#              memory-mapped storage of compact moment matrices.
+#
+# Author:      npa_nonlocal contributors
+#
+# Created:     10/17/2026
+# Copyright:   (c) npa_nonlocal contributors 2026
+# Licence:     GNU
+#------------------------------------------------------------------------------
+'''
+
+import os
+import hashlib
+
+import numpy as np
+
+import npa_profile
+import operator_words
+
+# Directory of the cache used when no directory is given.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".npa_nonlocal_cache")
+
+# Size bound of the cache used when no bound is given (in bytes).
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+class MomentMatrixCache(object):
+    """A content-addressed cache of moment matrices on disk.
+
+    Every moment matrix is stored in one .npz file named by its cache key,
+    holding the sequence, the entry-ID matrix (the index of every entry in a
+    table of the distinct entry words) and the equivalence class of every
+    distinct entry word. When the files exceed max_bytes, the least recently
+    used files are evicted.
+
+    Attributes:
+        cache_dir: directory holding the cache files.
+        max_bytes: bound on the total size of the cache files.
+        hits: number of matrices loaded from the cache.
+        misses: number of lookups not found in the cache.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+
+    def path(self, key):
+        '''Path of the cache file of a key.'''
+        return os.path.join(self.cache_dir, key + ".npz")
+
+
+    @npa_profile.profiled("cache_load")
+    def load(self, key, alphabet, compact=False):
+        '''
+        Loads the sequence, moment matrix and equivalence classes stored for
+        a key. Returns None if the key is not in the cache. If "compact" is 
+        True, the moment matrix is loaded as a MomentIdMatrix.
+        '''
+        path = self.path(key)
+        if not os.path.isfile(path):
+            self.misses += 1
+            npa_profile.count("cache.misses")
+            return None
+
+        data = np.load(path)
+        try:
+            result = decode_moment_matrix(data, alphabet, compact)
+        finally:
+            data.close()
+
+        # Mark the file as recently used.
+        os.utime(path, None)
+        self.hits += 1
+        npa_profile.count("cache.hits")
+        return result
+
+
+    @npa_profile.profiled("cache_store")
+    def store(self, key, seq, mat):
+        '''
+        Stores the sequence and moment matrix (WordMatrix) under a key and
+        evicts the least recently used files above the size bound.
+        '''
+        path = self.path(key)
+        # Several processes may share the cache, so every process writes its
+        # own temporary file.
+        tmp_path = "%s.%d.tmp.npz" % (path, os.getpid())
+
+        np.savez_compressed(tmp_path, **encode_moment_matrix(seq, mat))
+        os.rename(tmp_path, path)
+
+        self.evict(keep=path)
+
+
+    def evict(self, keep=None):
+        '''
+        Removes the least recently used cache files until the cache fits in
+        max_bytes. The file (keep) is never removed.
+        '''
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".npz") and not name.endswith(".tmp.npz") and \
+               os.path.isfile(path):
+                stat = os.stat(path)
+                files.append( (stat.st_mtime, stat.st_size, path) )
+
+        total = sum([size for _, size, _ in files])
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+
+    def clear(self):
+        '''Removes all cache files.'''
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+###############################################################################
+def cache_key(num_inputs, num_outputs, npa_level, parallel_reps=1, \
+              short_meas=False, simplified=True, orthogonal=False):
+    '''
+    Cache key of a moment matrix: a hash of the scenario parameters, the
+    simplification flags and the version of the integer-word engine.
+    '''
+    params = (num_inputs, num_outputs, str(npa_level), parallel_reps, \
+              bool(short_meas), bool(simplified), bool(orthogonal), \
+              operator_words.ENGINE_VERSION)
+    return hashlib.sha1(repr(params).encode("utf-8")).hexdigest()
+
+
+def _encode_words(words):
+    '''
+    Flattens a list of words into an array of letters and an array of
+    offsets. ZERO words are marked by a negative length.
+    '''
+    letters = []
+    lengths = []
+    for word in words:
+        if word is operator_words.ZERO:
+            lengths.append(-1)
+        else:
+            letters += word
+            lengths.append(len(word))
+    return np.asarray(letters, dtype=np.int32), \
+           np.asarray(lengths, dtype=np.int32)
+
+
+def _decode_words(letters, lengths):
+    '''Inverse of _encode_words.'''
+    letters = letters.tolist()
+    words = []
+    k = 0
+    for length in lengths.tolist():
+        if length < 0:
+            words.append(operator_words.ZERO)
+        else:
+            words.append(tuple(letters[k:k+length]))
+            k += length
+    return words
+
+
+def encode_moment_matrix(seq, mat):
+    '''
+    Encodes a sequence and its moment matrix (WordMatrix) as a dictionary of
+    numpy arrays.
+    '''
+    n = mat.dim
+
+    word_ids = {}
+    entry_words = []
+    entry_ids = np.empty((n,n), dtype=np.int32)
+    for i in range(n):
+        for j in range(n):
+            word = mat[i,j]
+            if word not in word_ids:
+                word_ids[word] = len(entry_words)
+                entry_words.append(word)
+            entry_ids[i,j] = word_ids[word]
+
+    class_ids = {}
+    word_classes = np.empty(len(entry_words), dtype=np.int32)
+    for k, word in enumerate(entry_words):
+        key = mat.entry_key(word)
+        if key not in class_ids:
+            class_ids[key] = len(class_ids)
+        word_classes[k] = class_ids[key]
+
+    seq_letters, seq_lengths = _encode_words(seq)
+    word_letters, word_lengths = _encode_words(entry_words)
+
+    return {"seq_letters": seq_letters,
+            "seq_lengths": seq_lengths,
+            "word_letters": word_letters,
+            "word_lengths": word_lengths,
+            "entry_ids": entry_ids,
+            "word_classes": word_classes,
+            "flags": np.asarray([mat.simplified, mat.orthogonal])}
+
+
+def decode_moment_matrix(data, alphabet, compact=False):
+    '''
+    Decodes the arrays written by encode_moment_matrix. Returns the sequence
+    (WordSequence), the moment matrix (WordMatrix, or MomentIdMatrix if 
+    "compact" is True), the entry-ID matrix and the equivalence class of 
+    every distinct entry word.
+    '''
+    seq = operator_words.WordSequence( \
+        _decode_words(data["seq_letters"], data["seq_lengths"]), alphabet)
+    entry_words = _decode_words(data["word_letters"], data["word_lengths"])
+    entry_ids = data["entry_ids"]
+    simplified, orthogonal = [bool(x) for x in data["flags"]]
+
+    word_classes = data["word_classes"]
+    if compact == True:
+        mat = _decode_moment_id_matrix(entry_ids, entry_words, word_classes, \
+                                       alphabet, simplified, orthogonal)
+    else:
+        upper = []
+        for i, row in enumerate(entry_ids.tolist()):
+            upper.append([entry_words[k] for k in row[i:]])
+        mat = operator_words.WordMatrix(upper, alphabet, simplified, \
+                                        orthogonal)
+
+    return {"seq": seq,
+            "npa_matrix": mat,
+            "entry_ids": entry_ids,
+            "entry_words": entry_words,
+            "word_classes": word_classes}
+
+
+def _decode_moment_id_matrix(entry_ids, entry_words, word_classes, alphabet,\
+                             simplified, orthogonal):
+    '''
+    Builds the MomentIdMatrix of the entry-ID matrix, the distinct entry 
+    words and their equivalence classes.
+    '''
+    entry_key = operator_words.WordMatrix([], alphabet, simplified, \
+                                          orthogonal).entry_key
+    
+    words = [None] * (int(word_classes.max()) + 1 if len(word_classes) else 0)
+    for word, k in zip(entry_words, word_classes.tolist()):
+        words[k] = entry_key(word)
+    is_canonical = np.asarray([word == words[k] for word, k in \
+                               zip(entry_words, word_classes.tolist())])
+    
+    moment_ids = word_classes[entry_ids]
+    ids = np.where(is_canonical[entry_ids], moment_ids, ~moment_ids)
+    return operator_words.MomentIdMatrix(ids.astype(np.int32), words, \
+        alphabet, simplified, orthogonal)
+
+
+###############################################################################
+def open_moment_ids(path, dim):
+    '''
+    Creates the directory (path) and returns a writable dim x dim int32 
+    memmap that the moment IDs of a compact moment matrix are built into, so 
+    that the matrix does not have to fit in memory. The matrix is completed 
+    by save_moment_ids.
+    '''
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return np.lib.format.open_memmap(os.path.join(path, "ids.tmp.npy"), \
+        mode="w+", dtype=np.int32, shape=(dim, dim))
+
+
+@npa_profile.profiled("mmap_save")
+def save_moment_ids(path, key, seq, mat):
+    '''
+    Saves the sequence and compact moment matrix (MomentIdMatrix) in the 
+    directory (path): the moment IDs as the .npy file "ids.npy", which can be
+    memory-mapped, and the key, sequence and table of canonical words in
+    "words.npz", which is written last. If the moment IDs were built into 
+    the memmap of open_moment_ids, the file is moved in place without a copy
+    and the matrix then maps the saved file read-only.
+    '''
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    ids_path = os.path.join(path, "ids.npy")
+    tmp_path = os.path.join(path, "ids.tmp.npy")
+    
+    if isinstance(mat.ids, np.memmap) and \
+       os.path.abspath(mat.ids.filename) == os.path.abspath(tmp_path):
+        mat.ids.flush()
+        os.rename(tmp_path, ids_path)
+        mat.ids = np.load(ids_path, mmap_mode="r")
+    else:
+        np.save(tmp_path, np.asarray(mat.ids, dtype=np.int32))
+        os.rename(tmp_path, ids_path)
+    
+    seq_letters, seq_lengths = _encode_words(seq)
+    word_letters, word_lengths = _encode_words(mat.words)
+    np.savez(os.path.join(path, "words.tmp.npz"), \
+             key=np.asarray(key), \
+             seq_letters=seq_letters, \
+             seq_lengths=seq_lengths, \
+             word_letters=word_letters, \
+             word_lengths=word_lengths, \
+             flags=np.asarray([mat.simplified, mat.orthogonal]))
+    os.rename(os.path.join(path, "words.tmp.npz"), \
+              os.path.join(path, "words.npz"))
+
+
+@npa_profile.profiled("mmap_load")
+def load_moment_ids(path, key, alphabet, mmap_mode="r"):
+    '''
+    Loads the sequence and compact moment matrix saved in the directory 
+    (path) by save_moment_ids. The moment IDs are memory-mapped (read-only by
+    default), so they are paged in on demand and shared between processes.
+    Returns None if nothing was saved in the directory, and raises a 
+    ValueError if a different moment matrix (key) was saved there.
+    '''
+    words_path = os.path.join(path, "words.npz")
+    if not os.path.isfile(words_path):
+        npa_profile.count("mmap.misses")
+        return None
+    
+    data = np.load(words_path)
+    try:
+        if str(data["key"]) != key:
+            raise ValueError("A different moment matrix is saved in %s." % \
+                             path)
+        seq = operator_words.WordSequence( \
+            _decode_words(data["seq_letters"], data["seq_lengths"]), alphabet)
+        words = _decode_words(data["word_letters"], data["word_lengths"])
+        simplified, orthogonal = [bool(x) for x in data["flags"]]
+    finally:
+        data.close()
+    
+    ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mmap_mode)
+    mat = operator_words.MomentIdMatrix(ids, words, alphabet, simplified, \
+                                        orthogonal)
+    npa_profile.count("mmap.hits")
+    return {"seq": seq, "npa_matrix": mat}
+
+
+def is_saved_moment_ids(path, mat):
+    '''
+    Checks whether the moment IDs of a compact moment matrix are the ones 
+    memory-mapped from the directory (path).
+    '''
+    ids = getattr(mat, "ids", None)
+    return isinstance(ids, np.memmap) and ids.filename is not None and \
+           os.path.abspath(ids.filename) == \
+           os.path.abspath(os.path.join(path, "ids.npy"))
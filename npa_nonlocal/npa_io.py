@@ -5,8 +5,8 @@
 # Purpose:     This file contains functions for various I/O processing. 
 #              Specifically, functionality is provided for: 
 #                   - outputtng large moment matrices to LaTex format
-#                   - user prompt command line functions
 #                   - reading / writing various text / tex files
+#                   - writing MATLAB (CVX) scripts and SDPA sparse files
 #
 # Author:      Vincent Russo (vrusso@cs.uwaterloo.ca)
 #
@@ -22,116 +22,17 @@ import sys
 import math
 import subprocess
 
+import numpy as np
+
 from sympy import MutableDenseMatrix
-from sympy import pprint
 
 import util
+import npa_profile
+import npa_symmetry
 import moment_matrix
 import bell_violation
 
 
-###############################################################################
-#   Prompt functions
-###############################################################################
-
-def disp_main_menu():
-    '''
-    Displays the main menu at prompt
-    '''
-    print (30 * '-')
-    print ("   M A I N - M E N U")
-    print (30 * '-')
-
-    strs = ('Enter 1: Print moment matrix to console. \n'
-    'Enter 2: Generate LaTeX file of moment matrix. \n'
-    'Enter 3: Generate matrix from Bell expression. \n'
-    'Enter 4: Generate MATLAB script. \n'
-    'Enter 5: Enter another matrix.\n'
-    'Enter 6: to exit : ')
-    choice = raw_input(strs)
-    
-    return int(choice) 
-
-
-def disp_prompt():
-    '''
-    TODO FIX MENUS
-    Displays the main prompt / option list to the user. 
-    '''
-
-    print (30 * '-')
-    print ("   NPANONLOCAL ")
-    print (30 * '-')
-    
-    num_inputs = int(raw_input('Enter number of inputs: '))
-    num_outputs = int(raw_input('Enter number of outputs: '))
-    level = str(raw_input('Enter NPA hierarchy level: '))
-    num_reps = int(raw_input('Enter number of repetitions: '))
-
-    ops = moment_matrix.generate_measurement_operators(num_inputs,num_outputs,False,num_reps)
-    seq = moment_matrix.generate_sequence(ops, level)
-
-    is_simp = raw_input('Simplify matrix using properties of measurements? y/n')
-        
-    if is_simp == 'y':
-        M = moment_matrix.generate_moment_matrix(seq)
-    if is_simp == 'n':
-        M = moment_matrix.generate_moment_matrix(seq,False)
-            
-    while True:         
-        choice = disp_main_menu()
-    
-        # Pretty print matrix to console window.
-        if choice == 1:
-            pprint(M)
-            print "Matrix printed!"
-                     
-        # Generate / produce LaTeX script.
-        elif choice == 2:
-            print "Generating LaTeX file..."
-            latex_src = generate_latex_matrix(M)
-            latex_file_name = raw_input("Enter file name for LaTeX file: ")
-            write_file(latex_file_name, ".tex", latex_src)
-            compile_latex_file(latex_file_name)
-            print latex_file_name + ".tex" + " written to " + os.getcwd()
-            
-            # Open the PDF generated
-            #subprocess.Popen(os.getcwd()+"/"+latex_file_name+".pdf",shell=True)
-
-        # Generate Bell matrix constraint matrix.
-        elif choice == 3:
-            print "Generating Bell expression matrix..."
-            
-         
-        # Generate / produce MATLAB script.
-        elif choice == 4:
-            print "Creating MATLAB script... (Depending on the matrix size, this can take a while...)"
-            matlab_script_src = generate_matlab_script(M)
-            matlab_file_name = raw_input("Enter file name for MATLAB script: ")
-            write_file(matlab_file_name, ".m", matlab_script_src)
-            print matlab_file_name + ".m"  + " written to " + os.getcwd()
-
-        # Display enter input / output options again.
-        elif choice == 5:   
-            num_inputs = int(raw_input('Enter number of inputs: '))
-            num_outputs = int(raw_input('Enter number of outputs: '))
-            level = str(raw_input('Enter NPA hierarchy level: '))
-            num_reps = int(raw_input('Enter number of repetitions: '))
-        
-            ops = moment_matrix.generate_measurement_operators(num_inputs,num_outputs,False,num_reps)
-            seq = moment_matrix.generate_sequence(ops, level)
-        
-            is_simp = raw_input('Simplify matrix using properties of measurements? y/n')
-                
-            if is_simp == 'y':
-                M = moment_matrix.generate_moment_matrix(seq)
-            if is_simp == 'n':
-                M = moment_matrix.generate_moment_matrix(seq,False)
-                
-        # Exit / Quit
-        elif choice == 6:
-            break    
-    
 ###############################################################################
 #   File I/O functions
 ###############################################################################
@@ -150,6 +51,7 @@ def write_file(file_name, file_ext, content):
 ###############################################################################
 #   LaTeX functions
 ###############################################################################
+@npa_profile.profiled("export_latex")
 def generate_latex_matrix(mat, \
                           block_mat_format=False, \
                           ref_mat=False, \
@@ -212,6 +114,9 @@ def generate_latex_matrix(mat, \
         start_mat_tag = "\\left(\\begin{array}{" + "c"*dim + "}\n"
         end_mat_tag = "\n \\end{array} \\right) }"
     
+    # Moment matrices of the word engine are materialized as sympy matrices.
+    if hasattr(mat, "to_sympy"):
+        mat = mat.to_sympy()
     mat = MutableDenseMatrix(mat)
            
     # Write the actual matrix in LaTeX format
@@ -274,9 +179,10 @@ def compile_latex_file(latex_file_name):
 
 def convert_python_matrix_to_matlab(mat):
     '''
-    Takes a python matrix and converts it one that can be used in MATLAB.
+    Takes a python matrix (a sympy or numpy matrix, or a moment matrix of 
+    words) and converts it one that can be used in MATLAB.
     '''
-    dim = int(math.sqrt(len(mat))) 
+    dim = mat.shape[0]
     matlab_mat = "[ "
     for i in range(dim):
         if i > 0:
@@ -288,46 +194,222 @@ def convert_python_matrix_to_matlab(mat):
     return matlab_mat
 
 
-def generate_matlab_script(mat, bell_exp="TODO"):
+def generate_matlab_script(mat, bell_exp=None, compact=False):
     '''
     Given a moment matrix and Bell expression, this function writes a MATLAB
-    script that uses CVX to solve the SDP. The script 
+    script that uses CVX to solve the SDP. The script is returned as a 
+    string, see write_matlab_script to stream it to a file instead.
     '''
+    return "".join(iter_matlab_script(mat, bell_exp, compact))
 
-    #matlab_bell_exp = convert_python_matrix_to_matlab(bell_exp)  
-    # TODO Put in Bell expression as well  
+
+@npa_profile.profiled("export_matlab")
+def write_matlab_script(out_file, mat, bell_exp=None, compact=False):
+    '''
+    Streams the MATLAB script of a moment matrix (see iter_matlab_script) to
+    an open file handle, without holding the script in memory.
+    '''
+    for chunk in iter_matlab_script(mat, bell_exp, compact):
+        out_file.write(chunk)
+
+
+def iter_matlab_script(mat, bell_exp=None, compact=False, chunk_size=1000):
+    '''
+    Generator of the lines of a MATLAB script that uses CVX to solve the SDP
+    of a moment matrix (a MomentMatrix, or the matrix itself). The variable 
+    M is symmetric, so only the upper triangle is constrained, and the 
+    entries of each equivalence class are tied together by a chain of k-1 
+    equalities M(a_1) == M(a_2), ..., M(a_k-1) == M(a_k) instead of all the
+    k*(k-1) pairs.
+    
+    If "compact" is True, the constraints are instead written as arrays of 
+    linear indices (in blocks of chunk_size entries) that CVX loads in bulk:
+    every entry is set equal to the first entry of its class.
     
-    output = """
+    If a Bell expression is given, the Bell operator matrix B is written as
+    a sparse matrix holding each coefficient in one entry of its class, and
+    trace(B * M) is maximized. Otherwise the script is a feasibility problem.
+    '''
+    if isinstance(mat, moment_matrix.MomentMatrix):
+        index = mat.generate_moment_index()
+    else:
+        index = moment_matrix.MomentIndex(mat)
+    dim = index.dim
+    
+    yield "dim = %d;\n" % dim
+    if bell_exp is not None:
+        bell_coeffs = index.compile_bell_expression(bell_exp)
+        class_ids = sorted(bell_coeffs.keys())
+        B_rows = [index.rows[index.ptr[k]] + 1 for k in class_ids]
+        B_cols = [index.cols[index.ptr[k]] + 1 for k in class_ids]
+        yield "B = sparse(%s, %s, %s, dim, dim);\n" % \
+            (_matlab_array(B_rows), _matlab_array(B_cols), \
+             _matlab_array([bell_coeffs[k] for k in class_ids]))
+    
+    yield """
     cvx_begin sdp
     \t %#ok<*VUNUS>    % suppress MATLAB warnings for equality checks in CVX
     \t %#ok<*EQEFF>    % suppress MATLAB warnings for inequality checks in CVX 
     \t variable M(dim,dim) semidefinite symmetric
-    \t maximize trace(B * M)      
-    \t subject to 
+"""
+    if bell_exp is not None:
+        yield "    \t maximize trace(B * M)\n"
+    yield """    \t subject to 
     \t \t    % entry M(1,1) = <psi| I I |psi> = 1
     \t \t    M(1,1) == 1;
     """
-    eq_dict = moment_matrix.generate_moment_matrix_equivalence_dict(mat,True)
-    dim = int(math.sqrt(len(mat))) 
     
     # These are the commutation and projection constraints on the moment
-    # matrix entries.
-    for i in range(dim):
-        for j in range(dim):
-            # As long as the entry has more than one equality, loop through
-            # every other equivalent entry.
-            if len(eq_dict[i,j]) > 1:
-                # Set every element in the equivalent dictionary equal 
-                for k in range(len(eq_dict[i,j])):
-                    for l in range(len(eq_dict[i,j])):
-                        if k != l:
-                            # MATLAB indexes matrices starting at "1" instead
-                            # of 0, so make all entries +1:
-                            a = tuple([x+1 for x in eq_dict[i,j][k]])
-                            b = tuple([x+1 for x in eq_dict[i,j][l]])                        
-                            
-                            output += "M" + str(a) + " == " + \
-                                      "M" + str(b) + "; \n"   
-    output += "\n cvx_end \n"
+    # matrix entries. MATLAB indexes matrices starting at "1" instead of 0.
+    entries = []
+    reps = []
+    zeros = []
+    for k in range(index.num_classes):
+        rows, cols = index.positions(k)
+        upper = rows <= cols
+        pos = zip(rows[upper] + 1, cols[upper] + 1)
+        
+        # Entries that vanish by the orthogonality of the measurement 
+        # operators are fixed to 0.
+        if k in index.zero_ids:
+            if compact == True:
+                zeros += pos
+            else:
+                for a in pos:
+                    yield "M" + str(a) + " == 0; \n"
+        elif compact == True:
+            entries += pos[1:]
+            reps += [pos[0]] * (len(pos) - 1)
+        else:
+            for l in range(1, len(pos)):
+                yield "M" + str(pos[l-1]) + " == " + \
+                      "M" + str(pos[l]) + "; \n"
+                      
+        if compact == True and len(entries) + len(zeros) >= chunk_size:
+            for chunk in _iter_matlab_index_constraints(entries, reps, zeros):
+                yield chunk
+            entries, reps, zeros = [], [], []
+    
+    if compact == True:
+        for chunk in _iter_matlab_index_constraints(entries, reps, zeros):
+            yield chunk
+            
+    yield "\n cvx_end \n"
+
+
+def _iter_matlab_index_constraints(entries, reps, zeros):
+    '''
+    Constraints M(entries) == M(reps) and M(zeros) == 0 written with arrays 
+    of linear indices.
+    '''
+    if len(entries) > 0:
+        yield "idx = sub2ind([dim dim], %s, %s);\n" % \
+            (_matlab_array([a[0] for a in entries]), \
+             _matlab_array([a[1] for a in entries]))
+        yield "rep = sub2ind([dim dim], %s, %s);\n" % \
+            (_matlab_array([a[0] for a in reps]), \
+             _matlab_array([a[1] for a in reps]))
+        yield "M(idx) == M(rep); \n"
+    if len(zeros) > 0:
+        yield "idx = sub2ind([dim dim], %s, %s);\n" % \
+            (_matlab_array([a[0] for a in zeros]), \
+             _matlab_array([a[1] for a in zeros]))
+        yield "M(idx) == 0; \n"
+
+
+def _matlab_array(values):
+    '''MATLAB row vector of a list of numbers.'''
+    return "[" + " ".join([str(x) for x in values]) + "]"
+
+
+###############################################################################
+#   SDPA functions
+###############################################################################
+
+def write_sdpa_file(file_name, mat, bell_exp=None):
+    '''
+    Writes the SDP of a moment matrix to the SDPA sparse file (file_name), 
+    see write_sdpa. The extension ".dat-s" is added if it is missing.
+    '''
+    if not file_name.endswith(".dat-s"):
+        file_name += ".dat-s"
+    with open(file_name, 'w') as out_file:
+        write_sdpa(out_file, mat, bell_exp)
+
+
+@npa_profile.profiled("export_sdpa")
+def write_sdpa(out_file, mat, bell_exp=None, chunk_size=10000):
+    '''
+    Streams the SDP of a moment matrix to an open file handle in the SDPA 
+    sparse format (.dat-s). The moment matrix is a MomentMatrix, the matrix 
+    itself, or its AffineMomentMatrix (whose Bell objective is then used). 
+    The entries are written from the sparse affine form in blocks of 
+    chunk_size, so no dense matrix is built. A SymmetricSDP is written with 
+    one SDPA block per block B_i(y) (see write_sdpa_blocks).
+    
+    SDPA solves
+            minimize    c^T x
+            subject to  sum_k x_k F_k - F_0 >= 0,
+    so the moment matrix M(x) = F_0 + sum_k x_k F_k is written with -F_0, and
+    the Bell expression to maximize is written as c = -(Bell coefficients).
+    The constant term of the Bell expression is noted in a comment line.
+    '''
+    if isinstance(mat, npa_symmetry.SymmetricSDP):
+        return write_sdpa_blocks(out_file, mat)
+    if isinstance(mat, moment_matrix.AffineMomentMatrix):
+        affine_mat = mat
+    elif isinstance(mat, moment_matrix.MomentMatrix):
+        affine_mat = mat.generate_affine_moment_matrix(bell_exp)
+    else:
+        affine_mat = moment_matrix.generate_affine_moment_matrix(mat, bell_exp)
+    
+    c = np.zeros(affine_mat.num_vars)
+    c[affine_mat.obj_ids] = -affine_mat.obj_vals
+    
+    out_file.write('"NPA moment matrix SDP: maximize %r + b^T x, where '
+                   'c = -b.\n' % affine_mat.obj_offset)
+    out_file.write("%d = mDIM\n" % affine_mat.num_vars)
+    out_file.write("1 = nBLOCK\n")
+    out_file.write("%d = bLOCKsTRUCT\n" % affine_mat.dim)
+    out_file.write(" ".join(["%r" % x for x in c]) + "\n")
+    
+    # SDPA reads the upper triangle of each (symmetric) block, numbered from
+    # 1, and matrix 0 is F_0.
+    const_upper = affine_mat.const_rows <= affine_mat.const_cols
+    for k in np.flatnonzero(const_upper):
+        out_file.write("0 1 %d %d %r\n" % (affine_mat.const_rows[k] + 1, \
+            affine_mat.const_cols[k] + 1, -affine_mat.const_vals[k]))
+    
+    upper = np.flatnonzero(affine_mat.rows <= affine_mat.cols)
+    upper = upper[np.argsort(affine_mat.var_ids[upper], kind="mergesort")]
+    for block in range(0, len(upper), chunk_size):
+        ind = upper[block:block+chunk_size]
+        out_file.write("".join(["%d 1 %d %d 1\n" % entry for entry in \
+            zip(affine_mat.var_ids[ind] + 1, affine_mat.rows[ind] + 1, \
+                affine_mat.cols[ind] + 1)]))
+
+
+def write_sdpa_blocks(out_file, sym_sdp, tol=1e-12):
+    '''
+    Writes the block-diagonal SDP of a SymmetricSDP to an open file handle in
+    the SDPA sparse format, with the same conventions as write_sdpa: block i
+    holds -Q_i^T F_0 Q_i in matrix 0 and the (dense) Q_i^T F_k Q_i of every 
+    variable y_k. Entries smaller than tol in absolute value are left out.
+    '''
+    sizes = sym_sdp.block_sizes()
+    
+    out_file.write('"NPA moment matrix SDP reduced by %d symmetries: maximize '
+                   '%r + b^T y, where c = -b.\n' % (len(sym_sdp.group or []), \
+                   sym_sdp.obj_offset))
+    out_file.write("%d = mDIM\n" % sym_sdp.num_vars)
+    out_file.write("%d = nBLOCK\n" % len(sizes))
+    out_file.write(" ".join([str(size) for size in sizes]) + " = bLOCKsTRUCT\n")
+    out_file.write(" ".join(["%r" % -x for x in sym_sdp.obj_vals]) + "\n")
     
-    return output 
\ No newline at end of file
+    for block in range(len(sizes)):
+        const, basis = sym_sdp.block_basis_matrices(block)
+        for k, mat in enumerate([-const] + basis):
+            rows, cols = np.nonzero(np.triu(np.abs(mat) > tol))
+            out_file.write("".join(["%d %d %d %d %r\n" % (k, block + 1, \
+                row + 1, col + 1, mat[row, col]) for row, col in \
+                zip(rows, cols)]))
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+'''
+#------------------------------------------------------------------------------
+# Name:        npa_profile.py
+# Purpose:     This file contains opt-in instrumentation of the phases of
+#              building a moment matrix (sequence, moment matrix, equivalence
+#              classes, ...). While a Profiler is active, every phase records
+#              its wall time and CPU time, and the builds count simplifier 
+#              calls and cache hits. Profiler(trace_memory=True) also records
+#              the peak traced memory of every phase where tracemalloc exists
+#              (Python 3), and the peak resident memory of the process 
+#              otherwise:
+#
+#                   with npa_profile.Profiler() as prof:
+#                       M = moment_matrix.MomentMatrix(2, 2, "1+AB")
+#                   prof.report()
+#
+#              or MomentMatrix(..., profiler=prof). When no Profiler is
+#              active, a phase costs one check per call of a phase function
+#              and nothing is counted in the loops over entries.
+#
+# Author:      npa_nonlocal contributors
+#
+# Created:     10/17/2026
+# Copyright:   (c) npa_nonlocal contributors 2026
+# Licence:     GNU
+#------------------------------------------------------------------------------
+'''
+
+import time
+import warnings
+import functools
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# CPU time of the process.
+_cpu_time = getattr(time, "process_time", None) or time.clock
+
+# The active profiler, or None.
+_active = None
+
+
+class Profiler(object):
+    """Collects the metrics of the phases run while it is active.
+
+    Attributes:
+        phases: dictionary mapping each phase name to its number of calls,
+                total wall and CPU time in seconds, and (if memory is traced)
+                the peak traced memory in kB ("peak_alloc_kb") or, without
+                tracemalloc, the peak resident memory of the process in kB 
+                at the end of the phase ("peak_rss_kb"). Times of nested 
+                phases are included in the times of the phases around them.
+        counters: dictionary of event counts, e.g. "simplify.calls" or
+                  "cache.hits" and "cache.misses". Events are counted in 
+                  the process the profiler is active in, so the entries 
+                  simplified by worker processes (workers > 1) are not.
+        callback: function called as callback(name, metrics) at the end of
+                  every phase, with the metrics of that call, e.g. to forward
+                  them to another collector.
+        trace_memory: whether the peak memory of the phases is recorded, 
+                      with tracemalloc or else the resource module. If 
+                      neither is available, a RuntimeWarning is issued and 
+                      no memory is recorded.
+    """
+    def __init__(self, callback=None, trace_memory=False):
+
+        self.phases = {}
+        self.counters = {}
+        self.callback = callback
+        if trace_memory and tracemalloc is None and resource is None:
+            warnings.warn("Neither tracemalloc nor resource is available, "
+                          "the memory of the phases is not recorded.", \
+                          RuntimeWarning)
+            trace_memory = False
+        self.trace_memory = trace_memory
+        self._trace_alloc = trace_memory and tracemalloc is not None
+
+        self._previous = []
+        self._started_tracing = False
+        # Running peak of the traced memory of every open phase.
+        self._peaks = []
+
+
+    def __enter__(self):
+        global _active
+        self._previous.append(_active)
+        _active = self
+
+        if self._trace_alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        global _active
+        _active = self._previous.pop()
+
+        if self._started_tracing and len(self._previous) == 0:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+
+    def start_phase(self):
+        '''
+        Starts timing a phase. Returns the state passed to end_phase.
+        '''
+        if self._trace_alloc:
+            # The peak so far belongs to the phases around this one.
+            if len(self._peaks) > 0:
+                self._peaks[-1] = max(self._peaks[-1], \
+                                      tracemalloc.get_traced_memory()[1])
+            _reset_peak()
+            self._peaks.append(0)
+        return time.time(), _cpu_time()
+
+
+    def end_phase(self, name, state):
+        '''
+        Records a phase started by start_phase.
+        '''
+        wall_start, cpu_start = state
+        metrics = {"wall": time.time() - wall_start,
+                   "cpu": _cpu_time() - cpu_start}
+
+        if self._trace_alloc:
+            peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+            if len(self._peaks) > 0:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            _reset_peak()
+            metrics["peak_alloc_kb"] = peak // 1024
+        elif self.trace_memory:
+            metrics["peak_rss_kb"] = \
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = dict.fromkeys(metrics, 0)
+            phase["calls"] = 0
+        phase["calls"] += 1
+        phase["wall"] += metrics["wall"]
+        phase["cpu"] += metrics["cpu"]
+        for key in ["peak_alloc_kb", "peak_rss_kb"]:
+            if key in metrics:
+                phase[key] = max(phase[key], metrics[key])
+
+        if self.callback is not None:
+            self.callback(name, metrics)
+
+
+    def count(self, name, n=1):
+        '''Adds (n) to the counter (name).'''
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def hit_rate(self, name):
+        '''
+        Fraction of hits of the counters (name).hits and (name).misses, or
+        None if neither was counted.
+        '''
+        hits = self.counters.get(name + ".hits", 0)
+        total = hits + self.counters.get(name + ".misses", 0)
+        if total == 0:
+            return None
+        return float(hits) / total
+
+
+    def report(self):
+        '''
+        The phases, counters and hit rates collected, as a dictionary.
+        '''
+        hit_names = set([name[:-len(".hits")] for name in self.counters \
+                         if name.endswith(".hits")] + \
+                        [name[:-len(".misses")] for name in self.counters \
+                         if name.endswith(".misses")])
+        return {"phases": dict((name, dict(phase)) for name, phase in \
+                               self.phases.items()),
+                "counters": dict(self.counters),
+                "hit_rates": dict((name, self.hit_rate(name)) \
+                                  for name in hit_names)}
+
+
+    def reset(self):
+        '''Clears the phases and counters collected.'''
+        self.phases = {}
+        self.counters = {}
+
+
+###############################################################################
+def _reset_peak():
+    '''Resets the peak of the traced memory, where tracemalloc can.'''
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+def active():
+    '''The active Profiler, or None.'''
+    return _active
+
+
+def activate(profiler):
+    '''
+    Context manager activating (profiler), or doing nothing if it is None.
+    '''
+    if profiler is None:
+        return _NO_PROFILER
+    return profiler
+
+
+def count(name, n=1):
+    '''Adds (n) to the counter (name) of the active Profiler, if any.'''
+    if _active is not None:
+        _active.count(name, n)
+
+
+def profiled(name):
+    '''
+    Decorator recording every call of a function as the phase (name) of the
+    active Profiler. Without an active Profiler, the function is called
+    directly.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return func(*args, **kwargs)
+            state = profiler.start_phase()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.end_phase(name, state)
+        return wrapper
+    return decorator
+
+
+class _NoProfiler(object):
+    '''Context manager of activate(None).'''
+    def __enter__(self):
+        return None
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NO_PROFILER = _NoProfiler()
@@ -3,16 +3,364 @@
 #------------------------------------------------------------------------------
 # Name:        npa_sdp.py
 # Purpose:     This script computes the NPA hierarchy of semidefinite programs
-#              described in [1]. 
+#              described in [1].
 #
 # Author:      Vincent Russo (vrusso@cs.uwaterloo.ca)
 #
-# References: [1] Navascues, M. and Pironio, S. and A. Acin. A convergent 
-#                 hierarchy of semidefinite programs characterizing the set of 
-#                 quantum correlations. New Journal of Physics, 2008, 073013. 
+# References: [1] Navascues, M. and Pironio, S. and A. Acin. A convergent
+#                 hierarchy of semidefinite programs characterizing the set of
+#                 quantum correlations. New Journal of Physics, 2008, 073013.
 #
 # Created:     1/11/2015
 # Copyright:   (c) Vincent Russo 2015
 # Licence:     GNU
 #------------------------------------------------------------------------------
 '''
+
+import time
+import warnings
+
+import numpy as np
+
+import npa_profile
+import npa_symmetry
+import moment_matrix
+
+try:
+    import cvxpy
+    import scipy.sparse
+except ImportError:
+    cvxpy = None
+
+
+def solve_bell_violation(mom_mat, bell_exp=None, solver=None, tol=1e-6, \
+                         max_iters=20000, symmetry=None):
+    '''
+    Computes the upper bound on the quantum value of a Bell expression given
+    by the level of the NPA hierarchy of a moment matrix, i.e. the SDP
+            maximize    c_0 + c^T x
+            subject to  M(x) = F_0 + sum_k x_k F_k >= 0.
+    The SDP is solved in-process, so no MATLAB script is generated.
+
+        mom_mat: a MomentMatrix, or an AffineMomentMatrix or SymmetricSDP 
+        whose Bell objective is already set (in which case bell_exp is not 
+        needed).
+
+        solver: "cvxpy" uses a locally installed cvxpy, "admm" uses the
+        built-in numpy first-order solver (solve_affine_sdp). By default
+        cvxpy is used when it is installed.
+
+        symmetry: reduce the SDP of a MomentMatrix by symmetries of the Bell 
+        expression (see npa_symmetry.generate_symmetric_sdp): True for its
+        full invariance group among the relabelings of the scenario, or a 
+        list of symmetries. The variables x of the result are then those of 
+        the (unreduced) moment matrix.
+
+    The result is a dictionary holding the bound, the status and solver, the
+    optimal variables x and the time spent building and solving the SDP. The
+    bound is None unless the SDP was solved to optimality (status 
+    "optimal"), see solver_result.
+    '''
+    start_time = time.time()
+
+    if isinstance(mom_mat, (moment_matrix.AffineMomentMatrix, \
+                            npa_symmetry.SymmetricSDP)):
+        affine_mat = mom_mat
+    else:
+        affine_mat = mom_mat.generate_affine_moment_matrix(bell_exp)
+        if symmetry is not None and symmetry is not False:
+            group = None if symmetry == True else symmetry
+            affine_mat = npa_symmetry.generate_symmetric_sdp(mom_mat, \
+                group=group, affine_mat=affine_mat)
+    build_time = time.time() - start_time
+
+    if solver is None:
+        solver = "cvxpy" if cvxpy is not None else "admm"
+
+    symmetric = isinstance(affine_mat, npa_symmetry.SymmetricSDP)
+    if solver == "cvxpy" and symmetric:
+        result = solve_symmetric_sdp_cvxpy(affine_mat)
+    elif solver == "cvxpy":
+        result = solve_affine_sdp_cvxpy(affine_mat)
+    elif solver == "admm" and symmetric:
+        result = solve_symmetric_sdp(affine_mat, tol, max_iters)
+    elif solver == "admm":
+        result = solve_affine_sdp(affine_mat, tol, max_iters)
+    else:
+        raise ValueError("Unknown SDP solver: %s" % solver)
+    
+    if symmetric:
+        result["block_sizes"] = affine_mat.block_sizes()
+        if result["x"] is not None:
+            result["x"] = affine_mat.lift(result["x"])
+
+    result["time_build"] = build_time
+    result["time_total"] = time.time() - start_time
+    result["dim"] = affine_mat.dim
+    result["num_vars"] = affine_mat.num_vars
+    return result
+
+
+def solver_result(sdp, x, status, solver, **info):
+    '''
+    The result of a solver for the SDP (sdp) with the variables x and the
+    status of the solver. The "objective" of x is the "bound" only if the 
+    status is "optimal", and the bound is None otherwise (with a warning),
+    as an iterate that did not converge bounds nothing. The variables are 
+    None if the solver returned none, e.g. for an infeasible SDP.
+    '''
+    objective = None
+    if x is not None:
+        objective = sdp.evaluate_objective(x)
+    
+    bound = objective if status == "optimal" else None
+    if bound is None:
+        warnings.warn("The %s solver stopped with status %s, so the SDP gives"
+                      " no bound." % (solver, status), RuntimeWarning)
+    
+    result = {"bound": bound,
+              "objective": objective,
+              "status": status,
+              "solver": solver,
+              "x": x}
+    result.update(info)
+    return result
+
+
+def _cvxpy_result(sdp, problem, var, start_time):
+    '''
+    The result of a cvxpy problem with the variables (var) of the SDP (sdp).
+    The status is checked before the variables are read, as they have no 
+    value unless the problem was solved. cvxpy's "optimal_inaccurate" is 
+    not taken to be optimal.
+    '''
+    x = None
+    if problem.status in [cvxpy.OPTIMAL, cvxpy.OPTIMAL_INACCURATE] and \
+       var.value is not None:
+        x = np.asarray(var.value).flatten()
+    return solver_result(sdp, x, problem.status, "cvxpy", iterations=None, \
+                         time_solve=time.time() - start_time)
+
+
+@npa_profile.profiled("sdp_solve")
+def solve_affine_sdp(affine_mat, tol=1e-6, max_iters=20000, rho=1.0):
+    '''
+    Built-in numpy solver of the SDP
+            maximize c_0 + c^T x  subject to  M(x) >= 0
+    by the alternating direction method of multipliers on the splitting
+    M(x) = Y, Y >= 0. Since every entry of M(x) holds at most one variable,
+    the x-update is an average over the entries of each variable, and the
+    Y-update is the projection onto the PSD cone by an eigendecomposition.
+    The penalty rho is adapted to balance the primal and dual residuals.
+    '''
+    start_time = time.time()
+
+    n = affine_mat.dim
+    m = affine_mat.num_vars
+    rows, cols, var_ids = affine_mat.rows, affine_mat.cols, affine_mat.var_ids
+
+    counts = np.bincount(var_ids, minlength=m).astype(np.float64)
+    c = np.zeros(m)
+    c[affine_mat.obj_ids] = affine_mat.obj_vals
+
+    const_mat = np.zeros((n,n))
+    const_mat[affine_mat.const_rows, affine_mat.const_cols] = \
+        affine_mat.const_vals
+
+    x = np.zeros(m)
+    Y = const_mat.copy()
+    U = np.zeros((n,n))
+    status = "max_iters"
+
+    for iteration in range(1, max_iters + 1):
+        # Minimize -c^T x + rho/2 ||M(x) - Y + U||^2 over x.
+        Z = Y - U
+        x = (np.bincount(var_ids, weights=Z[rows, cols], minlength=m) + \
+             c / rho) / counts
+        Mx = const_mat.copy()
+        Mx[rows, cols] = x[var_ids]
+
+        # Project M(x) + U onto the cone of PSD matrices.
+        Y_old = Y
+        W = Mx + U
+        eig_vals, eig_vecs = np.linalg.eigh((W + W.T) / 2)
+        Y = (eig_vecs * np.maximum(eig_vals, 0)).dot(eig_vecs.T)
+
+        R = Mx - Y
+        U += R
+
+        primal_res = np.linalg.norm(R)
+        dual_res = rho * np.linalg.norm(Y - Y_old)
+        eps_primal = tol * (1 + max(np.linalg.norm(Mx), np.linalg.norm(Y)))
+        eps_dual = tol * (1 + rho * np.linalg.norm(U))
+        if primal_res < eps_primal and dual_res < eps_dual:
+            status = "optimal"
+            break
+
+        if primal_res > 10 * dual_res:
+            rho *= 2
+            U /= 2
+        elif dual_res > 10 * primal_res:
+            rho /= 2
+            U *= 2
+
+    return solver_result(affine_mat, x, status, "admm", \
+        iterations=iteration, primal_residual=primal_res, \
+        dual_residual=dual_res, time_solve=time.time() - start_time)
+
+
+@npa_profile.profiled("sdp_solve")
+def solve_affine_sdp_cvxpy(affine_mat):
+    '''
+    Solves the SDP of an AffineMomentMatrix with a locally installed cvxpy.
+    '''
+    if cvxpy is None:
+        raise ImportError("cvxpy is required for the cvxpy SDP solver.")
+
+    start_time = time.time()
+
+    n = affine_mat.dim
+    m = affine_mat.num_vars
+
+    # vec(M(x)) = f_0 + A x, where cvxpy vectorizes matrices column-wise.
+    basis = scipy.sparse.csr_matrix( \
+        (np.ones(len(affine_mat.var_ids)), \
+         (affine_mat.rows + n * affine_mat.cols, affine_mat.var_ids)), \
+        shape=(n * n, m))
+    const_vec = np.zeros(n * n)
+    const_vec[affine_mat.const_rows + n * affine_mat.const_cols] = \
+        affine_mat.const_vals
+
+    c = np.zeros(m)
+    c[affine_mat.obj_ids] = affine_mat.obj_vals
+
+    # The "*" matrix product of older cvxpy versions is deprecated, and the
+    # default order of reshape changes, so both are spelled out.
+    x = cvxpy.Variable(m)
+    mat = cvxpy.reshape(cvxpy.matmul(basis, x) + const_vec, (n, n), \
+                        order="F")
+    problem = cvxpy.Problem(cvxpy.Maximize(cvxpy.sum(cvxpy.multiply(c, x))),\
+                            [mat >> 0])
+    problem.solve()
+    return _cvxpy_result(affine_mat, problem, x, start_time)
+
+
+@npa_profile.profiled("sdp_solve")
+def solve_symmetric_sdp(sym_sdp, tol=1e-6, max_iters=20000, rho=1.0):
+    '''
+    Built-in numpy solver of the SDP of a SymmetricSDP
+            maximize c_0 + c^T y  subject to  B_i(y) >= 0  for every block i,
+    by the same iteration as solve_affine_sdp, restricted to the invariant 
+    matrices: the splitting is B_i(y) = Y_i, and every matrix is held by its
+    blocks, whose norms are weighed by their multiplicities d_i. The 
+    y-update solves for the sums over the entries of the orbits of 
+    Y - U, which are those of sum_i d_i Q_i (Y_i - U_i) Q_i^T, and the 
+    projection onto the PSD cone is done block by block.
+    
+    The blocks are computed from the precomputed linear maps of 
+    SymmetricSDP.block_maps, or, if these are too large, by transforming 
+    the dim x dim matrices with the bases Q_i.
+    '''
+    start_time = time.time()
+
+    m = sym_sdp.num_vars
+    rows, cols, var_ids = sym_sdp.rows, sym_sdp.cols, sym_sdp.var_ids
+    blocks, mults = sym_sdp.blocks, sym_sdp.block_mults
+    sizes = sym_sdp.block_sizes()
+    
+    counts = np.bincount(var_ids, minlength=m).astype(np.float64)
+    c = sym_sdp.obj_vals
+
+    maps = sym_sdp.block_maps()
+    if maps is not None:
+        const_vec, basis = maps
+        weights = np.repeat(mults, np.square(sizes)).astype(np.float64)
+        splits = np.cumsum(np.square(sizes))[:-1]
+        
+        def forward(y):
+            return [vec.reshape(s, s) for vec, s in \
+                    zip(np.split(const_vec + y.dot(basis), splits), sizes)]
+        def orbit_sums(mats):
+            return basis.dot(weights * np.concatenate([mat.ravel() \
+                                                       for mat in mats]))
+    else:
+        const_mat = sym_sdp.evaluate(np.zeros(m))
+        
+        def forward(y):
+            mat = const_mat.copy()
+            mat[rows, cols] = y[var_ids]
+            return [Q.T.dot(mat).dot(Q) for Q in blocks]
+        def orbit_sums(mats):
+            mat = sum([d * Q.dot(mat).dot(Q.T) for Q, d, mat in \
+                       zip(blocks, mults, mats)])
+            return np.bincount(var_ids, weights=mat[rows, cols], minlength=m)
+
+    def norm(mats):
+        return np.sqrt(sum([d * np.linalg.norm(mat)**2 \
+                            for d, mat in zip(mults, mats)]))
+
+    y = np.zeros(m)
+    Y = forward(y)
+    U = [np.zeros(Y_i.shape) for Y_i in Y]
+    status = "max_iters"
+
+    for iteration in range(1, max_iters + 1):
+        # Minimize -c^T y + rho/2 sum_i d_i ||B_i(y) - Y_i + U_i||^2 over y.
+        y = (orbit_sums([Y_i - U_i for Y_i, U_i in zip(Y, U)]) + \
+             c / rho) / counts
+        B = forward(y)
+
+        # Project every B_i(y) + U_i onto the cone of PSD matrices.
+        Y_old = Y
+        Y = []
+        for B_i, U_i in zip(B, U):
+            W = B_i + U_i
+            eig_vals, eig_vecs = np.linalg.eigh((W + W.T) / 2)
+            Y.append((eig_vecs * np.maximum(eig_vals, 0)).dot(eig_vecs.T))
+
+        R = [B_i - Y_i for B_i, Y_i in zip(B, Y)]
+        U = [U_i + R_i for U_i, R_i in zip(U, R)]
+
+        primal_res = norm(R)
+        dual_res = rho * norm([Y_i - Y_old_i for Y_i, Y_old_i in zip(Y, Y_old)])
+        eps_primal = tol * (1 + max(norm(B), norm(Y)))
+        eps_dual = tol * (1 + rho * norm(U))
+        if primal_res < eps_primal and dual_res < eps_dual:
+            status = "optimal"
+            break
+
+        if primal_res > 10 * dual_res:
+            rho *= 2
+            U = [U_i / 2 for U_i in U]
+        elif dual_res > 10 * primal_res:
+            rho /= 2
+            U = [U_i * 2 for U_i in U]
+
+    return solver_result(sym_sdp, y, status, "admm", iterations=iteration, \
+        primal_residual=primal_res, dual_residual=dual_res, \
+        time_solve=time.time() - start_time)
+
+
+@npa_profile.profiled("sdp_solve")
+def solve_symmetric_sdp_cvxpy(sym_sdp):
+    '''
+    Solves the SDP of a SymmetricSDP with a locally installed cvxpy, with 
+    one PSD constraint per block.
+    '''
+    if cvxpy is None:
+        raise ImportError("cvxpy is required for the cvxpy SDP solver.")
+
+    start_time = time.time()
+
+    y = cvxpy.Variable(sym_sdp.num_vars)
+    constraints = []
+    for k in range(len(sym_sdp.blocks)):
+        const, basis = sym_sdp.block_basis_matrices(k)
+        block = const + sum([cvxpy.multiply(y[j], F) \
+                             for j, F in enumerate(basis)])
+        constraints.append((block + block.T) / 2 >> 0)
+
+    objective = cvxpy.sum(cvxpy.multiply(sym_sdp.obj_vals, y))
+    problem = cvxpy.Problem(cvxpy.Maximize(objective), constraints)
+    problem.solve()
+    return _cvxpy_result(sym_sdp, problem, y, start_time)
@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+'''
+#------------------------------------------------------------------------------
+# Name:        npa_symmetry.py
+# Purpose:     This file contains the symmetry reduction of the SDP of a moment
+#              matrix. The relabelings of a scenario (swapping the parties,
+#              relabeling their inputs and outputs) that leave a Bell
+#              expression invariant act on the sequence by permutations, so
+#              the optimal moment matrix may be taken to be invariant [1]:
+#
+#                - the variables of an orbit of moments are merged into one,
+#                - in a symmetry-adapted basis Q, the invariant moment matrix
+#                  is block diagonal, Q^T M(x) Q = diag(B_1(x), B_2(x), ...),
+#                  where a block repeated d times is kept once.
+#
+#              The SDP then only asks for the (small) blocks B_i(x) to be
+#              positive semidefinite:
+#
+#                   sdp = npa_symmetry.generate_symmetric_sdp(M, bell_exp)
+#                   npa_sdp.solve_bell_violation(sdp)
+#
+#              The basis is computed numerically from random invariant
+#              matrices, as in [2], and verified before it is used.
+#
+# Author:      npa_nonlocal contributors
+#
+# References: [1] Gatermann, K. and P. A. Parrilo. Symmetry groups,
+#                 semidefinite programs, and sums of squares. Journal of Pure
+#                 and Applied Algebra, 2004, 192(1-3), 95-128.
+#             [2] Murota, K. and Kanno, Y. and Kojima, M. and S. Kojima. A
+#                 numerical algorithm for block-diagonal decomposition of
+#                 matrix *-algebras with application to semidefinite
+#                 programming. Japan Journal of Industrial and Applied
+#                 Mathematics, 2010, 27(1), 125-160.
+#
+# Created:     10/17/2026
+# Copyright:   (c) npa_nonlocal contributors 2026
+# Licence:     GNU
+#------------------------------------------------------------------------------
+'''
+
+import numpy as np
+
+import npa_profile
+import moment_matrix
+import operator_words
+
+# Largest group generate_group enumerates.
+MAX_GROUP_SIZE = 100000
+
+# Largest number of entries of the dense linear maps of the blocks (see 
+# SymmetricSDP.block_maps) that are precomputed.
+MAX_MAP_SIZE = 2**25
+
+# Relative tolerance of the eigenvalues taken to be equal, and of the
+# verification of the symmetry-adapted basis.
+EIG_TOL = 1e-8
+
+
+class SymmetricSDP(object):
+    """The SDP of an AffineMomentMatrix reduced by a group of symmetries of
+    its Bell objective:
+            maximize    c_0 + c^T y
+            subject to  B_i(y) = Q_i^T M(y) Q_i >= 0  for every block i,
+    where the variables y are the orbits of the variables x of the moment
+    matrix M(x), and the columns of the Q_i form a symmetry-adapted basis.
+
+    Attributes:
+        affine_mat: the AffineMomentMatrix that is reduced.
+        dim: dimension of the moment matrix.
+        group: the symmetries (permutations of the alphabet) the SDP is
+               reduced by.
+        num_vars: number of variables y, i.e. orbits of variables x.
+        var_orbits: for every variable x_k, the index of its orbit.
+        rows, cols, var_ids: coordinates of the entries holding a variable
+                             and the index of its orbit.
+        obj_vals: the Bell objective c over the orbits (dense).
+        obj_offset: constant term of the Bell objective, c_0.
+        blocks: the bases Q_i of the blocks, as dim x size_i arrays.
+        block_mults: the number of times d_i that every block is repeated in
+                     Q^T M(y) Q, so that ||M||^2 = sum_i d_i ||B_i||^2.
+    """
+    def __init__(self, affine_mat, seq_perms, group=None, seed=0):
+
+        self.affine_mat = affine_mat
+        self.dim = affine_mat.dim
+        self.group = group
+
+        self.var_orbits = _variable_orbits(affine_mat, seq_perms)
+        self.num_vars = int(self.var_orbits.max()) + 1 \
+                        if len(self.var_orbits) > 0 else 0
+
+        self.rows = affine_mat.rows
+        self.cols = affine_mat.cols
+        self.var_ids = self.var_orbits[affine_mat.var_ids]
+
+        self.obj_vals = np.zeros(self.num_vars)
+        np.add.at(self.obj_vals, self.var_orbits[affine_mat.obj_ids], \
+                  affine_mat.obj_vals)
+        self.obj_offset = affine_mat.obj_offset
+
+        self.blocks, self.block_mults = symmetry_adapted_basis(self.dim, \
+            seq_perms, np.random.RandomState(seed))
+
+
+    def block_sizes(self):
+        '''The sizes of the blocks B_i.'''
+        return [Q.shape[1] for Q in self.blocks]
+
+
+    def evaluate(self, y):
+        '''Returns the dense numpy matrix M(y) for the variables y.'''
+        return self.affine_mat.evaluate(self.lift(y))
+
+
+    def evaluate_blocks(self, y):
+        '''Returns the list of the blocks B_i(y).'''
+        mat = self.evaluate(y)
+        return [Q.T.dot(mat).dot(Q) for Q in self.blocks]
+
+
+    def lift(self, y):
+        '''The variables x of the moment matrix for the variables y.'''
+        return np.asarray(y, dtype=np.float64)[self.var_orbits]
+
+
+    def evaluate_objective(self, y):
+        '''Returns the value c_0 + c^T y of the Bell objective.'''
+        return self.obj_offset + np.dot(self.obj_vals, y)
+
+
+    def block_basis_matrices(self, block):
+        '''
+        Returns the constant matrix Q_i^T F_0 Q_i of a block and the list of
+        its (dense) basis matrices Q_i^T F_k Q_i of every variable y_k.
+        '''
+        Q = self.blocks[block]
+        const = Q[self.affine_mat.const_rows].T.dot( \
+            Q[self.affine_mat.const_cols] * \
+            self.affine_mat.const_vals[:, np.newaxis])
+
+        order = np.argsort(self.var_ids, kind="mergesort")
+        splits = np.searchsorted(self.var_ids[order], \
+                                 np.arange(1, self.num_vars))
+        return const, [Q[self.rows[ind]].T.dot(Q[self.cols[ind]]) \
+                       for ind in np.split(order, splits)]
+
+
+    def block_maps(self, max_size=MAX_MAP_SIZE):
+        '''
+        The blocks as one dense linear map of the variables: returns the 
+        vector const and the num_vars x (sum_i size_i^2) matrix maps such 
+        that const + y^T maps is the concatenation of the flattened blocks 
+        B_i(y). Returns None if maps would have more than max_size entries.
+        '''
+        size = self.num_vars * sum([s**2 for s in self.block_sizes()])
+        if size > max_size:
+            return None
+
+        consts = []
+        maps = []
+        for block in range(len(self.blocks)):
+            const, basis = self.block_basis_matrices(block)
+            consts.append(const.ravel())
+            maps.append(np.asarray([F.ravel() for F in basis]).reshape( \
+                self.num_vars, const.size))
+        return np.concatenate(consts), np.hstack(maps)
+
+
+###############################################################################
+def scenario_symmetries(alphabet):
+    '''
+    Generators of the group of relabelings of the scenario of an
+    OperatorAlphabet: swapping the parties, swapping two (consecutive)
+    inputs of a party, and swapping two (consecutive) outputs of a
+    measurement. For short measurements, the output that is left out is
+    kept. The symmetries are permutations of the codes of the alphabet, see
+    relabeling.
+    '''
+    measurements = {}
+    for label in alphabet.labels:
+        party, x, a = _split_label(label)
+        measurements.setdefault((party, x), []).append(a)
+
+    generators = [relabeling(alphabet, swap_parties=True)]
+    for party in ["A", "B"]:
+        inputs = sorted([x for p, x in measurements if p == party])
+        for x, x_next in zip(inputs, inputs[1:]):
+            generators.append(relabeling(alphabet, \
+                inputs={party: {x: x_next, x_next: x}}))
+        for x in inputs:
+            outputs = sorted(measurements[(party, x)])
+            for a, a_next in zip(outputs, outputs[1:]):
+                generators.append(relabeling(alphabet, \
+                    outputs={(party, x): {a: a_next, a_next: a}}))
+    return generators
+
+
+def relabeling(alphabet, swap_parties=False, inputs=None, outputs=None):
+    '''
+    The symmetry of a scenario that relabels inputs and outputs, and swaps
+    the parties if swap_parties is True, as the permutation of the codes of
+    an OperatorAlphabet mapping code k to perm[k].
+
+        inputs: maps a party ("A" or "B") to a dictionary relabeling its
+                inputs, e.g. {"A": {"0": "1", "1": "0"}}.
+        outputs: maps a party and input, e.g. ("A", "0"), to a dictionary
+                 relabeling the outputs of that measurement.
+
+    Labels that are not given are kept, and the inputs and outputs are
+    relabeled before the parties are swapped. Raises a ValueError if the
+    relabeling does not permute the operators of the alphabet, e.g. if it
+    relabels the output that short measurements leave out.
+    '''
+    inputs = inputs or {}
+    outputs = outputs or {}
+
+    perm = []
+    for label in alphabet.labels:
+        party, x, a = _split_label(label)
+        a = outputs.get((party, x), {}).get(a, a)
+        x = inputs.get(party, {}).get(x, x)
+        if swap_parties == True:
+            party = "B" if party == "A" else "A"
+        image = "%s^%s_%s" % (party, x, a)
+        if image not in alphabet.codes:
+            raise ValueError("The relabeling maps %s to %s, which is not a "
+                             "measurement operator." % (label, image))
+        perm.append(alphabet.codes[image])
+
+    if len(set(perm)) != len(perm):
+        raise ValueError("The relabeling is not a permutation of the "
+                         "measurement operators.")
+    return tuple(perm)
+
+
+def _split_label(label):
+    '''Splits a label, e.g. "A^0_1", into its party, input and output.'''
+    x, a = label[2:].split("_")
+    return label[0], x, a
+
+
+def compose(perm_1, perm_2):
+    '''The symmetry applying perm_2 and then perm_1.'''
+    return tuple([perm_1[k] for k in perm_2])
+
+
+def generate_group(generators, max_size=MAX_GROUP_SIZE):
+    '''
+    Lists the elements of the group generated by symmetries (permutations
+    of the same alphabet). Raises a ValueError if the group has more than
+    max_size elements.
+    '''
+    generators = [tuple(g) for g in generators]
+    if len(generators) == 0:
+        return []
+
+    identity = tuple(range(len(generators[0])))
+    group = [identity]
+    seen = set(group)
+    for g in group:
+        for h in generators:
+            gh = compose(h, g)
+            if gh not in seen:
+                if len(group) == max_size:
+                    raise ValueError("The group has more than %d elements; "
+                                     "give fewer symmetries." % max_size)
+                seen.add(gh)
+                group.append(gh)
+    return group
+
+
+def generating_set(group):
+    '''
+    A (small) subset of the elements of a group that generates it, picked
+    greedily in the order of the elements.
+    '''
+    generators = []
+    span = set()
+    for g in group:
+        if g not in span and g != tuple(range(len(g))):
+            generators.append(g)
+            span = set(generate_group(generators))
+    return generators
+
+
+def map_word(word, perm, alphabet, orthogonal=False):
+    '''
+    The image of a word under a symmetry, in normal form (see
+    operator_words.simplify_word).
+    '''
+    if word is operator_words.ZERO:
+        return word
+    meas_groups = alphabet.meas_groups if orthogonal == True else None
+    return operator_words.simplify_word(tuple([perm[k] for k in word]), \
+                                        alphabet.num_alice, meas_groups)
+
+
+def sequence_words(mom_mat):
+    '''
+    Returns the OperatorAlphabet of a MomentMatrix and its sequence as words
+    in normal form, for either engine. The relabelings of the scenario do not
+    act on the words of parallel repetitions with a product structure, for 
+    which a ValueError is raised.
+    '''
+    if isinstance(mom_mat.meas_ops, operator_words.TensorAlphabet):
+        raise ValueError("Moment matrices of parallel repetitions with a "
+                         "product structure cannot be reduced by symmetry.")
+    if mom_mat.engine == "word":
+        return mom_mat.meas_ops, list(mom_mat.seq)
+
+    alphabet = operator_words.OperatorAlphabet(mom_mat.num_inputs, \
+        mom_mat.num_outputs, mom_mat.bool_short_meas, mom_mat.parallel_reps)
+    meas_groups = alphabet.meas_groups \
+                  if mom_mat.bool_orthogonal_meas == True else None
+    words = []
+    for op in mom_mat.seq:
+        word = operator_words.IDENTITY
+        if not isinstance(op, moment_matrix.IdentityOperator):
+            word = operator_words.simplify_word(alphabet.word_from_sympy(op),\
+                alphabet.num_alice, meas_groups)
+        words.append(word)
+    return alphabet, words
+
+
+def sequence_permutation(words, perm, alphabet, orthogonal=False):
+    '''
+    The permutation p of the indices of a sequence (of words in normal form)
+    by a symmetry, i.e. the symmetry maps the word i to the word p[i].
+    Raises a ValueError if the sequence is not mapped onto itself.
+    '''
+    index = dict((word, i) for i, word in enumerate(words))
+    seq_perm = np.zeros(len(words), dtype=np.int64)
+    for i, word in enumerate(words):
+        image = map_word(word, perm, alphabet, orthogonal)
+        if image not in index:
+            raise ValueError("The sequence is not closed under the symmetry "
+                             "%s." % (perm,))
+        seq_perm[i] = index[image]
+    return seq_perm
+
+
+def objective_words(affine_mat, words, alphabet, orthogonal=False):
+    '''
+    The Bell objective of an AffineMomentMatrix as a dictionary mapping the
+    canonical word (see operator_words.canonical_word) of every variable to
+    its coefficient.
+    '''
+    var_ids, first = np.unique(affine_mat.var_ids, return_index=True)
+    positions = dict(zip(var_ids, first))
+
+    meas_groups = alphabet.meas_groups if orthogonal == True else None
+    coeffs = {}
+    for k, coeff in zip(affine_mat.obj_ids, affine_mat.obj_vals):
+        pos = positions[k]
+        word = operator_words.simplify_word(operator_words.adjoint_word( \
+            words[affine_mat.rows[pos]]) + words[affine_mat.cols[pos]], \
+            alphabet.num_alice, meas_groups)
+        coeffs[operator_words.canonical_word(word, alphabet.num_alice)] = \
+            coeff
+    return coeffs
+
+
+def is_invariant(coeffs, perm, alphabet, orthogonal=False, tol=1e-9):
+    '''
+    Whether a symmetry leaves a Bell objective (see objective_words)
+    invariant, i.e. maps every term to a term of the same coefficient.
+    '''
+    for word, coeff in coeffs.items():
+        image = operator_words.canonical_word(map_word(word, perm, \
+            alphabet, orthogonal), alphabet.num_alice)
+        if abs(coeffs.get(image, 0.0) - coeff) > tol:
+            return False
+    return True
+
+
+def find_invariance_group(mom_mat, affine_mat, generators=None, \
+                          max_size=MAX_GROUP_SIZE):
+    '''
+    The elements of the group generated by (generators), by default the
+    relabelings of the scenario (see scenario_symmetries), that leave the
+    Bell objective of the AffineMomentMatrix of a MomentMatrix invariant and
+    map its sequence onto itself. These elements form a group.
+    '''
+    alphabet, words = sequence_words(mom_mat)
+    orthogonal = mom_mat.bool_orthogonal_meas
+    if generators is None:
+        generators = scenario_symmetries(alphabet)
+
+    coeffs = objective_words(affine_mat, words, alphabet, orthogonal)
+    index = set(words)
+    group = []
+    for perm in generate_group(generators, max_size):
+        if is_invariant(coeffs, perm, alphabet, orthogonal) and \
+           all([map_word(word, perm, alphabet, orthogonal) in index \
+                for word in words]):
+            group.append(perm)
+    return group
+
+
+@npa_profile.profiled("symmetry_reduction")
+def generate_symmetric_sdp(mom_mat, bell_exp=None, group=None, \
+                           affine_mat=None, seed=0):
+    '''
+    Reduces the SDP of a MomentMatrix and a Bell expression by a group of
+    symmetries of the Bell expression and returns the SymmetricSDP.
+
+        group: the symmetries (permutations of the alphabet, see relabeling)
+               to reduce by. By default, the full invariance group among the
+               relabelings of the scenario (see find_invariance_group).
+               Raises a ValueError if a symmetry does not leave the Bell
+               expression invariant or does not map the sequence onto itself.
+        affine_mat: the AffineMomentMatrix of the moment matrix, if it was
+                    already generated (with its Bell objective).
+        seed: seed of the random invariant matrices the symmetry-adapted
+              basis is computed from.
+    '''
+    if affine_mat is None:
+        affine_mat = mom_mat.generate_affine_moment_matrix(bell_exp)
+
+    alphabet, words = sequence_words(mom_mat)
+    orthogonal = mom_mat.bool_orthogonal_meas
+    if group is None:
+        group = find_invariance_group(mom_mat, affine_mat)
+    else:
+        group = [tuple(perm) for perm in group]
+        coeffs = objective_words(affine_mat, words, alphabet, orthogonal)
+        for perm in group:
+            if not is_invariant(coeffs, perm, alphabet, orthogonal):
+                raise ValueError("The symmetry %s does not leave the Bell "
+                                 "expression invariant." % (perm,))
+
+    seq_perms = [sequence_permutation(words, perm, alphabet, orthogonal) \
+                 for perm in generating_set(group)]
+    return SymmetricSDP(affine_mat, seq_perms, group, seed)
+
+
+def _variable_orbits(affine_mat, seq_perms):
+    '''
+    For every variable of an AffineMomentMatrix, the index of its orbit
+    under the permutations of the sequence. Raises a ValueError if the
+    permutations do not map the moment matrix onto itself.
+    '''
+    n = affine_mat.dim
+
+    # Variable of every entry, -1 for the identity and -2 for zero entries.
+    var_mat = np.zeros((n, n), dtype=np.int64) - 2
+    var_mat[affine_mat.const_rows, affine_mat.const_cols] = -1
+    var_mat[affine_mat.rows, affine_mat.cols] = affine_mat.var_ids
+
+    images = []
+    for seq_perm in seq_perms:
+        image_mat = var_mat[np.ix_(seq_perm, seq_perm)]
+        if not np.array_equal(image_mat < 0, var_mat < 0) or \
+           not np.array_equal(image_mat == -1, var_mat == -1):
+            raise ValueError("The symmetry does not map the moment matrix "
+                             "onto itself.")
+        images.append(image_mat[affine_mat.rows, affine_mat.cols])
+
+    if len(images) == 0:
+        return np.arange(affine_mat.num_vars)
+    return _connected_components(affine_mat.num_vars, \
+        np.tile(affine_mat.var_ids, len(images)), np.concatenate(images))
+
+
+def _connected_components(num_nodes, ends_1, ends_2):
+    '''
+    Labels the connected components of the graph on num_nodes nodes with
+    the edges (ends_1[k], ends_2[k]) by 0, 1, ... in the order of their
+    smallest nodes.
+    '''
+    labels = np.arange(num_nodes)
+    while True:
+        # Every node takes the smallest label of its neighbors, and the
+        # labels are then followed to their roots.
+        low = np.minimum(labels[ends_1], labels[ends_2])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, ends_1, low)
+        np.minimum.at(new_labels, ends_2, low)
+        while True:
+            roots = new_labels[new_labels]
+            if np.array_equal(roots, new_labels):
+                break
+            new_labels = roots
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def _random_invariant_matrix(pair_orbits, rng):
+    '''
+    A random symmetric matrix that is invariant under the permutations of
+    the sequence, i.e. constant on the orbits of the pairs of indices.
+    '''
+    mat = rng.randn(pair_orbits.max() + 1)[pair_orbits]
+    return mat + mat.T
+
+
+def symmetry_adapted_basis(dim, seq_perms, rng=None):
+    '''
+    Computes a symmetry-adapted basis of the permutations of a sequence
+    (of length dim) numerically [2]:
+
+      - the eigenspaces of a random invariant matrix X_1 are irreducible
+        invariant subspaces,
+      - the eigenspaces coupled by a second random invariant matrix X_2 are
+        copies of the same irreducible representation, and form an
+        (isotypic) block of every invariant matrix,
+      - the m copies of dimension d of a block are matched by X_2, so that
+        the block is d copies of an m x m block B_i, which is kept once.
+
+    Each block is verified on a third random invariant matrix: the
+    eigenvalues of the reduced block, repeated d times, must be those of the
+    isotypic block. Otherwise (e.g. for representations that are not of
+    real type), the isotypic block is kept whole. Returns the list of the
+    bases Q_i (dim x m_i arrays) and the list of multiplicities d_i.
+    '''
+    if rng is None:
+        rng = np.random.RandomState(0)
+    if len(seq_perms) == 0:
+        return [np.eye(dim)], [1]
+
+    # Orbits of the pairs (i,j) of indices, i.e. the positions of the matrix.
+    pairs = np.arange(dim * dim)
+    images = [(seq_perm[:, np.newaxis] * dim + seq_perm).ravel() \
+              for seq_perm in seq_perms]
+    pair_orbits = _connected_components(dim * dim, \
+        np.tile(pairs, len(images)), np.concatenate(images)).reshape(dim, dim)
+
+    X_1, X_2, X_3 = [_random_invariant_matrix(pair_orbits, rng) \
+                     for k in range(3)]
+
+    # Eigenspaces of X_1.
+    eig_vals, eig_vecs = np.linalg.eigh(X_1)
+    scale = max(1.0, np.abs(eig_vals).max())
+    space_ids = np.concatenate([[0], np.cumsum(np.diff(eig_vals) > \
+                                               EIG_TOL * scale)])
+    num_spaces = space_ids[-1] + 1
+
+    # Eigenspaces coupled by X_2, i.e. with a nonzero block of X_2.
+    coupling = np.zeros((num_spaces, num_spaces))
+    np.add.at(coupling, (space_ids[:, np.newaxis], space_ids), \
+              eig_vecs.T.dot(X_2).dot(eig_vecs)**2)
+    ends_1, ends_2 = np.nonzero(np.sqrt(coupling) > \
+                                EIG_TOL * np.linalg.norm(X_2))
+    comp_ids = _connected_components(num_spaces, ends_1, ends_2)[space_ids]
+
+    blocks = []
+    block_mults = []
+    for comp in range(comp_ids.max() + 1):
+        spaces = [eig_vecs[:, space_ids == s] for s in \
+                  np.unique(space_ids[comp_ids == comp])]
+        basis, mult = _reduce_isotypic_block(spaces, X_2, X_3)
+        blocks.append(basis)
+        block_mults.append(mult)
+
+    # The blocks hold all of X_3, i.e. ||X_3||^2 = sum_i d_i ||B_i||^2, or
+    # no block diagonalization is done.
+    norm = sum([mult * np.linalg.norm(Q.T.dot(X_3).dot(Q))**2 \
+                for Q, mult in zip(blocks, block_mults)])
+    if abs(norm - np.linalg.norm(X_3)**2) > \
+       np.sqrt(EIG_TOL) * np.linalg.norm(X_3)**2:
+        return [np.eye(dim)], [1]
+    return blocks, block_mults
+
+
+def _reduce_isotypic_block(spaces, X_2, X_3):
+    '''
+    Reduces an isotypic block, given by the bases of its (irreducible)
+    eigenspaces, to one copy of its m x m block by matching a vector of the
+    first eigenspace in every eigenspace with X_2. Returns the basis and the
+    multiplicity of the block, or the whole isotypic block (multiplicity 1)
+    if the reduced block is not verified on X_3.
+    '''
+    full_basis = np.hstack(spaces)
+    d = spaces[0].shape[1]
+    if d == 1 or any([space.shape[1] != d for space in spaces]):
+        return full_basis, 1
+
+    u = spaces[0][:, 0]
+    vectors = [u]
+    for space in spaces[1:]:
+        v = space.dot(space.T.dot(X_2.dot(u)))
+        norm = np.linalg.norm(v)
+        if norm < np.sqrt(EIG_TOL):
+            return full_basis, 1
+        vectors.append(v / norm)
+    basis = np.column_stack(vectors)
+
+    full_eigs = np.linalg.eigvalsh(full_basis.T.dot(X_3).dot(full_basis))
+    block_eigs = np.sort(np.repeat(np.linalg.eigvalsh( \
+        basis.T.dot(X_3).dot(basis)), d))
+    scale = max(1.0, np.abs(full_eigs).max())
+    if np.abs(full_eigs - block_eigs).max() > np.sqrt(EIG_TOL) * scale:
+        return full_basis, 1
+    return basis, d
@@ -0,0 +1,1019 @@
+# -*- coding: utf-8 -*-
+'''
+#------------------------------------------------------------------------------
+# Name:        operator_words.py
+# Purpose:     This file contains an integer-word engine for the measurement
+#              operators, sequences and moment matrices introduced in [1].
+#              Every measurement operator is stored as a small integer and
+#              every monomial as a tuple of integers (a "word"). Sympy
+#              objects are only produced on request for display purposes.
+#
+# Author:      npa_nonlocal contributors
+#
+# References: [1] Navascues, M. and Pironio, S. and A. Acin. A convergent
+#                 hierarchy of semidefinite programs characterizing the set of
+#                 quantum correlations. New Journal of Physics, 2008, 073013.
+#
+# Created:     10/17/2026
+# Copyright:   (c) npa_nonlocal contributors 2026
+# Licence:     GNU
+#------------------------------------------------------------------------------
+'''
+
+import itertools
+
+import numpy as np
+
+import util
+import npa_profile
+
+# Version of the integer-word engine. It is part of the keys of the on-disk
+# cache of moment matrices, so it must be increased whenever a change to the
+# engine changes the sequences or moment matrices it produces.
+ENGINE_VERSION = 2
+
+# The identity operator is the empty word.
+IDENTITY = ()
+
+# Intermediate steps of a level of the hierarchy, e.g. "1+AB" or "2+A+B".
+# Any other word of the letters "A" and "B" is a custom step adding the 
+# monomials of that form, e.g. "1+AAB".
+LEVEL_STEPS = ["A", "B", "AB"]
+
+# Products of orthogonal projectors (e.g. A_a^x A_a'^x for a != a') vanish.
+# Such a word simplifies to ZERO.
+ZERO = None
+
+
+class OperatorAlphabet(list):
+    """The measurement operators of Alice and Bob encoded as integers.
+
+    The alphabet is a list of single-letter words, so it may be handed to
+    generate_sequence in place of a list of sympy measurement operators. The
+    integer codes follow the same (sorted) order as the sympy operators, so
+    all of Alice's operators come before all of Bob's operators.
+
+    Attributes:
+        num_inputs: number of inputs for Alice and Bob.
+        num_outputs: number of outputs for Alice and Bob.
+        parallel_reps: number of parallel repetitions.
+        short_meas: whether the shorter form of measurements is used.
+        labels: operator labels (e.g. "A^0_1") indexed by integer code.
+        num_alice: number of operators belonging to Alice. Codes below
+                   num_alice are Alice's, the remaining codes are Bob's.
+        meas_groups: for each code, the index of the measurement (party and
+                     input) the operator belongs to. Operators of the same
+                     measurement are pair-wise orthogonal projectors.
+    """
+    def __init__(self, num_inputs, num_outputs, short_meas=False, \
+                 parallel_reps=1):
+
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.parallel_reps = parallel_reps
+        self.short_meas = short_meas
+
+        self._set_labels(generate_measurement_labels(num_inputs, \
+                            num_outputs, short_meas, parallel_reps))
+
+        super(OperatorAlphabet, self).__init__( \
+            [(k,) for k in range(len(self.labels))])
+
+
+    def _set_labels(self, labels):
+        '''
+        Numbers the operator labels in sorted order, and sets the parties and
+        measurement groups of the codes.
+        '''
+        self.labels = sorted(labels)
+        self.codes = dict((label, k) for k, label in enumerate(self.labels))
+        self.num_alice = len([x for x in self.labels if x[0] == "A"])
+
+        meas_names = [label.split("_")[0] for label in self.labels]
+        group_ids = dict((name, k) for k, name in \
+                         enumerate(sorted(set(meas_names))))
+        self.meas_groups = [group_ids[name] for name in meas_names]
+
+        self._sympy_ops = None
+
+
+    def sympy_operators(self):
+        '''
+        Returns the sympy operators corresponding to the integer codes. They
+        are created on first use only.
+        '''
+        if self._sympy_ops is None:
+            from sympy.physics.quantum import HermitianOperator
+
+            self._sympy_ops = []
+            for label in self.labels:
+                meas_op = HermitianOperator(label)
+                meas_op.is_commutative = False
+                self._sympy_ops.append(HermitianOperator(meas_op))
+        return self._sympy_ops
+
+
+    def to_sympy(self, word):
+        '''
+        Converts a word into the corresponding sympy product of measurement
+        operators. The empty word is the identity operator.
+        '''
+        if word is ZERO:
+            from sympy.core.numbers import Integer
+            return Integer(0)
+        if len(word) == 0:
+            from sympy.physics.quantum import IdentityOperator
+            return IdentityOperator()
+
+        ops = self.sympy_operators()
+        return reduce(lambda x,y : x*y, [ops[k] for k in word])
+
+
+    def word_from_sympy(self, term):
+        '''
+        Converts a sympy product of measurement operators (e.g. a term of a
+        Bell expression) into a word. Numbers are taken to be the identity.
+        '''
+        return tuple([self.codes[label] for label in \
+                      self.term_labels(term)])
+
+
+    def term_labels(self, term):
+        '''
+        The labels of the measurement operators of a sympy product, in order
+        and repeated by their powers. Numbers are left out.
+        '''
+        from sympy import Mul, Pow, Symbol
+        from sympy.physics.quantum import HermitianOperator
+
+        factors = term.args if isinstance(term, Mul) else (term,)
+
+        labels = []
+        for factor in factors:
+            power = 1
+            if isinstance(factor, Pow):
+                factor, power = factor.base, int(factor.exp)
+            if factor.is_number:
+                continue
+            while isinstance(factor, HermitianOperator):
+                factor = factor.args[0]
+            if not isinstance(factor, Symbol) or factor.name not in self.codes:
+                raise ValueError("%s is not a measurement operator of the "
+                                 "alphabet." % factor)
+            labels += [factor.name] * power
+        return labels
+
+
+    def word_to_str(self, word):
+        '''
+        String form of a word, e.g. "A^0_0*B^1_0". The empty word is "I".
+        '''
+        if word is ZERO:
+            return "0"
+        if len(word) == 0:
+            return "I"
+        return "*".join([self.labels[k] for k in word])
+
+
+class TensorAlphabet(OperatorAlphabet):
+    """The measurement operators of Alice and Bob in parallel repetitions of
+    a scenario, kept as products of the operators of the single rounds.
+
+    An operator of the repeated scenario, e.g. A^01_10, is the product
+    A^0_1 (x) A^1_0 of operators of the rounds, where the operators of
+    different rounds commute. Its word is the tuple of its words per round,
+    ((c_0,), (c_1,)) for the codes c_r of its factors in round_alphabet, and
+    the product of two words is the tuple of their products per round. The
+    labels, codes and sympy operators are the ones of the repeated scenario,
+    so Bell expressions of the repeated scenario are written as usual.
+
+    Only strategies that measure every round separately have operators of
+    this form, see MomentMatrix.
+
+    Attributes:
+        round_alphabet: the OperatorAlphabet of a single round.
+        round_codes: for each code, the codes of its factors per round.
+        identity: the identity word, the empty word of every round.
+    """
+    def __init__(self, num_inputs, num_outputs, short_meas=False, \
+                 parallel_reps=1):
+
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.parallel_reps = parallel_reps
+        self.short_meas = short_meas
+
+        self.round_alphabet = OperatorAlphabet(num_inputs, num_outputs, \
+                                               short_meas)
+        round_labels = self.round_alphabet.labels
+
+        # The products of the operators of a party in every round. With the
+        # shorter form of measurements, the rounds leave out the operator of
+        # their last output.
+        factors = {}
+        for party in ["A", "B"]:
+            party_labels = [x for x in round_labels if x[0] == party]
+            for prod in itertools.product(party_labels, \
+                                          repeat=parallel_reps):
+                meas = [x[2:].split("_") for x in prod]
+                label = party + "^" + "".join([x for x, _ in meas]) + "_" +\
+                        "".join([a for _, a in meas])
+                factors[label] = tuple([self.round_alphabet.codes[x] \
+                                        for x in prod])
+
+        self._set_labels(factors.keys())
+        self.round_codes = [factors[label] for label in self.labels]
+        self.identity = (IDENTITY,) * parallel_reps
+
+        list.__init__(self, [tuple([(c,) for c in codes]) \
+                             for codes in self.round_codes])
+
+
+    def to_sympy(self, word):
+        '''
+        Converts a word into the tensor product of the sympy products of its
+        rounds.
+        '''
+        if word is ZERO:
+            from sympy.core.numbers import Integer
+            return Integer(0)
+        from sympy.physics.quantum import TensorProduct
+
+        return TensorProduct(*[self.round_alphabet.to_sympy(x) for x in word])
+
+
+    def word_from_sympy(self, term):
+        '''
+        Converts a sympy product of measurement operators of the repeated
+        scenario into a word, i.e. the products of their factors per round.
+        '''
+        rounds = [[] for _ in range(self.parallel_reps)]
+        for label in self.term_labels(term):
+            for r, code in enumerate(self.round_codes[self.codes[label]]):
+                rounds[r].append(code)
+        return tuple([tuple(x) for x in rounds])
+
+
+    def word_to_str(self, word):
+        '''
+        String form of a word, e.g. "A^0_0*B^1_0 (x) I".
+        '''
+        if word is ZERO:
+            return "0"
+        return " (x) ".join([self.round_alphabet.word_to_str(x) \
+                             for x in word])
+
+
+class WordSequence(list):
+    """A sequence of words for a level of the NPA hierarchy.
+
+    Attributes:
+        alphabet: the OperatorAlphabet the words are built from.
+    """
+    def __init__(self, words, alphabet):
+        super(WordSequence, self).__init__(words)
+        self.alphabet = alphabet
+
+
+    def to_sympy(self):
+        '''Converts the sequence into a list of sympy operators.'''
+        return [self.alphabet.to_sympy(word) for word in self]
+
+
+class TensorSequence(WordSequence):
+    """The sequence of a level for a TensorAlphabet: the tensor power of the
+    sequence of a single round, i.e. every tuple of one word of round_seq per
+    round, in the order of itertools.product.
+
+    Attributes:
+        round_seq: the WordSequence of a single round.
+    """
+    def __init__(self, words, alphabet, round_seq):
+        super(TensorSequence, self).__init__(words, alphabet)
+        self.round_seq = round_seq
+
+
+class WordMatrix(object):
+    """A moment matrix whose entries are words.
+
+    Since M(j,i) is the adjoint of M(i,j), only the upper triangle of the 
+    matrix is stored and the entries below the diagonal are derived from it on
+    access. Entries are accessed as M[i,j] like a sympy matrix, and len(M) is 
+    the number of entries so that existing functions relying on 
+    int(math.sqrt(len(M))) for the dimension keep working.
+
+    Attributes:
+        upper: list of rows, where row i holds the words M(i,j) for j >= i.
+        alphabet: the OperatorAlphabet the words are built from.
+        simplified: whether the entries are simplified words.
+        orthogonal: whether products of orthogonal projectors are ZERO.
+        dim: dimension of the (square) matrix.
+    """
+    def __init__(self, upper, alphabet, simplified=True, orthogonal=False):
+        self.upper = upper
+        self.alphabet = alphabet
+        self.simplified = simplified
+        self.orthogonal = orthogonal
+        self.dim = len(upper)
+
+
+    def __len__(self):
+        return self.dim * self.dim
+
+
+    def __getitem__(self, key):
+        i, j = key
+        if i <= j:
+            return self.upper[i][j-i]
+        return self.adjoint_entry(self.upper[j][i-j])
+
+
+    @property
+    def shape(self):
+        return (self.dim, self.dim)
+
+
+    def adjoint_entry(self, word):
+        '''
+        The adjoint of an entry, i.e. M(j,i) for the entry M(i,j).
+        '''
+        if self.simplified == True:
+            return simplify_word(adjoint_word(word), self.alphabet.num_alice)
+        return adjoint_word(word)
+
+
+    def entry_key(self, word):
+        '''
+        Canonical key of an entry. Two entries are equivalent if and only if 
+        their keys are equal.
+        '''
+        if self.simplified == True:
+            return canonical_word(word, self.alphabet.num_alice)
+        return min(word, adjoint_word(word))
+
+
+    def normal_word(self, word):
+        '''
+        The word in the form of the entries of the matrix: its normal form 
+        (see simplify_word) if the entries are simplified.
+        '''
+        if self.simplified == True:
+            meas_groups = None
+            if self.orthogonal == True:
+                meas_groups = self.alphabet.meas_groups
+            word = simplify_word(word, self.alphabet.num_alice, meas_groups)
+        return word
+
+
+    def term_key(self, term):
+        '''
+        Canonical key of the entries equal to a sympy product of measurement
+        operators, e.g. a term of a Bell expression.
+        '''
+        return self.entry_key(self.normal_word( \
+                                  self.alphabet.word_from_sympy(term)))
+
+
+    def to_sympy(self):
+        '''Materializes the matrix as a sympy matrix for display.'''
+        from sympy.matrices import zeros
+
+        n = self.dim
+        mat = zeros(n,n)
+        for i in range(n):
+            for j in range(n):
+                mat[i,j] = self.alphabet.to_sympy(self[i,j])
+        return mat
+
+
+class MomentIdMatrix(WordMatrix):
+    """A moment matrix stored as an n x n int32 numpy array of moment IDs and
+    a table of the unique canonical words, one per moment (equivalence class
+    of entries). An entry is only materialized as a word when it is accessed,
+    so the matrix takes 4 bytes per entry and supports vectorized operations
+    on the IDs. It is accessed like a WordMatrix.
+
+    Attributes:
+        ids: n x n int32 array, where ids[i,j] = k if M(i,j) is the word 
+             words[k], and ids[i,j] = ~k = -k-1 if M(i,j) is the adjoint of
+             words[k].
+        words: the canonical word of every moment.
+        self_adjoint: whether the canonical word of every moment is its own
+                      adjoint.
+    """
+    def __init__(self, ids, words, alphabet, simplified=True, \
+                 orthogonal=False, self_adjoint=None):
+        self.ids = ids
+        self.words = words
+        self.alphabet = alphabet
+        self.simplified = simplified
+        self.orthogonal = orthogonal
+        self.dim = len(ids)
+        
+        if self_adjoint is None:
+            self_adjoint = [self.adjoint_entry(word) == word for word in words]
+        self.self_adjoint = self_adjoint
+
+
+    def __getitem__(self, key):
+        k = int(self.ids[key])
+        if k >= 0:
+            return self.words[k]
+        return self.adjoint_entry(self.words[~k])
+
+
+    def moment_ids(self):
+        '''
+        The moment ID of every entry as an n x n int32 array. Two entries are
+        equivalent if and only if their moment IDs are equal.
+        '''
+        return np.where(self.ids < 0, ~self.ids, self.ids)
+
+
+class TensorMomentIdMatrix(MomentIdMatrix):
+    """The MomentIdMatrix of a TensorSequence, whose words are tuples of
+    simplified words per round (see simplify_tensor_word). It is computed
+    from the moment matrix of a single round, see
+    generate_tensor_moment_matrix.
+
+    Attributes:
+        round_matrix: the MomentIdMatrix of the sequence of a single round.
+    """
+    def __init__(self, ids, words, alphabet, orthogonal=False, \
+                 self_adjoint=None, round_matrix=None):
+        super(TensorMomentIdMatrix, self).__init__(ids, words, alphabet, \
+            True, orthogonal, self_adjoint)
+        self.round_matrix = round_matrix
+
+
+    def adjoint_entry(self, word):
+        '''
+        The adjoint of an entry, i.e. the adjoints of its rounds.
+        '''
+        return simplify_tensor_word(adjoint_tensor_word(word), \
+                                    self.alphabet.round_alphabet.num_alice)
+
+
+    def entry_key(self, word):
+        '''
+        Canonical key of an entry, see canonical_tensor_word.
+        '''
+        return canonical_tensor_word(word, \
+                                     self.alphabet.round_alphabet.num_alice)
+
+
+    def normal_word(self, word):
+        '''
+        The normal form of a word of the repeated scenario, see 
+        simplify_tensor_word.
+        '''
+        round_alphabet = self.alphabet.round_alphabet
+        meas_groups = None
+        if self.orthogonal == True:
+            meas_groups = round_alphabet.meas_groups
+        return simplify_tensor_word(word, round_alphabet.num_alice, \
+                                    meas_groups)
+
+
+###############################################################################
+def generate_measurement_labels(num_inputs, num_outputs, short_meas=False, \
+                                parallel_reps=1):
+    '''
+    Labels of the measurement operators for Alice and Bob, following the same
+    conventions as moment_matrix.generate_measurement_operators.
+    '''
+    labels = []
+
+    basis_in = util.list_2_str(range(num_inputs)).replace(" ", "")
+    basis_out = util.list_2_str(range(num_outputs)).replace(" ", "")
+
+    meas_labels_in = util.generate_bit_strings(parallel_reps, basis_in)
+    meas_labels_out = util.generate_bit_strings(parallel_reps, basis_out)
+
+    # Shorter form of measurements are generated. The measurement operators
+    # of each input sum to the identity, so the operator of the last output is
+    # determined by the others and is left out.
+    if short_meas == True:
+        meas_labels_out = meas_labels_out[:-1]
+
+    for label_in in meas_labels_in:
+        for label_out in meas_labels_out:
+            labels.append("A^" + label_in + "_" + label_out)
+            labels.append("B^" + label_in + "_" + label_out)
+
+    return labels
+
+
+def parse_level(level):
+    '''
+    Splits a level of the hierarchy into its integer part and the list of
+    intermediate steps, e.g. "1+A+AB" becomes (1, ["A", "AB"]). Raises a 
+    ValueError if the level is not a positive integer, or a positive integer
+    followed by intermediate steps "A", "B", "AB" or custom steps (words of 
+    the letters "A" and "B", e.g. "AAB").
+    '''
+    if hasattr(level, "split"):
+        l_str = [x.strip() for x in level.split('+')]
+        if not l_str[0].isdigit():
+            raise ValueError("Invalid level %s of the hierarchy." % level)
+        npa_level, inter_med = int(l_str[0]), l_str[1:]
+    else:
+        npa_level, inter_med = int(level), []
+        if npa_level != level:
+            raise ValueError("Invalid level %s of the hierarchy." % level)
+    
+    if npa_level < 1:
+        raise ValueError("The level of the hierarchy must be at least 1.")
+    for step in inter_med:
+        if len(step) == 0 or step.strip("AB") != "":
+            raise ValueError("Invalid intermediate step %s of level %s, the "
+                             "steps are %s or words of A and B." % (step, \
+                             level, ", ".join(LEVEL_STEPS)))
+    return npa_level, inter_med
+
+
+def generate_sequence(alphabet, level, orthogonal=False):
+    '''
+    Integer-word counterpart of moment_matrix.generate_sequence. The words are
+    generated in exactly the same order as the sympy sequence (see 
+    generate_sequence_words), and the identity (empty word) is placed at the 
+    front of the sequence.
+
+    If "orthogonal" is True, the words that are zero by the orthogonality of
+    the measurement operators are dropped as well. The sequence of a 
+    TensorAlphabet is a TensorSequence, see generate_tensor_sequence.
+    '''
+    if isinstance(alphabet, TensorAlphabet):
+        return generate_tensor_sequence(alphabet, level, orthogonal)
+
+    num_alice = alphabet.num_alice
+    meas_groups = alphabet.meas_groups if orthogonal == True else None
+
+    seq = generate_sequence_words(alphabet, level, num_alice, \
+        lambda x, y: x + y, \
+        lambda word: simplify_word(word, num_alice, meas_groups))
+    return WordSequence([IDENTITY] + seq, alphabet)
+
+
+def generate_tensor_sequence(alphabet, level, orthogonal=False):
+    '''
+    The sequence of a level for a TensorAlphabet: the tensor power of the 
+    sequence of the level of a single round. Every product of at most l 
+    operators of the repeated scenario is a tuple of products of at most l
+    operators per round, so the sequence contains (up to simplification) the
+    sequence of level l of the repeated scenario, and the same holds for the
+    intermediate and custom steps.
+    '''
+    round_seq = generate_sequence(alphabet.round_alphabet, level, orthogonal)
+    return TensorSequence(list(itertools.product(round_seq, \
+        repeat=alphabet.parallel_reps)), alphabet, round_seq)
+
+
+def generate_sequence_words(ops, level, num_alice, multiply, normal):
+    '''
+    Generates the sequence of a level from the measurement operators (ops), 
+    of which the first num_alice are Alice's, for either engine: multiply 
+    gives the product of two entries and normal the normal form of an entry
+    (ZERO if it vanishes). The identity is not included.
+    
+    Every level below the integer part appends the products of pairs of 
+    entries of the sequence so far, the first half of which is taken to be
+    Alice's and the second Bob's: "A" the products of two entries of the 
+    first half, "B" of the second half and "AB" of one of each. A custom 
+    step, e.g. "AAB", appends the products of Alice's and Bob's operators in
+    that form (in any order of its letters, as the parties commute).
+    
+    The normal forms of the entries are kept in a hash set, and a product is
+    only appended (in normal form) if it is nonzero and not in the sequence 
+    already, e.g. A_a^x A_a^x = A_a^x. The order of the entries is 
+    deterministic: the order in which they are first produced.
+    '''
+    npa_level, inter_med = parse_level(level)
+
+    seq = []
+    seen = set()
+    def append(op):
+        op = normal(op)
+        if op is not ZERO and op not in seen:
+            seen.add(op)
+            seq.append(op)
+
+    for op in ops:
+        append(op)
+
+    for i in range(1, npa_level):
+        _append_products(seq, ["A", "B", "AB"], multiply, append)
+
+    # If the sequence is intermediate, process the last bit
+    steps = [step for step in inter_med if step in LEVEL_STEPS]
+    if len(steps) > 0:
+        _append_products(seq, steps, multiply, append)
+
+    parties = {"A": ops[:num_alice], "B": ops[num_alice:]}
+    for step in inter_med:
+        if step not in LEVEL_STEPS:
+            pools = [parties[x] for x in sorted(step)]
+            for factors in itertools.product(*pools):
+                append(reduce(multiply, factors))
+    return seq
+
+
+def _append_products(seq, steps, multiply, append):
+    '''
+    Appends the products of the current words of the sequence, where the
+    first half of those words is taken to be Alice's and the second Bob's.
+    '''
+    n = len(seq)
+    h = n // 2
+    if "A" in steps:
+        for j in range(h):
+            for k in range(h):
+                if j != k:
+                    append(multiply(seq[j], seq[k]))
+    if "B" in steps:
+        for j in range(h, n):
+            for k in range(h, n):
+                if j != k:
+                    append(multiply(seq[j], seq[k]))
+    if "AB" in steps:
+        for j in range(h):
+            for k in range(h):
+                append(multiply(seq[j], seq[k+h]))
+
+
+def normal_form(letters, parties, groups=None):
+    '''
+    Normal form (see simplify_word) of a word of measurement operators given
+    by its (hashable) letters, the party of every letter (0 for Alice, 1 for
+    Bob) and, if the projectors of a measurement are orthogonal, the group 
+    (measurement) of every letter. Returns the positions of the letters of 
+    the normal form, or ZERO.
+
+    The letters are coded as integers, Alice's before Bob's, and rewritten by
+    simplify_word, so that both engines share one rewrite system.
+    '''
+    codes = {}
+    for party in [0, 1]:
+        if party == 1:
+            num_alice = len(codes)
+        for pos in range(len(letters)):
+            if parties[pos] == party and letters[pos] not in codes:
+                codes[letters[pos]] = len(codes)
+    word = tuple([codes[letter] for letter in letters])
+    
+    meas_groups = None
+    if groups is not None:
+        meas_groups = [None] * len(codes)
+        for pos in range(len(letters)):
+            meas_groups[word[pos]] = groups[pos]
+    
+    normal = simplify_word(word, num_alice, meas_groups)
+    if normal is ZERO:
+        return ZERO
+    
+    # The normal form keeps the first letter of every run of a party, so its
+    # letters are the first matching letters of Alice's and then Bob's.
+    candidates = iter([pos for pos in range(len(word)) if parties[pos] == 0] \
+                      + [pos for pos in range(len(word)) if parties[pos] == 1])
+    positions = []
+    for code in normal:
+        for pos in candidates:
+            if word[pos] == code:
+                positions.append(pos)
+                break
+    return positions
+
+
+def simplify_word(word, num_alice, meas_groups=None):
+    '''
+    Normal form of an integer-coded word under the rewrite system
+            y x -> x y   for x of Alice and y of Bob, as [A_a^x, B_b^y] = 0,
+            x x -> x     as the operators are projectors, P^2 = P,
+            x y -> 0     for x != y of the same measurement, if the 
+                         measurement groups of the alphabet are given, as 
+                         the projectors of a measurement are orthogonal.
+    The system terminates and is confluent: every word has a unique normal 
+    form, namely Alice's operators in front of Bob's (keeping their relative
+    order) with repeated adjacent operators collapsed, or ZERO. It is 
+    computed in one linear pass, as collapsing an operator never makes two 
+    other operators adjacent.
+    '''
+    if word is ZERO:
+        return ZERO
+
+    alice = []
+    bob = []
+    for k in word:
+        part = alice if k < num_alice else bob
+        if part:
+            if part[-1] == k:
+                continue
+            if meas_groups is not None and \
+               meas_groups[part[-1]] == meas_groups[k]:
+                return ZERO
+        part.append(k)
+    return tuple(alice + bob)
+
+
+def adjoint_word(word):
+    '''
+    The adjoint of a word of Hermitian operators is the reversed word.
+    '''
+    if word is ZERO:
+        return ZERO
+    return word[::-1]
+
+
+def canonical_word(word, num_alice):
+    '''
+    The canonical form of a simplified word is the smaller of the word and 
+    its (simplified) adjoint, as <psi| U |psi> and <psi| U^* |psi> are equal 
+    for a real moment matrix.
+    '''
+    if word is ZERO:
+        return ZERO
+    return min(word, simplify_word(adjoint_word(word), num_alice))
+
+
+def simplify_tensor_word(word, num_alice, meas_groups=None):
+    '''
+    The normal form of a word of a TensorAlphabet. The operators of different
+    rounds commute, so the word factors into its rounds, and each round is
+    simplified on its own (see simplify_word) with the (num_alice) and 
+    (meas_groups) of the alphabet of a single round. The word is ZERO if one
+    of its rounds is.
+    '''
+    if word is ZERO:
+        return ZERO
+
+    rounds = tuple([simplify_word(x, num_alice, meas_groups) for x in word])
+    if ZERO in rounds:
+        return ZERO
+    return rounds
+
+
+def adjoint_tensor_word(word):
+    '''
+    The adjoint of a word of a TensorAlphabet, i.e. the adjoints of its 
+    rounds.
+    '''
+    if word is ZERO:
+        return ZERO
+    return tuple([adjoint_word(x) for x in word])
+
+
+def canonical_tensor_word(word, num_alice):
+    '''
+    The canonical form of a simplified word of a TensorAlphabet: the smaller 
+    of the word and its (simplified) adjoint, see canonical_word. The rounds
+    are only taken to the adjoint together, as the moment matrix is only real
+    as a whole.
+    '''
+    if word is ZERO:
+        return ZERO
+    return min(word, simplify_tensor_word(adjoint_tensor_word(word), \
+                                          num_alice))
+
+
+def generate_moment_matrix(seq, simplified=True, orthogonal=False, workers=1):
+    '''
+    Integer-word counterpart of moment_matrix.generate_moment_matrix. Entry
+    (i,j) is the word of Dagger(seq[i]) * seq[j]. If "orthogonal" is True,
+    products of orthogonal projectors are simplified to ZERO.
+
+    Only the upper triangle is computed, see WordMatrix. If workers > 1, the
+    rows are split into blocks that are computed in a process pool.
+    '''
+    upper = _generate_upper(seq, simplified, orthogonal, workers)
+    return WordMatrix(upper, seq.alphabet, simplified, orthogonal)
+
+
+def generate_moment_id_matrix(seq, simplified=True, orthogonal=False, \
+                              workers=1, reuse=None, out=None):
+    '''
+    Computes the moment matrix of a sequence as a MomentIdMatrix. The rows 
+    are computed one block at a time, so the words of the whole matrix are 
+    never held in memory. The entries of an earlier moment matrix are reused
+    if (reuse) is (old_seq, mat), see extend_moment_matrix. The moment IDs
+    are written to (out) if it is given, e.g. an n x n int32 memmap.
+    '''
+    n = len(seq)
+    ids = np.empty((n,n), dtype=np.int32) if out is None else out
+    mat = MomentIdMatrix(ids, [], seq.alphabet, simplified, orthogonal, [])
+    
+    # The IDs of the entry M(i,j) and of its adjoint M(j,i), by entry word.
+    entry_ids = {}
+    word_ids = {}
+    for i, row in enumerate(_iter_upper_rows(seq, simplified, orthogonal, \
+                                             workers, reuse)):
+        for word in row:
+            if word not in entry_ids:
+                key = mat.entry_key(word)
+                k = word_ids.get(key)
+                if k is None:
+                    k = word_ids[key] = len(mat.words)
+                    mat.words.append(key)
+                    mat.self_adjoint.append(mat.adjoint_entry(key) == key)
+                
+                # The adjoint of a canonical word is the other word of its 
+                # class.
+                if word != key:
+                    entry_ids[word] = (~k, k)
+                elif mat.self_adjoint[k] == True:
+                    entry_ids[word] = (k, k)
+                else:
+                    entry_ids[word] = (k, ~k)
+        row_ids = [entry_ids[word] for word in row]
+        ids[i,i:] = [k for k, _ in row_ids]
+        ids[i+1:,i] = [k for _, k in row_ids[1:]]
+        
+    # Only the distinct entry words are looked up in the classes.
+    npa_profile.count("entry_ids.misses", len(entry_ids))
+    npa_profile.count("entry_ids.hits", n * (n + 1) // 2 - len(entry_ids))
+    return mat
+
+
+@npa_profile.profiled("tensor_moment_matrix")
+def generate_tensor_moment_matrix(seq, orthogonal=False, workers=1):
+    '''
+    Computes the simplified moment matrix of a TensorSequence as a 
+    TensorMomentIdMatrix. Entry (i,j) of the tensor power of the sequence of
+    a single round is the tuple of the entries M_1(i_r, j_r) of the moment 
+    matrix M_1 of a single round, so only M_1 is built from words (with 
+    (workers) processes). The entries of the tensor power are numbered with 
+    vectorized numpy operations on the moment IDs of M_1, and their words are
+    only formed once per class.
+    '''
+    reps = seq.alphabet.parallel_reps
+    round_mat = generate_moment_id_matrix(seq.round_seq, True, orthogonal, \
+                                          workers)
+    num_alice = seq.alphabet.round_alphabet.num_alice
+    
+    # Entry M_1(i,j) is coded as 2m if it is the canonical word of moment m,
+    # and as 2m+1 if it is the adjoint of that word. The adjoint of a self-
+    # adjoint moment is the moment itself.
+    round_ids = round_mat.ids.astype(np.int64)
+    moments = np.where(round_ids < 0, ~round_ids, round_ids)
+    round_codes = 2 * moments + (round_ids < 0)
+    self_adjoint = np.asarray(round_mat.self_adjoint, dtype=bool)
+    round_adj_codes = np.where(self_adjoint[moments], round_codes, \
+                               round_codes ^ 1)
+    
+    base = 2 * len(round_mat.words)
+    if base**reps >= 2**63:
+        raise ValueError("The moment matrix of %d rounds has too many moments "
+                         "to be numbered." % reps)
+    
+    # The words of the round codes, and the codes of their adjoints.
+    code_words = []
+    code_adjoints = []
+    for m, word in enumerate(round_mat.words):
+        code_words += [word, round_mat.adjoint_entry(word)]
+        code_adjoints += [2*m, 2*m + 1] if self_adjoint[m] == True \
+                         else [2*m + 1, 2*m]
+    
+    # The code of an entry is the number of base (base) of its round codes,
+    # and an entry vanishes if one of its rounds does.
+    codes = _tensor_sum(round_codes, reps, base)
+    adj_codes = _tensor_sum(round_adj_codes, reps, base)
+    zero = np.zeros(round_codes.shape, dtype=np.int64)
+    if ZERO in round_mat.words:
+        zero = (moments == round_mat.words.index(ZERO)).astype(np.int64)
+    zero = _tensor_sum(zero, reps, 1) > 0
+    
+    keys = np.minimum(codes, adj_codes)
+    keys[zero] = -1
+    del adj_codes
+    classes, class_ids = np.unique(keys, return_inverse=True)
+    del keys
+    
+    # The canonical word of every class, and the code of that word.
+    words = []
+    word_codes = np.empty(len(classes), dtype=np.int64)
+    class_self_adjoint = []
+    for k, code in enumerate(classes):
+        if code < 0:
+            words.append(ZERO)
+            word_codes[k] = -1
+            class_self_adjoint.append(True)
+            continue
+        
+        digits = []
+        for _ in range(reps):
+            code, digit = divmod(int(code), base)
+            digits.append(digit)
+        digits.reverse()
+        adj_digits = [code_adjoints[x] for x in digits]
+        
+        word = tuple([code_words[x] for x in digits])
+        adj_word = tuple([code_words[x] for x in adj_digits])
+        adj_code = reduce(lambda x, y: x * base + y, adj_digits)
+        word_codes[k] = classes[k]
+        if adj_word < word:
+            word, word_codes[k] = adj_word, adj_code
+        words.append(word)
+        class_self_adjoint.append(adj_code == classes[k])
+    
+    class_ids = class_ids.reshape(codes.shape)
+    ids = np.where(zero | (codes == word_codes[class_ids]), class_ids, \
+                   ~class_ids).astype(np.int32)
+    
+    npa_profile.count("tensor.round_dim", len(seq.round_seq))
+    npa_profile.count("tensor.classes", len(words))
+    return TensorMomentIdMatrix(ids, words, seq.alphabet, orthogonal, \
+                                class_self_adjoint, round_mat)
+
+
+def _tensor_sum(round_mat, reps, base):
+    '''
+    The n^reps x n^reps array of the numbers of base (base) whose digits are
+    round_mat[i_r, j_r], from the first round to the last, for the rows 
+    (i_0, ..., i_{reps-1}) and columns (j_0, ..., j_{reps-1}) of the tensor
+    power of a sequence of n words (ordered as by itertools.product).
+    '''
+    n = len(round_mat)
+    total = np.zeros((1,) * (2 * reps), dtype=np.int64)
+    for r in range(reps):
+        shape = [1] * (2 * reps)
+        shape[r] = shape[reps + r] = n
+        total = total * base + round_mat.reshape(shape)
+    return total.reshape(n**reps, n**reps)
+
+
+def extend_moment_matrix(mat, old_seq, seq, workers=1):
+    '''
+    Integer-word counterpart of moment_matrix.extend_moment_matrix. The
+    moment matrix (mat) of the sequence (old_seq) is extended to the moment
+    matrix of the sequence (seq), with the simplification of (mat).
+    '''
+    if isinstance(mat, MomentIdMatrix):
+        return generate_moment_id_matrix(seq, mat.simplified, mat.orthogonal,\
+                                         workers, (old_seq, mat))
+    
+    upper = _generate_upper(seq, mat.simplified, mat.orthogonal, workers, \
+                            (old_seq, mat))
+    return WordMatrix(upper, seq.alphabet, mat.simplified, mat.orthogonal)
+
+
+def generate_moment_matrix_entry(seq, i, j, simplified=True, \
+                                 orthogonal=False):
+    '''
+    Integer-word counterpart of moment_matrix.generate_moment_matrix_entry,
+    i.e. the word M[i,j] of generate_moment_matrix.
+    '''
+    if isinstance(seq, TensorSequence):
+        round_alphabet = seq.alphabet.round_alphabet
+        word = tuple([adjoint_word(u) + v for u, v in zip(seq[i], seq[j])])
+        if simplified == True:
+            meas_groups = None
+            if orthogonal == True:
+                meas_groups = round_alphabet.meas_groups
+            return simplify_tensor_word(word, round_alphabet.num_alice, \
+                                        meas_groups)
+        return word
+
+    num_alice = seq.alphabet.num_alice
+    
+    # Entries below the diagonal are the adjoints of the upper triangle, see
+    # WordMatrix.adjoint_entry.
+    if j < i:
+        word = generate_moment_matrix_entry(seq, j, i, simplified, orthogonal)
+        if simplified == True:
+            return simplify_word(adjoint_word(word), num_alice)
+        return adjoint_word(word)
+    
+    word = adjoint_word(seq[i]) + seq[j]
+    if simplified == True:
+        meas_groups = seq.alphabet.meas_groups if orthogonal == True else None
+        return simplify_word(word, num_alice, meas_groups)
+    return word
+
+
+def _generate_upper(seq, simplified, orthogonal, workers, reuse=None):
+    '''
+    Computes the upper triangle of the moment matrix of a sequence, reusing
+    the entries of an earlier moment matrix if (reuse) is (old_seq, mat).
+    '''
+    return list(_iter_upper_rows(seq, simplified, orthogonal, workers, reuse))
+
+
+def _iter_upper_rows(seq, simplified, orthogonal, workers, reuse=None):
+    '''
+    Generator of the rows of the upper triangle of the moment matrix of a 
+    sequence, see _generate_upper.
+    '''
+    meas_groups = seq.alphabet.meas_groups if orthogonal == True else None
+    return util.imap_upper_rows(seq, _upper_entries, (seq.alphabet.num_alice, \
+        meas_groups, simplified), workers, reuse, \
+        "simplify.calls" if simplified == True else None)
+
+
+def _upper_entries(u, vs, num_alice, meas_groups, simplified):
+    '''
+    Words of the entries of the upper triangle of the moment matrix of the 
+    word u and each word of vs.
+    '''
+    u_dag = adjoint_word(u)
+    if simplified == True:
+        return [simplify_word(u_dag + v, num_alice, meas_groups) for v in vs]
+    return [u_dag + v for v in vs]
@@ -16,12 +16,27 @@
 #------------------------------------------------------------------------------
 '''
 
+import json
+import shutil
+import StringIO
+import sys
+import tempfile
 import unittest
+import warnings
 
 from moment_matrix import *
 from bell_violation import *
 from util import *
 
+import npa_io
+import npa_batch
+import benchmarking
+import npa_sdp
+import npa_cache
+import npa_profile
+import npa_symmetry
+import operator_words
+
 
 ###############################################################################
 ##  MOMENT_MATRIX.PY UNIT TESTS
@@ -33,23 +48,26 @@ class TestMomentMatrixFunctions(unittest.TestCase):
     '''
     def setUp(self):
         
+        # Table-1 in [1] covers the I_22dd inequalities, i.e. 2 inputs and d
+        # outputs, with the operator of the last output left out.
+        
         # Refer to "Matrix Size" column in Table-1 under I_1 in [1]
         self.seq_len_input_2_output_2_level_1 = 5
-        self.seq_len_input_3_output_3_level_1 = 9      
-        self.seq_len_input_4_output_4_level_1 = 13
-        self.seq_len_input_5_output_5_level_1 = 17
-        self.seq_len_input_6_output_6_level_1 = 21
-        self.seq_len_input_7_output_7_level_1 = 25
-        self.seq_len_input_8_output_8_level_1 = 29
+        self.seq_len_input_2_output_3_level_1 = 9      
+        self.seq_len_input_2_output_4_level_1 = 13
+        self.seq_len_input_2_output_5_level_1 = 17
+        self.seq_len_input_2_output_6_level_1 = 21
+        self.seq_len_input_2_output_7_level_1 = 25
+        self.seq_len_input_2_output_8_level_1 = 29
         
         # Refer to "Matrix Size" column in Table-1 under I_{1+AB} in [1]
         self.seq_len_input_2_output_2_level_1_AB = 9
-        self.seq_len_input_3_output_3_level_1_AB = 25
-        self.seq_len_input_4_output_4_level_1_AB = 49
-        self.seq_len_input_5_output_5_level_1_AB = 81
-        self.seq_len_input_6_output_6_level_1_AB = 121
-        self.seq_len_input_7_output_7_level_1_AB = 169
-        self.seq_len_input_8_output_8_level_1_AB = 225       
+        self.seq_len_input_2_output_3_level_1_AB = 25
+        self.seq_len_input_2_output_4_level_1_AB = 49
+        self.seq_len_input_2_output_5_level_1_AB = 81
+        self.seq_len_input_2_output_6_level_1_AB = 121
+        self.seq_len_input_2_output_7_level_1_AB = 169
+        self.seq_len_input_2_output_8_level_1_AB = 225       
 
         # Refer to "Matrix Size" column in Table-2 in [1]
         self.seq_len_input_3_output_2_level_1 = 7
@@ -58,12 +76,12 @@ class TestMomentMatrixFunctions(unittest.TestCase):
         
         # Generate measurement operators of specified input / output length
         self.meas_ops_input_2_output_2 = generate_measurement_operators(2,2,True)
-        self.meas_ops_input_3_output_3 = generate_measurement_operators(3,3,True)
-        self.meas_ops_input_4_output_4 = generate_measurement_operators(4,4,True)
-        self.meas_ops_input_5_output_5 = generate_measurement_operators(5,5,True)
-        self.meas_ops_input_6_output_6 = generate_measurement_operators(6,6,True)
-        self.meas_ops_input_7_output_7 = generate_measurement_operators(7,7,True)
-        self.meas_ops_input_8_output_8 = generate_measurement_operators(8,8,True)
+        self.meas_ops_input_2_output_3 = generate_measurement_operators(2,3,True)
+        self.meas_ops_input_2_output_4 = generate_measurement_operators(2,4,True)
+        self.meas_ops_input_2_output_5 = generate_measurement_operators(2,5,True)
+        self.meas_ops_input_2_output_6 = generate_measurement_operators(2,6,True)
+        self.meas_ops_input_2_output_7 = generate_measurement_operators(2,7,True)
+        self.meas_ops_input_2_output_8 = generate_measurement_operators(2,8,True)
         
         self.meas_ops_input_3_output_2 = generate_measurement_operators(3,2,True)
     
@@ -79,34 +97,34 @@ class TestMomentMatrixFunctions(unittest.TestCase):
         # Generate sequence operators of specified input / output level 1:
         self.seq_ops_input_2_output_2_level_1 = \
             generate_sequence(self.meas_ops_input_2_output_2, self.level_1)
-        self.seq_ops_input_3_output_3_level_1 = \
-            generate_sequence(self.meas_ops_input_3_output_3, self.level_1)
-        self.seq_ops_input_4_output_4_level_1 = \
-            generate_sequence(self.meas_ops_input_4_output_4, self.level_1)            
-        self.seq_ops_input_5_output_5_level_1 = \
-            generate_sequence(self.meas_ops_input_5_output_5, self.level_1)        
-        self.seq_ops_input_6_output_6_level_1 = \
-            generate_sequence(self.meas_ops_input_6_output_6, self.level_1)            
-        self.seq_ops_input_7_output_7_level_1 = \
-            generate_sequence(self.meas_ops_input_7_output_7, self.level_1)            
-        self.seq_ops_input_8_output_8_level_1 = \
-            generate_sequence(self.meas_ops_input_8_output_8, self.level_1)
+        self.seq_ops_input_2_output_3_level_1 = \
+            generate_sequence(self.meas_ops_input_2_output_3, self.level_1)
+        self.seq_ops_input_2_output_4_level_1 = \
+            generate_sequence(self.meas_ops_input_2_output_4, self.level_1)            
+        self.seq_ops_input_2_output_5_level_1 = \
+            generate_sequence(self.meas_ops_input_2_output_5, self.level_1)        
+        self.seq_ops_input_2_output_6_level_1 = \
+            generate_sequence(self.meas_ops_input_2_output_6, self.level_1)            
+        self.seq_ops_input_2_output_7_level_1 = \
+            generate_sequence(self.meas_ops_input_2_output_7, self.level_1)            
+        self.seq_ops_input_2_output_8_level_1 = \
+            generate_sequence(self.meas_ops_input_2_output_8, self.level_1)
 
         # Generate sequence operators of specified input / output level 1+AB:
         self.seq_ops_input_2_output_2_level_1_AB = \
             generate_sequence(self.meas_ops_input_2_output_2, self.level_1_AB)
-        self.seq_ops_input_3_output_3_level_1_AB = \
-            generate_sequence(self.meas_ops_input_3_output_3, self.level_1_AB)
-        self.seq_ops_input_4_output_4_level_1_AB = \
-            generate_sequence(self.meas_ops_input_4_output_4, self.level_1_AB)            
-        self.seq_ops_input_5_output_5_level_1_AB = \
-            generate_sequence(self.meas_ops_input_5_output_5, self.level_1_AB)        
-        self.seq_ops_input_6_output_6_level_1_AB = \
-            generate_sequence(self.meas_ops_input_6_output_6, self.level_1_AB)            
-        self.seq_ops_input_7_output_7_level_1_AB = \
-            generate_sequence(self.meas_ops_input_7_output_7, self.level_1_AB)            
-        self.seq_ops_input_8_output_8_level_1_AB = \
-            generate_sequence(self.meas_ops_input_8_output_8, self.level_1_AB)
+        self.seq_ops_input_2_output_3_level_1_AB = \
+            generate_sequence(self.meas_ops_input_2_output_3, self.level_1_AB)
+        self.seq_ops_input_2_output_4_level_1_AB = \
+            generate_sequence(self.meas_ops_input_2_output_4, self.level_1_AB)            
+        self.seq_ops_input_2_output_5_level_1_AB = \
+            generate_sequence(self.meas_ops_input_2_output_5, self.level_1_AB)        
+        self.seq_ops_input_2_output_6_level_1_AB = \
+            generate_sequence(self.meas_ops_input_2_output_6, self.level_1_AB)            
+        self.seq_ops_input_2_output_7_level_1_AB = \
+            generate_sequence(self.meas_ops_input_2_output_7, self.level_1_AB)            
+        self.seq_ops_input_2_output_8_level_1_AB = \
+            generate_sequence(self.meas_ops_input_2_output_8, self.level_1_AB)
             
         # Generate sequence operators of 3 input / 2 output level 1, 1+AB, and
         # level 1+A+AB
@@ -134,35 +152,35 @@ class TestMomentMatrixFunctions(unittest.TestCase):
         # of the length in Table-1 under I_1 in reference [1]. 
         self.assertEqual(len(self.seq_ops_input_2_output_2_level_1), \
                          self.seq_len_input_2_output_2_level_1)                        
-        self.assertEqual(len(self.seq_ops_input_3_output_3_level_1), \
-                         self.seq_len_input_3_output_3_level_1)  
-        self.assertEqual(len(self.seq_ops_input_4_output_4_level_1), \
-                         self.seq_len_input_4_output_4_level_1)  
-        self.assertEqual(len(self.seq_ops_input_5_output_5_level_1), \
-                         self.seq_len_input_5_output_5_level_1)  
-        self.assertEqual(len(self.seq_ops_input_6_output_6_level_1), \
-                         self.seq_len_input_6_output_6_level_1)  
-        self.assertEqual(len(self.seq_ops_input_7_output_7_level_1), \
-                         self.seq_len_input_7_output_7_level_1)  
-        self.assertEqual(len(self.seq_ops_input_8_output_8_level_1), \
-                         self.seq_len_input_8_output_8_level_1)    
+        self.assertEqual(len(self.seq_ops_input_2_output_3_level_1), \
+                         self.seq_len_input_2_output_3_level_1)  
+        self.assertEqual(len(self.seq_ops_input_2_output_4_level_1), \
+                         self.seq_len_input_2_output_4_level_1)  
+        self.assertEqual(len(self.seq_ops_input_2_output_5_level_1), \
+                         self.seq_len_input_2_output_5_level_1)  
+        self.assertEqual(len(self.seq_ops_input_2_output_6_level_1), \
+                         self.seq_len_input_2_output_6_level_1)  
+        self.assertEqual(len(self.seq_ops_input_2_output_7_level_1), \
+                         self.seq_len_input_2_output_7_level_1)  
+        self.assertEqual(len(self.seq_ops_input_2_output_8_level_1), \
+                         self.seq_len_input_2_output_8_level_1)    
                          
         # Ensure the length of the sequence generated agrees with the results
         # of the length in Table-1 under I_1+AB in reference [1].
         self.assertEqual(len(self.seq_ops_input_2_output_2_level_1_AB), \
                          self.seq_len_input_2_output_2_level_1_AB) 
-        self.assertEqual(len(self.seq_ops_input_3_output_3_level_1_AB), \
-                         self.seq_len_input_3_output_3_level_1_AB) 
-        self.assertEqual(len(self.seq_ops_input_4_output_4_level_1_AB), \
-                         self.seq_len_input_4_output_4_level_1_AB) 
-        self.assertEqual(len(self.seq_ops_input_5_output_5_level_1_AB), \
-                         self.seq_len_input_5_output_5_level_1_AB) 
-        self.assertEqual(len(self.seq_ops_input_6_output_6_level_1_AB), \
-                         self.seq_len_input_6_output_6_level_1_AB) 
-        self.assertEqual(len(self.seq_ops_input_7_output_7_level_1_AB), \
-                         self.seq_len_input_7_output_7_level_1_AB) 
-        self.assertEqual(len(self.seq_ops_input_8_output_8_level_1_AB), \
-                         self.seq_len_input_8_output_8_level_1_AB) 
+        self.assertEqual(len(self.seq_ops_input_2_output_3_level_1_AB), \
+                         self.seq_len_input_2_output_3_level_1_AB) 
+        self.assertEqual(len(self.seq_ops_input_2_output_4_level_1_AB), \
+                         self.seq_len_input_2_output_4_level_1_AB) 
+        self.assertEqual(len(self.seq_ops_input_2_output_5_level_1_AB), \
+                         self.seq_len_input_2_output_5_level_1_AB) 
+        self.assertEqual(len(self.seq_ops_input_2_output_6_level_1_AB), \
+                         self.seq_len_input_2_output_6_level_1_AB) 
+        self.assertEqual(len(self.seq_ops_input_2_output_7_level_1_AB), \
+                         self.seq_len_input_2_output_7_level_1_AB) 
+        self.assertEqual(len(self.seq_ops_input_2_output_8_level_1_AB), \
+                         self.seq_len_input_2_output_8_level_1_AB) 
                          
         # Ensure the length of the sequence generated agrees with the results
         # of the length in Table-2 in reference [1]
@@ -198,13 +216,836 @@ class TestMomentMatrixFunctions(unittest.TestCase):
                         self.moment_matrix_input_2_output_2_level_1[i,i]),\
                         self.moment_matrix_dim_input_2_output_2_level_1[i,1] )
 
+
+    def test_generate_moment_matrix_equivalence_dict(self):
+        '''
+        Tests for generate_moment_matrix_equivalence_dict function in 
+        moment_matrix.py
+        '''
+        mat = self.moment_matrix_input_2_output_2_level_1
+        n = self.moment_matrix_dim_input_2_output_2_level_1
+        
+        # The hashed classes agree with the pairwise entry comparison.
+        equiv_dict = generate_moment_matrix_equivalence_dict(mat)
+        for i in range(n):
+            for j in range(n):
+                pairwise = [(k,l) for k in range(n) for l in range(n) \
+                    if check_moment_matrix_entry_equiv(mat[i,j], mat[k,l])]
+                self.assertEqual(equiv_dict[(i,j)], pairwise)
+        
+        # In the minimal form, every class is stored exactly once.
+        minimal_dict = generate_moment_matrix_equivalence_dict(mat, True)
+        stored = [ent for equiv_ent in minimal_dict.values() \
+                  for ent in equiv_ent]
+        self.assertEqual(sorted(stored), sorted(equiv_dict.keys()))
+        
+        # Table-1 under I_{1+AB}: the 225 x 225 matrix is grouped directly.
+        ops = generate_measurement_operators(2,8,True,engine="word")
+        mat = generate_moment_matrix(generate_sequence(ops, self.level_1_AB))
+        equiv_dict = generate_moment_matrix_equivalence_dict(mat, True)
+        self.assertEqual(len(equiv_dict), 225 * 225)
+        
+        
+    def test_orthogonal_meas(self):
+        '''
+        Tests for the orthogonality of the measurement operators in 
+        simplify_moment_matrix_entry and generate_sequence.
+        '''
+        ops = generate_measurement_operators(2,3,True)
+        A00, A01 = ops[0], ops[1]
+        
+        self.assertEqual(simplify_moment_matrix_entry(A00*A01, True), 0)
+        self.assertNotEqual(simplify_moment_matrix_entry(A00*A01), 0)
+        
+        # Level 2 of the CHSH scenario has matrix size 13.
+        seq = generate_sequence(self.meas_ops_input_2_output_2, 2, True)
+        self.assertEqual(len(seq), 13)
+        
+        # All products A_a^x A_a'^x and B_b^y B_b'^y of the 2 input / 3 
+        # output level 2 sequence vanish: 4 of the 12 products of each party.
+        seq = generate_sequence(ops, 2)
+        seq_orth = generate_sequence(ops, 2, True)
+        self.assertEqual(len(seq) - len(seq_orth), 8)
+        
+        M = MomentMatrix(2, 3, 2, bool_short_meas=True, \
+                         bool_orthogonal_meas=True, engine="word")
+        self.assertEqual(map(str, seq_orth), map(str, M.seq.to_sympy()))
+        self.assertTrue(is_zero_moment_matrix_entry(M.npa_matrix[1,2]))
+        
+        # The zero entries agree between the sympy and word engines.
+        M = MomentMatrix(2, 3, "1+AB", bool_short_meas=True, \
+                         bool_orthogonal_meas=True, engine="word")
+        seq_orth = generate_sequence(ops, "1+AB", True)
+        mat = generate_moment_matrix(seq_orth, True, True)
+        self.assertEqual(map(str, mat), map(str, M.npa_matrix.to_sympy()))
+        
+        
+    def test_generate_affine_moment_matrix(self):
+        '''
+        Tests for generate_affine_moment_matrix function in moment_matrix.py
+        '''
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        
+        for engine in ["sympy", "word"]:
+            M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine=engine)
+            F = M.generate_affine_moment_matrix(ch_exp)
+            
+            # One variable per equivalence class other than the identity.
+            equiv_classes = generate_moment_matrix_equivalence_classes(\
+                                M.npa_matrix)
+            self.assertEqual(F.num_vars, len(equiv_classes) - 1)
+            
+            # Equivalent entries hold the same variable.
+            x = range(1, F.num_vars + 1)
+            mat = F.evaluate(x)
+            self.assertEqual(mat[0,0], 1)
+            for equiv_ent in equiv_classes.values():
+                self.assertTrue(check_equal([mat[ent] for ent in equiv_ent]))
+            
+            # Each term of the CH expression is a single variable.
+            self.assertEqual(len(F.obj_ids), 6)
+            self.assertEqual(sorted(F.obj_vals), [-1, -1, -1, 1, 1, 1])
+            self.assertEqual(F.evaluate_objective(np.ones(F.num_vars)), 0)
+            self.assertEqual(len(F.basis_matrices()), F.num_vars)
+        
+        
+    def test_generate_moment_matrix_workers(self):
+        '''
+        Moment matrices built in a process pool agree with the serial build.
+        '''
+        seq = self.seq_ops_input_3_output_2_level_1_AB
+        self.assertEqual(generate_moment_matrix(seq, workers=2), \
+                         generate_moment_matrix(seq))
+        
+        ops = generate_measurement_operators(3,2,True,engine="word")
+        seq = generate_sequence(ops, 2)
+        self.assertEqual(generate_moment_matrix(seq, workers=2).upper, \
+                         generate_moment_matrix(seq).upper)
+        
+        
+    def test_lazy(self):
+        '''
+        A lazy moment matrix computes single entries and rows on demand and 
+        builds the matrix on first access.
+        '''
+        for engine in ["sympy", "word"]:
+            for orthogonal in [False, True]:
+                M = MomentMatrix(2, 3, "1+AB", bool_short_meas=True, \
+                    engine=engine, bool_orthogonal_meas=orthogonal, \
+                    bool_lazy=True)
+                self.assertEqual(M.dim, self.seq_len_input_2_output_3_level_1_AB)
+                rows = [M.row(i) for i in range(M.dim)]
+                self.assertEqual(M.entry(3, 1), rows[3][1])
+                self.assertFalse(M.is_built())
+                
+                M_built = MomentMatrix(2, 3, "1+AB", bool_short_meas=True, \
+                    engine=engine, bool_orthogonal_meas=orthogonal)
+                self.assertTrue(M_built.is_built())
+                self.assertEqual(rows, [M_built.row(i) \
+                                        for i in range(M_built.dim)])
+                self.assertEqual(M.equiv_dict, \
+                    M_built.generate_moment_matrix_equivalence_dict())
+                self.assertTrue(M.is_built())
+        
+        # A lazy moment matrix that was not built is built at the new level.
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word", \
+                         bool_lazy=True)
+        M.extend("1+AB")
+        self.assertFalse(M.is_built())
+        M_level = MomentMatrix(2, 2, "1+AB", bool_short_meas=True, \
+                               engine="word")
+        self.assertEqual(M.moment_index.keys, \
+                         M_level.generate_moment_index().keys)
+        
+        
+    def test_estimate_resources(self):
+        '''
+        The sequence length and number of moments are counted without 
+        building the moment matrix, and builds above the limits are refused.
+        '''
+        # Refer to "Matrix Size" column in Table-1 in [1]
+        for num_outputs in range(2, 9):
+            est = estimate_resources(2, num_outputs, "1+AB", short_meas=True)
+            self.assertEqual(est["dim"], (2 * num_outputs - 1)**2)
+        
+        for level in [1, "1+AB", "1+A+B", 2]:
+            for orthogonal in [False, True]:
+                M = MomentMatrix(2, 3, level, engine="word", \
+                                 bool_orthogonal_meas=orthogonal)
+                est = M.estimate_resources()
+                if orthogonal == True:
+                    self.assertTrue(est["dim"] >= M.dim)
+                else:
+                    self.assertEqual(est["dim"], M.dim)
+                self.assertTrue(est["num_moments"] >= \
+                                M.generate_moment_index().num_classes)
+        
+        # The number of moments of level 1+AB is exact.
+        M = MomentMatrix(2, 3, "1+AB", bool_short_meas=True, engine="word")
+        self.assertEqual(M.estimate_resources()["num_moments"], \
+                         M.generate_moment_index().num_classes)
+        
+        self.assertRaises(ValueError, MomentMatrix, 3, 3, 4, engine="word", \
+                          limits={"memory": 2**30}, bool_refuse_limits=True)
+        self.assertRaises(ValueError, MomentMatrix, 2, 2, 3, engine="word", \
+                          limits={"dim": 1000}, bool_refuse_limits=True)
+        M = MomentMatrix(2, 2, 3, engine="word", limits={"dim": 1000}, \
+                         bool_refuse_limits=True, bool_lazy=True)
+        self.assertEqual(M.dim, 817)
+        
+        # Without refuse_limits, the build only warns.
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            MomentMatrix(2, 2, 1, engine="word", limits={"dim": 4})
+        self.assertEqual(len(caught), 1)
+        self.assertTrue("dim" in str(caught[0].message))
+        
+        # Invalid levels.
+        for level in [0, 1.5, "1+C", "A", "1+AB+"]:
+            self.assertRaises(ValueError, estimate_resources, 2, 2, level)
+            self.assertRaises(ValueError, MomentMatrix, 2, 2, level)
+        
+        
+    def test_simplify_cache(self):
+        '''
+        Simplified entries are memoized in a bounded LRU cache shared by all
+        moment matrices.
+        '''
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        cache.resize(1)
+        self.assertEqual(cache.items.keys(), ["c"])
+        
+        size = simplify_cache.max_size
+        try:
+            simplify_cache.clear()
+            M = MomentMatrix(2, 2, "1+AB")
+            stats = simplify_cache.stats()
+            self.assertEqual(stats["size"], stats["misses"])
+            
+            # A second moment matrix only looks up its entries.
+            self.assertEqual(MomentMatrix(2, 2, "1+AB").npa_matrix, \
+                             M.npa_matrix)
+            self.assertEqual(simplify_cache.stats()["misses"], \
+                             stats["misses"])
+            
+            simplify_cache.resize(0)
+            self.assertEqual(MomentMatrix(2, 2, "1+AB").npa_matrix, \
+                             M.npa_matrix)
+            self.assertEqual(len(simplify_cache), 0)
+        finally:
+            simplify_cache.resize(size)
+        
+        
+    def test_extend(self):
+        '''
+        Extending a moment matrix to a higher level gives the moment matrix
+        built from scratch at that level.
+        '''
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True)
+        M.extend("1+AB")
+        self.assertEqual(M.npa_level, "1+AB")
+        M_level = MomentMatrix(2, 2, "1+AB", bool_short_meas=True)
+        self.assertEqual(M.seq, M_level.seq)
+        self.assertEqual(M.npa_matrix, M_level.npa_matrix)
+        
+        # Level 2 reorders the words of level 1+AB.
+        for orthogonal in [False, True]:
+            M = MomentMatrix(3, 2, 1, bool_short_meas=True, engine="word", \
+                             bool_orthogonal_meas=orthogonal)
+            for level in ["1+AB", 2, "2+AB"]:
+                M.extend(level)
+                M_level = MomentMatrix(3, 2, level, bool_short_meas=True, \
+                    engine="word", bool_orthogonal_meas=orthogonal)
+                self.assertEqual(list(M.seq), list(M_level.seq))
+                self.assertEqual(M.npa_matrix.upper, M_level.npa_matrix.upper)
+
+###############################################################################
+##  OPERATOR_WORDS.PY UNIT TESTS
+###############################################################################
+
+class TestOperatorWordsFunctions(unittest.TestCase):
+    '''
+    Suite of tests for operator_words.py
+    '''
+    def setUp(self):
+        
+        self.sympy_ops_input_2_output_2 = \
+            generate_measurement_operators(2,2,False)
+        self.word_ops_input_2_output_2 = \
+            generate_measurement_operators(2,2,False,engine="word")
+
+        self.sympy_ops_input_3_output_2 = \
+            generate_measurement_operators(3,2,True)
+        self.word_ops_input_3_output_2 = \
+            generate_measurement_operators(3,2,True,engine="word")
+            
+            
+    def test_generate_sequence(self):
+        '''
+        Word sequences display as the same operators as the sympy sequences.
+        '''
+        for level in [1, "1+A", "1+AB", "1+A+AB", 2, "2+AB", "1+AAB"]:
+            sympy_seq = generate_sequence(self.sympy_ops_input_3_output_2, \
+                                          level)
+            word_seq = generate_sequence(self.word_ops_input_3_output_2, \
+                                         level)
+            self.assertEqual(map(str, sympy_seq), \
+                             map(str, word_seq.to_sympy()))
+            
+        # The words are distinct, nonzero and simplified.
+        alphabet = self.word_ops_input_2_output_2
+        for level in [3, "2+AB+A", "1+AB+AAB+ABB"]:
+            for orthogonal in [False, True]:
+                seq = generate_sequence(alphabet, level, orthogonal)
+                groups = alphabet.meas_groups if orthogonal == True else None
+                self.assertEqual(len(set(seq)), len(seq))
+                for word in seq:
+                    self.assertEqual(operator_words.simplify_word(word, \
+                                     alphabet.num_alice, groups), word)
+        
+        # Custom steps add the monomials of their form, in a fixed order.
+        seq = generate_sequence(alphabet, "1+AAB")
+        self.assertEqual(len(seq), 1 + 8 + 4**3)
+        self.assertEqual(seq[9:11], [(0, 4), (0, 5)])
+        self.assertEqual(seq[13], (0, 1, 4))
+        self.assertEqual(generate_sequence(alphabet, "1+AAB"), seq)
+        self.assertEqual(generate_sequence(alphabet, "1+BAA"), seq)
+            
+            
+    def test_generate_moment_matrix(self):
+        '''
+        Word moment matrices agree with the sympy moment matrices at the
+        levels where the sympy simplification is complete.
+        '''
+        for level in [1, "1+AB"]:
+            sympy_seq = generate_sequence(self.sympy_ops_input_2_output_2, \
+                                          level)
+            word_seq = generate_sequence(self.word_ops_input_2_output_2, \
+                                         level)
+            sympy_mat = generate_moment_matrix(sympy_seq)
+            word_mat = generate_moment_matrix(word_seq).to_sympy()
+            
+            self.assertEqual(len(sympy_mat), len(word_mat))
+            self.assertEqual(map(str, sympy_mat), map(str, word_mat))
+            
+            
+    def test_simplify_word(self):
+        '''
+        Alice's operators are moved in front of Bob's and P^2 = P is applied.
+        '''
+        ops = self.word_ops_input_2_output_2
+        num_alice = ops.num_alice
+        a0, a1, b0 = ops[0][0], ops[1][0], ops[num_alice][0]
+        
+        self.assertEqual(operator_words.simplify_word((b0, a0, a0), \
+                                                      num_alice), (a0, b0))
+        self.assertEqual(operator_words.simplify_word((a0, b0, a1, b0), \
+                                                      num_alice), (a0, a1, b0))
+        self.assertEqual(operator_words.simplify_word((a0, b0, a0), \
+                                                      num_alice), (a0, b0))
+
+        # The word engine and the sympy simplifier share one normal form.
+        rand = np.random.RandomState(2)
+        for orthogonal in [False, True]:
+            groups = ops.meas_groups if orthogonal == True else None
+            for trial in range(200):
+                word = tuple(rand.randint(0, len(ops.labels), \
+                                          rand.randint(1, 7)))
+                self.assertEqual(str(ops.to_sympy( \
+                    operator_words.simplify_word(word, num_alice, groups))), \
+                    str(simplify_moment_matrix_entry(ops.to_sympy(word), \
+                                                     orthogonal)))
+
+
+    def test_normal_form(self):
+        '''
+        The sympy simplifier uses the same normal form as the word engine, so
+        both engines find the same equivalence classes.
+        '''
+        self.assertEqual(operator_words.normal_form("bAaAB", [1,0,0,0,1]), \
+                         [1, 2, 3, 0, 4])
+        self.assertEqual(operator_words.normal_form("aab", [0,0,1]), [0, 2])
+        self.assertEqual(operator_words.normal_form("ab", [0,0], [0,0]), \
+                         operator_words.ZERO)
+
+        # A_0 A_1 B_0 B_1 and its adjoint A_1 A_0 B_1 B_0 are one moment.
+        ops = self.sympy_ops_input_2_output_2
+        A, B = ops[:len(ops)//2], ops[len(ops)//2:]
+        self.assertTrue(check_moment_matrix_entry_equiv( \
+            A[0]*A[1]*B[0]*B[1], A[1]*A[0]*B[1]*B[0]))
+        self.assertFalse(check_moment_matrix_entry_equiv( \
+            A[0]*A[1]*B[0]*B[1], A[1]*A[0]*B[0]*B[1]))
+
+        # Words are compared in the normal form of their moment matrix.
+        ops = self.word_ops_input_2_output_2
+        mat = generate_moment_matrix(generate_sequence(ops, 1))
+        a0, a1, b0 = (ops[0][0],), (ops[1][0],), (ops[ops.num_alice][0],)
+        self.assertTrue(check_moment_matrix_entry_equiv(a0 + a0, a0, mat))
+        self.assertTrue(check_moment_matrix_entry_equiv(b0 + a0, a0 + b0, \
+                                                        mat))
+        self.assertTrue(check_moment_matrix_entry_equiv(a1 + a0 + b0, \
+                                                        a0 + a1 + b0, mat))
+        self.assertFalse(check_moment_matrix_entry_equiv(a0 + b0, a0, mat))
+        self.assertTrue(check_moment_matrix_entry_equiv( \
+            operator_words.ZERO, operator_words.ZERO, mat))
+        self.assertFalse(check_moment_matrix_entry_equiv(a0 + b0, \
+                                              operator_words.ZERO, mat))
+        self.assertRaises(ValueError, check_moment_matrix_entry_equiv, \
+                          a0 + b0, b0 + a0)
+
+        for num_inputs, num_outputs, level in [(2, 2, "1+AB"), (3, 2, 2)]:
+            classes = [MomentIndex(MomentMatrix(num_inputs, num_outputs, \
+                level, bool_short_meas=True, engine=engine).npa_matrix) \
+                .num_classes for engine in ["sympy", "word"]]
+            self.assertEqual(classes[0], classes[1])
+
+
+    def test_upper_triangle(self):
+        '''
+        The lower triangle derived from the upper triangle agrees with the 
+        entries computed directly.
+        '''
+        seq = generate_sequence(self.word_ops_input_3_output_2, 2, True)
+        mat = generate_moment_matrix(seq, True, True)
+        num_alice = seq.alphabet.num_alice
+        meas_groups = seq.alphabet.meas_groups
+        for i in range(len(seq)):
+            for j in range(i):
+                entry = operator_words.simplify_word( \
+                    operator_words.adjoint_word(seq[i]) + seq[j], \
+                    num_alice, meas_groups)
+                self.assertEqual(mat[i,j], entry)
+                
+        sympy_seq = generate_sequence(self.sympy_ops_input_2_output_2, 1)
+        sympy_mat = generate_moment_matrix(sympy_seq, False)
+        for i in range(len(sympy_seq)):
+            for j in range(i):
+                self.assertEqual(sympy_mat[i,j], \
+                                 Dagger(sympy_seq[i]) * sympy_seq[j])
+        
+        
+    def test_moment_matrix_engine(self):
+        '''
+        The MomentMatrix class builds level 2 matrices on the word engine.
+        '''
+        M = MomentMatrix(3, 2, 2, engine="word")
+        self.assertEqual(M.dim, len(M.seq))
+        self.assertEqual(len(M.npa_matrix), M.dim * M.dim)
+        self.assertEqual(M.npa_matrix[0,0], operator_words.IDENTITY)
+
+        
+    def test_moment_id_matrix(self):
+        '''
+        Compact moment matrices hold the same entries and classes as the
+        moment matrices of words.
+        '''
+        for orthogonal in [False, True]:
+            M = MomentMatrix(3, 2, 2, bool_short_meas=True, engine="word", \
+                             bool_orthogonal_meas=orthogonal)
+            M_ids = MomentMatrix(3, 2, 2, bool_short_meas=True, \
+                engine="word", bool_orthogonal_meas=orthogonal, \
+                bool_compact_matrix=True)
+            self.assertEqual(M_ids.npa_matrix.ids.dtype, np.int32)
+            self.assertEqual(M_ids.npa_matrix.self_adjoint, \
+                operator_words.MomentIdMatrix(M_ids.npa_matrix.ids, \
+                    M_ids.npa_matrix.words, M.meas_ops).self_adjoint)
+            
+            for i in range(M.dim):
+                for j in range(M.dim):
+                    self.assertEqual(M_ids.npa_matrix[i,j], M.npa_matrix[i,j])
+            
+            index = M.generate_moment_index()
+            index_ids = M_ids.generate_moment_index()
+            self.assertEqual(index_ids.keys, index.keys)
+            self.assertEqual(index_ids.zero_ids, index.zero_ids)
+            self.assertTrue(np.array_equal(index_ids.rows, index.rows))
+            self.assertTrue(np.array_equal(index_ids.cols, index.cols))
+            self.assertTrue(np.array_equal(index_ids.ptr, index.ptr))
+        
+        # Extensions of compact matrices stay compact.
+        M_ids = MomentMatrix(3, 2, 1, bool_short_meas=True, engine="word", \
+                             bool_compact_matrix=True)
+        M_ids.extend("1+AB")
+        self.assertTrue(isinstance(M_ids.npa_matrix, \
+                                   operator_words.MomentIdMatrix))
+        M = MomentMatrix(3, 2, "1+AB", bool_short_meas=True, engine="word")
+        self.assertTrue(np.array_equal(M_ids.npa_matrix.moment_ids(), \
+            M.generate_moment_index().class_ids()))
+
+
+    def test_tensor_moment_matrix(self):
+        '''
+        Moment matrices of parallel repetitions with a product structure are
+        the tensor powers of the moment matrix of a single round.
+        '''
+        alphabet = generate_measurement_operators(2, 2, False, 2, "word", \
+                                                  True)
+        self.assertEqual(alphabet.labels, \
+                         operator_words.OperatorAlphabet(2, 2, False, 2).labels)
+        A = alphabet.sympy_operators()[alphabet.codes["A^01_10"]]
+        B = alphabet.sympy_operators()[alphabet.codes["B^11_00"]]
+        self.assertEqual(alphabet.word_to_str(alphabet.word_from_sympy(A*B)),\
+                         "A^0_1*B^1_0 (x) A^1_0*B^1_0")
+
+        # A single round is the moment matrix of the word engine.
+        M = MomentMatrix(2, 2, 2, engine="word", bool_compact_matrix=True)
+        M_1 = MomentMatrix(2, 2, 2, engine="word", bool_tensor_reps=True)
+        self.assertEqual(len(M_1.npa_matrix.words), len(M.npa_matrix.words))
+
+        for orthogonal in [False, True]:
+            M = MomentMatrix(2, 2, 1, 2, engine="word", \
+                bool_orthogonal_meas=orthogonal, bool_tensor_reps=True)
+            mat = M.npa_matrix
+            self.assertEqual(M.dim, len(M.seq.round_seq)**2)
+            self.assertEqual(M.seq[0], alphabet.identity)
+            self.assertEqual(len(set(mat.words)), len(mat.words))
+
+            moment_ids = mat.moment_ids()
+            for i in range(M.dim):
+                for j in range(M.dim):
+                    word = operator_words.generate_moment_matrix_entry( \
+                        M.seq, i, j, True, orthogonal)
+                    self.assertEqual(mat[i,j], word)
+                    self.assertEqual(mat.words[moment_ids[i,j]], \
+                                     mat.entry_key(word))
+
+            # Terms of the repeated scenario are entries of the matrix.
+            index = M.generate_moment_index()
+            self.assertEqual(index.keys[index.term_id(A*B)], \
+                             mat.entry_key(alphabet.word_from_sympy(A*B)))
+            self.assertEqual(M.estimate_resources()["dim"] >= M.dim, True)
+
+        self.assertRaises(ValueError, MomentMatrix, 2, 2, 1, 2, \
+                          bool_tensor_reps=True)
+
 ###############################################################################
 ##  BELL_VIOLATION.PY UNIT TESTS
 ###############################################################################
 
 class TestBellViolationFunctions(unittest.TestCase):
     def setUp(self):
-        pass
+        
+        self.meas_ops_input_2_output_2 = generate_measurement_operators(2,2,True)
+        
+        
+    def test_bell_operator_matrix(self):
+        '''
+        Tests for bell_operator_matrix function in bell_violation.py
+        '''
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        
+        # The sequence is I, A0, A1, B0, B1 and A0*A0 = A0, B0*B0 = B0.
+        bell_mat = np.asarray([[ 0, -1,  0, -1,  0],
+                               [-1, -1,  0,  1,  1],
+                               [ 0,  0,  0,  1, -1],
+                               [-1,  1,  1, -1,  0],
+                               [ 0,  1, -1,  0,  0]])
+        
+        for engine in ["sympy", "word"]:
+            M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine=engine)
+            self.assertTrue(np.array_equal( \
+                bell_operator_matrix(ch_exp, M.npa_matrix), bell_mat))
+            
+            bell = BellViolation(M, ch_exp)
+            self.assertEqual(len(bell.bell_coeffs), 6)
+            self.assertTrue(np.array_equal(bell.bell_operator_matrix(), \
+                                           bell_mat))
+            
+            # The whole matrix is converted to MATLAB.
+            matlab_mat = npa_io.convert_python_matrix_to_matlab( \
+                bell.bell_operator_matrix())
+            self.assertEqual(matlab_mat.count(";"), 5)
+            self.assertEqual(len(matlab_mat.split(";")[0].split()), 6)
+        
+        # Terms that are not entries of the moment matrix are rejected.
+        self.assertRaises(ValueError, bell.parse_bell_exp, A0*A1*B0*B1)
+        
+        
+    def test_bell_objective_matrix(self):
+        '''
+        Tests for bell_objective_matrix function in bell_violation.py
+        '''
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        chsh_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1
+        
+        # Coefficients over the correlator basis (I, A0, A1) x (I, B0, B1).
+        ch_coeffs = np.asarray([[ 0, -1,  0],
+                                [-1,  1,  1],
+                                [ 0,  1, -1]])
+        chsh_coeffs = ch_coeffs.copy()
+        chsh_coeffs[0,:] = chsh_coeffs[:,0] = 0
+        
+        for engine in ["sympy", "word"]:
+            M = MomentMatrix(2, 2, "1+AB", bool_short_meas=True, engine=engine)
+            bell = BellViolation(M)
+            
+            obj = bell_objective_matrix([ch_exp, chsh_exp, 2 + A0], M)
+            self.assertEqual(obj.shape, (3, bell.index.num_classes))
+            self.assertEqual(obj[2, bell.index.identity_id], 2)
+            
+            bell.parse_bell_exp(ch_exp)
+            for class_id, coeff in bell.bell_coeffs.items():
+                self.assertEqual(obj[0, class_id], coeff)
+            
+            obj_dense = bell.bell_objective_matrix( \
+                np.asarray([ch_coeffs, chsh_coeffs]))
+            self.assertEqual(abs(obj_dense - obj[:2]).sum(), 0)
+            self.assertEqual(abs(bell.bell_objective_matrix(ch_coeffs) - \
+                                 obj[0]).sum(), 0)
+    
+
+###############################################################################
+##  NPA_SDP.PY UNIT TESTS
+###############################################################################
+
+class TestNPASDPFunctions(unittest.TestCase):
+    '''
+    Suite of tests for npa_sdp.py
+    '''
+    def setUp(self):
+        
+        self.meas_ops_input_2_output_2 = generate_measurement_operators(2,2,True)
+        self.meas_ops_input_3_output_2 = generate_measurement_operators(3,2,True)
+        
+        
+    def test_solve_bell_violation(self):
+        '''
+        Tests for solve_bell_violation function in npa_sdp.py
+        '''
+        # The maximal quantum violation of the CH inequality is 
+        # (sqrt(2) - 1) / 2, which is attained at level 1.
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word")
+        
+        result = npa_sdp.solve_bell_violation(M, ch_exp, "admm")
+        self.assertEqual(result["status"], "optimal")
+        self.assertAlmostEqual(result["bound"], (math.sqrt(2) - 1) / 2, 4)
+        
+        # The I3322 inequality is bounded by 0.375 at level 1.
+        A0, A1, A2, B0, B1, B2 = self.meas_ops_input_3_output_2
+        i3322_exp = A0*B0 + A0*B1 + A0*B2 + A1*B0 + A1*B1 - A1*B2 + \
+                    A2*B0 - A2*B1 - A0 - 2*B0 - B1
+        M = MomentMatrix(3, 2, 1, bool_short_meas=True)
+        
+        result = npa_sdp.solve_bell_violation(M, i3322_exp, "admm")
+        self.assertAlmostEqual(result["bound"], 0.375, 4)
+
+        # An iterate that did not converge gives no bound.
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            result = npa_sdp.solve_bell_violation(M, i3322_exp, "admm", \
+                                                  max_iters=5)
+        self.assertEqual(result["status"], "max_iters")
+        self.assertEqual(result["bound"], None)
+        self.assertTrue(result["objective"] is not None)
+        self.assertEqual(len(caught), 1)
+
+
+    @unittest.skipIf(npa_sdp.cvxpy is None, "cvxpy is not installed")
+    def test_solve_bell_violation_cvxpy(self):
+        '''
+        Tests for the cvxpy solvers of npa_sdp.py
+        '''
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word")
+
+        for symmetry in [None, True]:
+            result = npa_sdp.solve_bell_violation(M, ch_exp, "cvxpy", \
+                                                  symmetry=symmetry)
+            self.assertEqual(result["solver"], "cvxpy")
+            self.assertEqual(result["status"], "optimal")
+            self.assertAlmostEqual(result["bound"], (math.sqrt(2) - 1) / 2, 4)
+
+        # An infeasible SDP, where M(1,1) = -1, gives no bound and no 
+        # variables.
+        F = M.generate_affine_moment_matrix(ch_exp)
+        F.const_vals = -F.const_vals
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            result = npa_sdp.solve_bell_violation(F, solver="cvxpy")
+        self.assertNotEqual(result["status"], "optimal")
+        self.assertEqual(result["bound"], None)
+        self.assertEqual(result["x"], None)
+
+
+###############################################################################
+##  NPA_CACHE.PY UNIT TESTS
+###############################################################################
+
+class TestNPACacheFunctions(unittest.TestCase):
+    '''
+    Suite of tests for npa_cache.py
+    '''
+    def setUp(self):
+        
+        self.cache_dir = tempfile.mkdtemp()
+        
+        
+    def tearDown(self):
+        
+        shutil.rmtree(self.cache_dir)
+        
+        
+    def test_moment_matrix_cache(self):
+        '''
+        Moment matrices loaded from the cache agree with the built matrices.
+        '''
+        cache = npa_cache.MomentMatrixCache(self.cache_dir)
+        
+        M = MomentMatrix(3, 2, "1+AB", bool_short_meas=True, \
+                         bool_orthogonal_meas=True, engine="word", cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        
+        M_cached = MomentMatrix(3, 2, "1+AB", bool_short_meas=True, \
+                         bool_orthogonal_meas=True, engine="word", cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(list(M_cached.seq), list(M.seq))
+        self.assertEqual(M_cached.npa_matrix.upper, M.npa_matrix.upper)
+        self.assertEqual(M_cached.npa_matrix.orthogonal, True)
+        
+        M_compact = MomentMatrix(3, 2, "1+AB", bool_short_meas=True, \
+                                 bool_orthogonal_meas=True, engine="word", \
+                                 cache=cache, bool_compact_matrix=True)
+        self.assertEqual(cache.hits, 2)
+        self.assertTrue(np.array_equal(M_compact.npa_matrix.ids, \
+            MomentMatrix(3, 2, "1+AB", bool_short_meas=True, \
+                         bool_orthogonal_meas=True, engine="word", \
+                         bool_compact_matrix=True).npa_matrix.ids))
+        
+        # Different simplification flags are different keys.
+        self.assertNotEqual(M.cache_key(), MomentMatrix(3, 2, "1+AB", \
+            bool_short_meas=True, engine="word").cache_key())
+        
+        
+    def test_evict(self):
+        '''
+        The least recently used matrices are evicted above the size bound.
+        '''
+        cache = npa_cache.MomentMatrixCache(self.cache_dir, max_bytes=0)
+        M_1 = MomentMatrix(2, 2, 1, engine="word", cache=cache)
+        M_2 = MomentMatrix(2, 2, 2, engine="word", cache=cache)
+        
+        self.assertEqual(os.listdir(self.cache_dir), \
+                         [os.path.basename(cache.path(M_2.cache_key()))])
+
+        
+    def test_moment_ids_mmap(self):
+        '''
+        Compact moment matrices saved in a directory are memory-mapped by 
+        later builds of the same matrix.
+        '''
+        path = os.path.join(self.cache_dir, "mmap")
+        M = MomentMatrix(3, 2, 2, bool_short_meas=True, engine="word", \
+                         bool_compact_matrix=True, mmap_path=path)
+        self.assertTrue(npa_cache.is_saved_moment_ids(path, M.npa_matrix))
+        self.assertEqual(sorted(os.listdir(path)), ["ids.npy", "words.npz"])
+        
+        M_mmap = MomentMatrix(3, 2, 2, bool_short_meas=True, engine="word", \
+                              bool_compact_matrix=True, mmap_path=path)
+        self.assertTrue(isinstance(M_mmap.npa_matrix.ids, np.memmap))
+        self.assertFalse(M_mmap.npa_matrix.ids.flags.writeable)
+        self.assertEqual(list(M_mmap.seq), list(M.seq))
+        self.assertEqual(M_mmap.npa_matrix.words, M.npa_matrix.words)
+        self.assertTrue(np.array_equal(M_mmap.npa_matrix.ids, \
+            MomentMatrix(3, 2, 2, bool_short_meas=True, engine="word", \
+                         bool_compact_matrix=True).npa_matrix.ids))
+        
+        # A different moment matrix is not loaded from the directory.
+        self.assertRaises(ValueError, MomentMatrix, 3, 2, 1, \
+            bool_short_meas=True, engine="word", bool_compact_matrix=True, \
+            mmap_path=path)
+        
+        # Extending the matrix saves the extension in its place.
+        M_mmap.extend("2+AB")
+        self.assertEqual(npa_cache.load_moment_ids(path, \
+            M_mmap.cache_key(), M_mmap.meas_ops)["npa_matrix"].words, \
+            M_mmap.npa_matrix.words)
+    
+
+###############################################################################
+##  NPA_BATCH.PY UNIT TESTS
+###############################################################################
+
+class TestNPABatchFunctions(unittest.TestCase):
+    '''
+    Suite of tests for npa_batch.py
+    '''
+    def setUp(self):
+        
+        self.output_dir = tempfile.mkdtemp()
+        
+        
+    def tearDown(self):
+        
+        shutil.rmtree(self.output_dir)
+        
+        
+    def test_main(self):
+        '''
+        Tests for the job file entry point of npa_batch.py
+        '''
+        ch_str = "A^0_0*B^0_0 + A^0_0*B^1_0 + A^1_0*B^0_0 - A^1_0*B^1_0 " \
+                 "- A^0_0 - B^0_0"
+        job_spec = {"output_dir": self.output_dir,
+                    "workers": 2,
+                    "cache": os.path.join(self.output_dir, "cache"),
+                    "defaults": {"short_meas": True, "solver": "admm"},
+                    "jobs": [{"name": "ch", "inputs": 2, "outputs": 2, 
+                              "bell_exp": ch_str,
+                              "produce": ["bound", "matlab", "sdpa", 
+                                          "latex"]},
+                             {"name": "ch_again", "inputs": 2, "outputs": 2,
+                              "level": 1, "bell_exp": ch_str},
+                             {"name": "ch_symmetric", "inputs": 2, 
+                              "outputs": 2, "bell_exp": ch_str, 
+                              "symmetry": True},
+                             {"name": "unknown_op", "inputs": 2, 
+                              "outputs": 2, "bell_exp": "A^2_0*B^0_0"}]}
+        job_file_name = os.path.join(self.output_dir, "jobs.json")
+        with open(job_file_name, "w") as job_file:
+            json.dump(job_spec, job_file)
+        
+        # The result lines of the jobs are not part of the test output.
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            self.assertEqual(npa_batch.main([job_file_name]), 1)
+        finally:
+            sys.stdout = stdout
+        
+        with open(os.path.join(self.output_dir, "results.json")) as res_file:
+            results = json.load(res_file)
+        self.assertEqual([res["name"] for res in results], \
+                         ["ch", "ch_again", "ch_symmetric", "unknown_op"])
+        for res in results[:3]:
+            self.assertAlmostEqual(res["bound"], (math.sqrt(2) - 1) / 2, 4)
+        self.assertTrue("block_sizes" not in results[1])
+        self.assertEqual(sorted(results[2]["block_sizes"]), [2, 3])
+        self.assertTrue("error" in results[3])
+        
+        for ext in [".m", ".dat-s", ".tex"]:
+            self.assertTrue(os.path.isfile( \
+                os.path.join(self.output_dir, "ch" + ext)))
+        self.assertEqual(len(os.listdir(os.path.join(self.output_dir, \
+                                                     "cache"))), 1)
+        
+        # Jobs must give the scenario and known outputs.
+        self.assertRaises(ValueError, npa_batch.expand_jobs, \
+                          {"jobs": [{"inputs": 2}]})
+        self.assertRaises(ValueError, npa_batch.expand_jobs, \
+            {"jobs": [{"inputs": 2, "outputs": 2, "produce": ["pdf"]}]})
     
 
 ###############################################################################
@@ -213,8 +1054,343 @@ class TestBellViolationFunctions(unittest.TestCase):
 
 class TestNPAIOFunctions(unittest.TestCase):
     def setUp(self):
-        pass
+        
+        self.meas_ops_input_2_output_2 = generate_measurement_operators(2,2,True)
+        
+        
+    def test_generate_matlab_script(self):
+        '''
+        Tests for generate_matlab_script function in npa_io.py
+        '''
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True)
+        
+        # The sequence is I, A0, A1, B0, B1 and the diagonal entry of each 
+        # projector equals its entry in the first row.
+        script = npa_io.generate_matlab_script(M, A0*B0 - A0)
+        self.assertTrue("dim = 5;" in script)
+        self.assertTrue("B = sparse([1 2], [2 4], [-1.0 1.0], dim, dim);" \
+                        in script)
+        self.assertEqual(script.count(" == M("), 4)
+        self.assertTrue("M(1, 2) == M(2, 2);" in script)
+        self.assertTrue("maximize trace(B * M)" in script)
+        
+        # Without a Bell expression, the script is a feasibility problem.
+        script = npa_io.generate_matlab_script(M)
+        self.assertFalse("B = " in script)
+        self.assertFalse("maximize" in script)
+        
+        # Each equivalence class of size k is tied by k-1 constraints.
+        M = MomentMatrix(3, 2, "1+AB", bool_short_meas=True, \
+                         bool_orthogonal_meas=True, engine="word")
+        index = M.generate_moment_index()
+        num_chain = sum([np.sum(index.positions(k)[0] <= \
+                                index.positions(k)[1]) - 1 \
+                         for k in range(index.num_classes) \
+                         if k not in index.zero_ids])
+        out_file = StringIO.StringIO()
+        npa_io.write_matlab_script(out_file, M)
+        self.assertEqual(out_file.getvalue().count(" == M("), num_chain)
+        
+        script = npa_io.generate_matlab_script(M, compact=True)
+        self.assertEqual(script.count("M(idx) == M(rep);"), 1)
+        self.assertEqual(script.count(" == M("), 1)
+
+        
+    def test_write_sdpa(self):
+        '''
+        Tests for write_sdpa function in npa_io.py
+        '''
+        A0, A1, B0, B1 = self.meas_ops_input_2_output_2
+        ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        M = MomentMatrix(2, 2, "1+AB", bool_short_meas=True, engine="word")
+        F = M.generate_affine_moment_matrix(ch_exp)
+        
+        out_file = StringIO.StringIO()
+        npa_io.write_sdpa(out_file, M, ch_exp)
+        lines = out_file.getvalue().splitlines()
+        
+        # Read the SDP back: sum_k x_k F_k - F_0 is the moment matrix M(x).
+        num_vars = int(lines[1].split()[0])
+        dim = int(lines[3].split()[0])
+        c = [float(x) for x in lines[4].split()]
+        self.assertEqual((num_vars, dim), (F.num_vars, F.dim))
+        
+        x = np.arange(1, num_vars + 1, dtype=np.float64)
+        mat = np.zeros((dim, dim))
+        for line in lines[5:]:
+            k, block, i, j, val = line.split()
+            val = float(val) * x[int(k) - 1] if int(k) > 0 else -float(val)
+            mat[int(i) - 1, int(j) - 1] = val
+            mat[int(j) - 1, int(i) - 1] = val
+        self.assertTrue(np.array_equal(mat, F.evaluate(x)))
+        self.assertEqual(-np.dot(c, x), F.evaluate_objective(x))
     
+###############################################################################
+##  NPA_SYMMETRY.PY UNIT TESTS
+###############################################################################
+
+class TestNPASymmetryFunctions(unittest.TestCase):
+    '''
+    Suite of tests for npa_symmetry.py
+    '''
+    def setUp(self):
+        
+        A0, A1, B0, B1 = generate_measurement_operators(2,2,True)
+        self.ch_exp = A0*B0 + A0*B1 + A1*B0 - A1*B1 - A0 - B0
+        
+        # CHSH with all projectors, i.e. the sum of the probabilities of
+        # a + b = xy (mod 2).
+        A = generate_measurement_operators(2,2,False)
+        A, B = A[:4], A[4:]
+        self.chsh_exp = sum([A[2*x+a] * B[2*y+b] for x in range(2) \
+            for y in range(2) for a in range(2) for b in range(2) \
+            if (a + b) % 2 == x * y])
+        
+        
+    def test_scenario_symmetries(self):
+        '''
+        The relabelings of a scenario are permutations of the alphabet.
+        '''
+        alphabet = operator_words.OperatorAlphabet(2, 2)
+        group = npa_symmetry.generate_group( \
+            npa_symmetry.scenario_symmetries(alphabet))
+        
+        # Swapping the parties, and relabeling the 2 inputs and the 2 
+        # outputs of each input of each party.
+        self.assertEqual(len(group), 2 * (2 * 2**2)**2)
+        self.assertEqual(len(npa_symmetry.generating_set(group)), 3)
+        
+        swap = npa_symmetry.relabeling(alphabet, swap_parties=True)
+        self.assertEqual(npa_symmetry.compose(swap, swap), tuple(range(8)))
+        self.assertEqual(npa_symmetry.map_word((0, 6), swap, alphabet), \
+                         (2, 4))
+        
+        # The output left out of short measurements cannot be relabeled.
+        alphabet = operator_words.OperatorAlphabet(2, 2, True)
+        self.assertRaises(ValueError, npa_symmetry.relabeling, alphabet, \
+                          outputs={("A", "0"): {"0": "1", "1": "0"}})
+        self.assertEqual(len(npa_symmetry.generate_group( \
+            npa_symmetry.scenario_symmetries(alphabet))), 2 * 2**2)
+        
+        
+    def test_find_invariance_group(self):
+        '''
+        The invariance group of a Bell expression, and of the sequence.
+        '''
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word")
+        group = npa_symmetry.find_invariance_group(M, \
+            M.generate_affine_moment_matrix(self.ch_exp))
+        self.assertEqual(len(group), 2)
+        
+        for engine in ["word", "sympy"]:
+            M = MomentMatrix(2, 2, "1+AB", engine=engine, \
+                             bool_orthogonal_meas=True)
+            group = npa_symmetry.find_invariance_group(M, \
+                M.generate_affine_moment_matrix(self.chsh_exp))
+            self.assertEqual(len(group), 16)
+        
+        # The level 1+A is not closed under swapping the parties.
+        M = MomentMatrix(2, 2, "1+A", bool_short_meas=True, engine="word")
+        swap = npa_symmetry.relabeling(M.meas_ops, swap_parties=True)
+        self.assertRaises(ValueError, npa_symmetry.generate_symmetric_sdp, \
+                          M, self.ch_exp, [swap])
+        
+        # Swapping the inputs of Alice does not leave CH invariant.
+        M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word")
+        flip = npa_symmetry.relabeling(M.meas_ops, \
+                                       inputs={"A": {"0": "1", "1": "0"}})
+        self.assertRaises(ValueError, npa_symmetry.generate_symmetric_sdp, \
+                          M, self.ch_exp, [flip])
+        
+        
+    def test_symmetric_sdp(self):
+        '''
+        The blocks hold the invariant moment matrices, and the reduced SDP 
+        has the bound of the full SDP.
+        '''
+        M = MomentMatrix(2, 2, 2, engine="word", bool_orthogonal_meas=True)
+        F = M.generate_affine_moment_matrix(self.chsh_exp)
+        sdp = npa_symmetry.generate_symmetric_sdp(M, affine_mat=F)
+        self.assertEqual(len(sdp.group), 16)
+        self.assertTrue(sdp.num_vars < F.num_vars)
+        self.assertEqual(sum([size * mult for size, mult in \
+            zip(sdp.block_sizes(), sdp.block_mults)]), M.dim)
+        self.assertTrue(max(sdp.block_sizes()) < M.dim)
+        
+        # The eigenvalues of M(y) are those of the blocks, repeated d_i times.
+        y = np.random.RandomState(1).randn(sdp.num_vars)
+        eig_vals = np.concatenate([np.repeat(np.linalg.eigvalsh(B), mult) \
+            for B, mult in zip(sdp.evaluate_blocks(y), sdp.block_mults)])
+        self.assertTrue(np.allclose(np.sort(eig_vals), \
+                                    np.linalg.eigvalsh(sdp.evaluate(y))))
+        
+        const, maps = sdp.block_maps()
+        self.assertTrue(np.allclose(const + y.dot(maps), np.concatenate( \
+            [B.ravel() for B in sdp.evaluate_blocks(y)])))
+        self.assertEqual(sdp.block_maps(max_size=0), None)
+        self.assertAlmostEqual(sdp.evaluate_objective(y), \
+                               F.evaluate_objective(sdp.lift(y)))
+        
+        # The iterates of both solvers are the same, so they stop at the 
+        # same objective without a bound.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            full = npa_sdp.solve_bell_violation(F, solver="admm", \
+                                                max_iters=500)
+            reduced = npa_sdp.solve_bell_violation(sdp, solver="admm", \
+                                                   max_iters=500)
+        self.assertAlmostEqual(full["objective"], reduced["objective"], 6)
+        
+        M = MomentMatrix(2, 2, "1+AB", bool_short_meas=True)
+        result = npa_sdp.solve_bell_violation(M, self.ch_exp, "admm", \
+                                              symmetry=True)
+        self.assertEqual(result["status"], "optimal")
+        self.assertAlmostEqual(result["bound"], (math.sqrt(2) - 1) / 2, 4)
+        self.assertEqual(len(result["x"]), \
+                         M.generate_affine_moment_matrix().num_vars)
+        
+        
+    def test_write_sdpa_blocks(self):
+        '''
+        The reduced SDP is written with one SDPA block per block.
+        '''
+        M = MomentMatrix(2, 2, "1+AB", engine="word", \
+                         bool_orthogonal_meas=True)
+        sdp = npa_symmetry.generate_symmetric_sdp(M, self.chsh_exp)
+        
+        out_file = StringIO.StringIO()
+        npa_io.write_sdpa(out_file, sdp)
+        lines = out_file.getvalue().splitlines()
+        
+        sizes = [int(size) for size in lines[3].split()[:-2]]
+        self.assertEqual(sizes, sdp.block_sizes())
+        c = np.asarray([float(x) for x in lines[4].split()])
+        
+        y = np.arange(1, sdp.num_vars + 1, dtype=np.float64)
+        blocks = [np.zeros((size, size)) for size in sizes]
+        for line in lines[5:]:
+            k, block, i, j, val = line.split()
+            val = float(val) * y[int(k) - 1] if int(k) > 0 else -float(val)
+            mat = blocks[int(block) - 1]
+            mat[int(i) - 1, int(j) - 1] += val
+            if i != j:
+                mat[int(j) - 1, int(i) - 1] += val
+        for B, B_read in zip(sdp.evaluate_blocks(y), blocks):
+            self.assertTrue(np.allclose(B, B_read))
+        self.assertAlmostEqual(-np.dot(c, y), sdp.evaluate_objective(y) - \
+                               sdp.obj_offset)
+    
+
+###############################################################################
+##  NPA_PROFILE.PY UNIT TESTS
+###############################################################################
+
+class TestNPAProfileFunctions(unittest.TestCase):
+    '''
+    Suite of tests for npa_profile.py
+    '''
+    def test_profiler(self):
+        '''
+        Tests for the phases and counters recorded by npa_profile.Profiler
+        '''
+        cache_dir = tempfile.mkdtemp()
+        try:
+            phases = []
+            prof = npa_profile.Profiler(callback=lambda name, metrics: \
+                                        phases.append(name))
+            M = MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word", \
+                cache=npa_cache.MomentMatrixCache(cache_dir), \
+                bool_compact_matrix=True, profiler=prof)
+            M.extend("1+AB")
+            MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word", \
+                cache=npa_cache.MomentMatrixCache(cache_dir), profiler=prof)
+        finally:
+            shutil.rmtree(cache_dir)
+        
+        self.assertEqual(phases[:5], ["measurement_operators", "cache_load", \
+                                      "sequence", "moment_matrix", \
+                                      "cache_store"])
+        report = prof.report()
+        self.assertEqual(report["phases"]["sequence"]["calls"], 2)
+        self.assertTrue(report["phases"]["moment_matrix"]["wall"] >= 0)
+        
+        # The 5 x 5 matrix of level 1 is reused in the 9 x 9 matrix of 1+AB.
+        self.assertEqual(report["counters"]["simplify.calls"], 15 + 30)
+        self.assertEqual(report["counters"]["entries.reused"], 15)
+        self.assertEqual(report["hit_rates"]["cache"], 1.0 / 3)
+        
+        # The sympy simplifier counts its own calls: 4 for the operators of
+        # the sequence and 15 for the upper triangle.
+        prof_sympy = npa_profile.Profiler()
+        MomentMatrix(2, 2, 1, bool_short_meas=True, profiler=prof_sympy)
+        self.assertEqual(prof_sympy.report()["counters"]["simplify.calls"], \
+                         4 + 15)
+        
+        # A second build finds every entry in the simplifier cache.
+        prof_sympy.reset()
+        MomentMatrix(2, 2, 1, bool_short_meas=True, profiler=prof_sympy)
+        self.assertEqual(prof_sympy.report()["hit_rates"]["simplify_cache"], \
+                         1.0)
+        
+        # Nothing is recorded without an active profiler.
+        self.assertEqual(npa_profile.active(), None)
+        MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word")
+        self.assertEqual(prof.report(), report)
+        
+        # The peak memory of a phase is traced, or read from the process.
+        with npa_profile.Profiler(trace_memory=True) as prof_memory:
+            MomentMatrix(2, 2, 1, bool_short_meas=True, engine="word")
+        phase = prof_memory.report()["phases"]["moment_matrix"]
+        key = "peak_rss_kb" if npa_profile.tracemalloc is None \
+              else "peak_alloc_kb"
+        self.assertTrue(phase[key] > 0)
+    
+
+###############################################################################
+##  BENCHMARKING.PY UNIT TESTS
+###############################################################################
+
+class TestBenchmarkingFunctions(unittest.TestCase):
+    '''
+    Suite of tests for benchmarking.py
+    '''
+    def test_run_benchmarks(self):
+        '''
+        Tests for the scenario runs and baseline comparison of benchmarking.py
+        '''
+        scenarios = [sc for sc in benchmarking.generate_scenarios() \
+                     if sc["name"] == "input_2_output_2_level_1_AB"]
+        self.assertEqual(len(scenarios), 1)
+        
+        results = benchmarking.run_benchmarks(scenarios, repeat=2)
+        self.assertEqual(results[0]["dim"], 9)
+        self.assertEqual(sorted(results[0]["phases"].keys()), \
+                         sorted(benchmarking.PHASES))
+        self.assertTrue(results[0]["peak_rss_kb"] > 0)
+        
+        # Results are no regression of themselves, but of faster results.
+        baseline = {"results": json.loads(json.dumps(results))}
+        self.assertEqual(benchmarking.compare_results(results, baseline), [])
+        baseline["results"][0]["phases"]["matrix"] = \
+            results[0]["phases"]["matrix"] - 1.0
+        regressions = benchmarking.compare_results(results, baseline)
+        self.assertEqual([reg[:2] for reg in regressions], \
+                         [("input_2_output_2_level_1_AB", "matrix")])
+        
+        # The engines behind the compact and tensor rows of BUILD_COSTS.
+        results = benchmarking.run_benchmarks(scenarios, "compact")
+        self.assertEqual(results[0]["dim"], 9)
+        scenarios = [sc for sc in benchmarking.generate_tensor_scenarios() \
+                     if sc["name"] == "input_2_output_2_level_1_AB_reps_2"]
+        results = benchmarking.run_benchmarks(scenarios, "tensor")
+        self.assertEqual(results[0]["dim"], 81)
+        self.assertEqual(benchmarking.fit_build_costs(results), None)
+        costs = benchmarking.fit_build_costs(results, min_dim=81)
+        self.assertEqual(sorted(costs.keys()), ["build", "index", "memory"])
+        self.assertTrue(costs["build"] > 0)
+    
+
 ################################################################################
 ## MAIN UNIT TEST DRIVER
 ################################################################################
@@ -224,6 +1400,37 @@ if __name__ == '__main__':
     moment_matrix_suite = unittest.TestLoader().loadTestsFromTestCase(TestMomentMatrixFunctions)
     unittest.TextTestRunner(verbosity=2).run(moment_matrix_suite)
 
+    # run unit tests for operator_words.py
+    operator_words_suite = unittest.TestLoader().loadTestsFromTestCase(TestOperatorWordsFunctions)
+    unittest.TextTestRunner(verbosity=2).run(operator_words_suite)
+
+    # run unit tests for npa_sdp.py
+    npa_sdp_suite = unittest.TestLoader().loadTestsFromTestCase(TestNPASDPFunctions)
+    unittest.TextTestRunner(verbosity=2).run(npa_sdp_suite)
+
+    # run unit tests for npa_cache.py
+    npa_cache_suite = unittest.TestLoader().loadTestsFromTestCase(TestNPACacheFunctions)
+    unittest.TextTestRunner(verbosity=2).run(npa_cache_suite)
+
     # run unit tests for bell_violation.py
     bell_violation_suite = unittest.TestLoader().loadTestsFromTestCase(TestBellViolationFunctions)
-    unittest.TextTestRunner(verbosity=2).run(bell_violation_suite)
\ No newline at end of file
+    unittest.TextTestRunner(verbosity=2).run(bell_violation_suite)
+    # run unit tests for npa_io.py
+    npa_io_suite = unittest.TestLoader().loadTestsFromTestCase(TestNPAIOFunctions)
+    unittest.TextTestRunner(verbosity=2).run(npa_io_suite)
+
+    # run unit tests for npa_batch.py
+    npa_batch_suite = unittest.TestLoader().loadTestsFromTestCase(TestNPABatchFunctions)
+    unittest.TextTestRunner(verbosity=2).run(npa_batch_suite)
+
+    # run unit tests for benchmarking.py
+    benchmarking_suite = unittest.TestLoader().loadTestsFromTestCase(TestBenchmarkingFunctions)
+    unittest.TextTestRunner(verbosity=2).run(benchmarking_suite)
+
+    # run unit tests for npa_symmetry.py
+    npa_symmetry_suite = unittest.TestLoader().loadTestsFromTestCase(TestNPASymmetryFunctions)
+    unittest.TextTestRunner(verbosity=2).run(npa_symmetry_suite)
+
+    # run unit tests for npa_profile.py
+    npa_profile_suite = unittest.TestLoader().loadTestsFromTestCase(TestNPAProfileFunctions)
+    unittest.TextTestRunner(verbosity=2).run(npa_profile_suite)
@@ -13,8 +13,13 @@
 '''
 
 import os
+import math
 import shelve
 import itertools
+import collections
+import multiprocessing
+
+import npa_profile
 
 
 def check_equal(iterator):
@@ -29,6 +34,177 @@ def chunks(l, n):
     return [l[i:i + n] for i in range(0, len(l), n)]
     
     
+def map_row_blocks(func, n, workers, initializer=None, initargs=()):
+    '''Splits the rows 0, ..., n-1 into blocks and maps func over the blocks
+    in a pool of (workers) processes. The results of the blocks are merged 
+    into one list in row order.'''
+    return list(imap_row_blocks(func, n, workers, initializer, initargs))
+    
+    
+def imap_row_blocks(func, n, workers, initializer=None, initargs=()):
+    '''Generator version of map_row_blocks, which yields the results of the
+    rows in row order as the blocks are completed.'''
+    # Several blocks per worker, so that blocks of cheap rows and blocks of 
+    # expensive rows even out across the pool.
+    block_size = max(1, int(math.ceil(n / (4.0 * workers))))
+    blocks = chunks(range(n), block_size)
+    
+    pool = multiprocessing.Pool(workers, initializer, initargs)
+    try:
+        for block in pool.imap(func, blocks, 1):
+            for row in block:
+                yield row
+    finally:
+        pool.terminate()
+        pool.join()
+    
+    
+def imap_upper_rows(seq, entry_func, args=(), workers=1, reuse=None, \
+                    counter=None):
+    '''Generator of the rows of the upper triangle of the moment matrix of 
+    a sequence, where row i holds the entries of seq[i] and seq[j] for j >= i.
+    entry_func(u, vs, *args) returns the list of the entries of the word u 
+    and each word of vs, so that the work per row can be shared. The rows 
+    are computed in blocks in a pool of (workers) processes if workers > 1,
+    see imap_row_blocks. If (reuse) is (old_seq, mat), the entries of two 
+    words of old_seq are copied from mat, and the entries that are computed
+    are added to the profiler counter (counter), if it is given.'''
+    if workers > 1:
+        for row in imap_row_blocks(_upper_rows, len(seq), workers, \
+                _init_upper_rows, (list(seq), entry_func, args, reuse, \
+                                   counter)):
+            yield row
+        return
+    
+    _init_upper_rows(seq, entry_func, args, reuse, counter)
+    for i in range(len(seq)):
+        yield _upper_rows([i])[0]
+
+
+# State of the rows computed by _upper_rows, which is set once per worker 
+# process by _init_upper_rows.
+_upper_rows_state = {}
+
+
+def _init_upper_rows(seq, entry_func, args, reuse, counter):
+    '''Sets the sequence and entry function of the upper rows, and the 
+    earlier moment matrix (reuse) whose entries are copied.'''
+    _upper_rows_state["seq"] = seq
+    _upper_rows_state["entry"] = entry_func
+    _upper_rows_state["args"] = args
+    _upper_rows_state["reuse"] = index_reused_entries(reuse)
+    _upper_rows_state["counter"] = counter
+
+
+def _upper_rows(rows):
+    '''Computes the rows of the upper triangle of the moment matrix.'''
+    seq = _upper_rows_state["seq"]
+    entry_func = _upper_rows_state["entry"]
+    args = _upper_rows_state["args"]
+    old_index, old_mat = _upper_rows_state["reuse"]
+    
+    upper = []
+    num_computed = 0
+    for i in rows:
+        u = seq[i]
+        old_i = old_index.get(u)
+        if old_i is None:
+            row = entry_func(u, seq[i:], *args)
+            num_computed += len(row)
+            upper.append(row)
+            continue
+        
+        # Only the entries of words that are not in the old sequence are new.
+        old_js = [old_index.get(v) for v in seq[i:]]
+        new_vs = [v for v, old_j in zip(seq[i:], old_js) if old_j is None]
+        new_entries = iter(entry_func(u, new_vs, *args))
+        num_computed += len(new_vs)
+        upper.append([next(new_entries) if old_j is None else \
+                      old_mat[old_i, old_j] for old_j in old_js])
+    
+    # The entries are counted once per block of rows.
+    counter = _upper_rows_state["counter"]
+    if counter is not None and num_computed > 0:
+        npa_profile.count(counter, num_computed)
+    return upper
+
+
+def index_reused_entries(reuse):
+    '''Given (old_seq, mat), or None, returns the position of every word of
+    old_seq in mat as a dictionary, together with mat. The entry of two words
+    of old_seq can then be copied from mat instead of being recomputed.'''
+    if reuse is None:
+        return {}, None
+    old_seq, mat = reuse
+    return dict((word, i) for i, word in enumerate(old_seq)), mat
+    
+    
+class LRUCache(object):
+    """A dictionary of at most max_size items, which evicts the least 
+    recently used item when it is full. A max_size of 0 disables the cache.
+
+    Attributes:
+        max_size: maximal number of items.
+        hits: number of lookups that found their key.
+        misses: number of lookups that did not.
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def get(self, key, default=None):
+        '''The item of a key, marked as recently used, or (default).'''
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.items[key] = value
+        self.hits += 1
+        return value
+
+
+    def put(self, key, value):
+        '''Adds an item, evicting the least recently used item if full.'''
+        if self.max_size <= 0:
+            return
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+
+    def resize(self, max_size):
+        '''Changes max_size, evicting the least recently used items.'''
+        self.max_size = max_size
+        while len(self.items) > max(max_size, 0):
+            self.items.popitem(last=False)
+
+
+    def clear(self):
+        '''Removes all items and resets the statistics.'''
+        self.items.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+    def stats(self):
+        '''The size, hits, misses and hit rate of the cache.'''
+        lookups = self.hits + self.misses
+        return {"size": len(self.items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups else None}
+    
+    
 def clear():
     '''Clears the shell of the spyder application. Use either clear() or cls()
     '''
@@ -58,27 +234,26 @@ def list_2_str(_list):
     return ' '.join(map(str, _list))
 
 
-def load_workspace():
-    ''' Loads the variables in Python workspaces (similar to MATLAB)'''
+def load_workspace(namespace, filename='shelve.out'):
+    ''' Loads the variables in Python workspaces (similar to MATLAB) into the
+    dictionary (namespace), e.g. globals().'''
     my_shelf = shelve.open(filename)
     for key in my_shelf:
-        globals()[key]=my_shelf[key]
+        namespace[key]=my_shelf[key]
     my_shelf.close()
     
     
-def save_workspace():
-    ''' Saves the variables in Python workspace (similar to MATLAB)'''
-    filename='shelve.out'
+def save_workspace(namespace, filename='shelve.out'):
+    ''' Saves the variables in Python workspace (similar to MATLAB) held in 
+    the dictionary (namespace), e.g. globals().'''
     my_shelf = shelve.open(filename,'n') # 'n' for new
 
-    for key in dir():
+    for key in namespace:
         try:
-            my_shelf[key] = globals()[key]
-        except TypeError:
+            my_shelf[key] = namespace[key]
+        except Exception:
             #
             # __builtins__, my_shelf, and imported modules can not be shelved.
             #
             print('ERROR shelving: {0}'.format(key))
     my_shelf.close()
-
-
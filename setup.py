@@ -17,6 +17,7 @@ setup(
     author='Vincent Russo',
     author_email='vincentrusso1@gmail.com',
     packages=['npa_nonlocal'],
+    scripts=['npa_nonlocal/npa_batch.py'],
     url='http://vprusso.github.io/',
     keywords=[
         'sdp',
@@ -39,6 +40,10 @@ setup(
     ],
     install_requires=[
         "sympy >= 0.7.2",
-        "numpy"
+        "numpy",
+        "scipy"
     ],
+    extras_require={
+        "cvxpy": ["cvxpy >= 1.1"]
+    },
 )
\ No newline at end of file